@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark de la détection de patterns IA (batch de fin de mois)
+
+Compare le pipeline colonnaire (_detect_intelligent_patterns) à l'implémentation
+groupe par groupe d'origine (PerGroupReference, copie inchangée) sur des anomalies
+synthétiques, et vérifie que les deux produisent les mêmes patterns (champs de la
+référence; price_trend n'existe que dans le pipeline colonnaire):
+
+    python benchmark_ai_patterns.py --invoices 200 --lines 40 --products 300 --repeat 5
+
+--with-history mesure le chemin de production (statistiques glissantes du batch passées
+en historique). Aucun accès Firestore: seules les fonctions de détection sont mesurées.
+"""
+
+import time
+import random
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from modules.ai_anomaly_detector import AIAnomalyDetector
+from modules.price_stats_store import stats_key
+
+
+# ===== IMPLÉMENTATION DE RÉFÉRENCE (groupe par groupe) =====
+
+class PerGroupReference:
+    """
+    Détection groupe par groupe d'origine (dictionnaires Python), copiée sans modification
+    d'AIAnomalyDetector avant le pipeline colonnaire: référence du benchmark
+    """
+
+    def __init__(self, pattern_min_occurrences: int = 2):
+        self.pattern_min_occurrences = pattern_min_occurrences
+
+    def _detect_intelligent_patterns(self, anomalies: List[Dict], history: Dict = None) -> List[Dict]:
+        """
+        🧠 DÉTECTION INTELLIGENTE DES PATTERNS
+        Identifie les produits avec des anomalies récurrentes qui pourraient indiquer un changement de prix
+        
+        history: statistiques glissantes {(fournisseur, produit normalisé): état} incluant le
+        batch; les occurrences et la consistance portent alors sur tout l'historique.
+        """
+        history = history or {}
+        patterns = []
+        
+        # Grouper par produit + fournisseur
+        product_groups = defaultdict(list)
+        for anomaly in anomalies:
+            key = f"{anomaly['product_name']}_{anomaly['supplier']}"
+            product_groups[key].append(anomaly)
+        
+        # Analyser chaque groupe
+        for group_key, group_anomalies in product_groups.items():
+            stats = history.get(stats_key(group_anomalies[0]['supplier'], group_anomalies[0]['product_name']))
+            occurrences = max(len(group_anomalies), stats['count'] if stats else 0)
+            if occurrences >= self.pattern_min_occurrences:
+                pattern = self._analyze_pattern_group(group_key, group_anomalies, stats)
+                if pattern:
+                    patterns.append(pattern)
+        
+        return patterns
+    
+    def _analyze_pattern_group(self, group_key: str, anomalies: List[Dict], stats: Dict = None) -> Optional[Dict]:
+        """Analyser un groupe d'anomalies pour détecter un pattern (historique complet si stats fourni)"""
+        if not anomalies:
+            return None
+        
+        percentages = [a['percentage_difference'] for a in anomalies]
+        percentage_mean = sum(percentages) / len(percentages)
+        
+        if stats and stats.get('count', 0) >= len(anomalies):
+            # Historique complet: moyenne/écart-type Welford, prix actuel = moyenne mobile exponentielle
+            occurrences = stats['count']
+            price_mean = stats['mean']
+            price_std = stats['std']
+            new_price = stats['ewma']
+            reference_price = stats.get('reference_price', anomalies[0]['reference_price'])
+            evidence = [
+                f"Prix facturé: {o['price']}€ le {(o.get('date') or '')[:10]}"
+                for o in stats.get('recent', [])[-3:]  # Dernières 3 occurrences
+            ]
+        else:
+            # Statistiques du groupe
+            prices = [a['invoice_price'] for a in anomalies]
+            occurrences = len(anomalies)
+            price_mean = sum(prices) / len(prices)
+            price_std = (sum((p - price_mean) ** 2 for p in prices) / len(prices)) ** 0.5
+            new_price = price_mean
+            reference_price = anomalies[0]['reference_price']
+            evidence = [
+                f"Prix facturé: {a['invoice_price']}€ le {a['scan_date'][:10]}" 
+                for a in anomalies[-3:]  # Dernières 3 occurrences
+            ]
+        
+        if price_mean <= 0:
+            return None
+        
+        # Vérifier la consistance (coefficient de variation < 20%)
+        if price_std / price_mean < 0.20:
+            confidence = self._calculate_pattern_confidence(anomalies, price_std, price_mean, occurrences)
+            
+            return {
+                'group_key': group_key,
+                'product_name': anomalies[0]['product_name'],
+                'supplier': anomalies[0]['supplier'],
+                'occurrences': occurrences,
+                'consistent_new_price': round(new_price, 2),
+                'old_reference_price': reference_price,
+                'average_percentage_change': round(percentage_mean, 1),
+                'price_consistency': round(1 - (price_std / price_mean), 2),
+                'confidence_score': confidence,
+                'total_impact': sum(a.get('total_impact', 0) for a in anomalies),
+                'evidence': evidence
+            }
+        
+        return None
+    
+    def _calculate_pattern_confidence(self, anomalies: List[Dict], price_std: float, price_mean: float,
+                                      occurrences: int = None) -> float:
+        """Calculer la confiance d'un pattern"""
+        base_confidence = 0.6
+        
+        # Bonus pour nombre d'occurrences
+        occurrence_bonus = min(0.2, (occurrences or len(anomalies)) * 0.1)
+        
+        # Bonus pour consistance des prix
+        consistency_bonus = (1 - (price_std / price_mean)) * 0.2
+        
+        return min(1.0, base_confidence + occurrence_bonus + consistency_bonus)
+
+
+# ===== BENCHMARK =====
+
+
+def generate_anomalies(invoices: int, lines: int, products: int, seed: int = 42) -> list:
+    """Anomalies de prix d'un batch: quelques produits au nouveau prix stable, le reste bruité"""
+    rng = random.Random(seed)
+    suppliers = ['METRO', 'TRANSGOURMET', 'PROMOCASH', 'POMONA', 'DAVIGEL']
+    catalogue = [(f"PRODUIT {i:04d}", rng.choice(suppliers), round(rng.uniform(1, 80), 2))
+                 for i in range(products)]
+    start = datetime(2025, 1, 1)
+    anomalies = []
+    for invoice in range(invoices):
+        scan_date = (start + timedelta(hours=invoice * 3)).isoformat()
+        for product_name, supplier, reference in rng.sample(catalogue, min(lines, products)):
+            # Un produit sur trois a changé de prix (écart stable), les autres varient fortement
+            drift = 1.12 if hash(product_name) % 3 == 0 else rng.uniform(0.6, 1.5)
+            invoice_price = round(reference * drift * rng.uniform(0.98, 1.02), 2)
+            difference = round(invoice_price - reference, 2)
+            anomalies.append({
+                'product_name': product_name,
+                'supplier': supplier,
+                'invoice_price': invoice_price,
+                'reference_price': reference,
+                'price_difference': difference,
+                'percentage_difference': round(difference / reference * 100, 1),
+                'status': 'price_increase' if difference > 0 else 'price_decrease',
+                'scan_date': scan_date,
+                'quantity': rng.randint(1, 10),
+                'total_impact': round(difference * rng.randint(1, 10), 2)
+            })
+    return anomalies
+
+
+# Champs arrondis: une somme accumulée dans un autre ordre peut changer le dernier chiffre
+ROUNDING_STEPS = {'consistent_new_price': 0.01, 'average_percentage_change': 0.1, 'price_consistency': 0.01}
+
+
+def same_patterns(left: list, right: list) -> bool:
+    """
+    Comparaison champ par champ des champs de la référence (left), flottants à 1e-9 près,
+    au pas d'arrondi près pour les champs arrondis
+    """
+    if len(left) != len(right):
+        return False
+    for a, b in zip(left, right):
+        if not a.keys() <= b.keys():
+            return False
+        for key in a:
+            if isinstance(a[key], float) or isinstance(b[key], float):
+                if abs(a[key] - b[key]) > ROUNDING_STEPS.get(key, 0) + 1e-9:
+                    return False
+            elif a[key] != b[key]:
+                return False
+    return True
+
+
+def measure(func, anomalies: list, history: dict, repeat: int) -> tuple:
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(anomalies, history)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark détection de patterns IA')
+    parser.add_argument('--invoices', type=int, default=200)
+    parser.add_argument('--lines', type=int, default=40, help='anomalies par facture')
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--with-history', action='store_true', help='passer les statistiques glissantes')
+    args = parser.parse_args()
+
+    detector = AIAnomalyDetector()
+    anomalies = generate_anomalies(args.invoices, args.lines, args.products)
+    print(f"📦 {len(anomalies)} anomalies, {args.products} produits, {args.invoices} factures")
+
+    history = None
+    if args.with_history:
+        # Sans Firestore, le store tient les statistiques en mémoire
+        history = detector.price_stats.observe_many({
+            'supplier': a['supplier'], 'product_name': a['product_name'], 'price': a['invoice_price'],
+            'reference_price': a['reference_price'], 'date': a['scan_date']
+        } for a in anomalies)
+
+    reference = PerGroupReference(detector.pattern_min_occurrences)
+    legacy_ms, legacy = measure(reference._detect_intelligent_patterns, anomalies, history, args.repeat)
+    columnar_ms, columnar = measure(detector._detect_intelligent_patterns, anomalies, history, args.repeat)
+
+    print(f"🐢 Groupe par groupe : {legacy_ms:8.1f} ms ({len(legacy)} patterns)")
+    print(f"⚡ Colonnaire        : {columnar_ms:8.1f} ms ({len(columnar)} patterns)")
+    print(f"📈 Accélération      : x{legacy_ms / columnar_ms:.1f}")
+    print(f"✅ Résultats identiques: {'oui' if same_patterns(legacy, columnar) else 'NON'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -23,8 +23,8 @@ class ClaudeScanner:
             print(f"❌ Erreur générale initialisation Claude Vision: {e}")
             self.claude_vision = None
     
-    def scan_facture(self, filepath):
-        """Scanner une facture avec Claude Vision"""
+    def scan_facture(self, filepath, metrics=None):
+        """Scanner une facture avec Claude Vision (metrics: ScanMetrics optionnel)"""
         if self.claude_vision is None:
             return {
                 'success': False,
@@ -41,7 +41,7 @@ class ClaudeScanner:
         
         try:
             print(f"🔍 Analyse de la facture: {filepath}")
-            result = self.claude_vision.analyze_invoice_image(filepath)
+            result = self.claude_vision.analyze_invoice_image(filepath, metrics)
             return result
         except Exception as e:
             print(f"❌ Erreur scan facture: {e}")
@@ -54,10 +54,45 @@ class ClaudeScanner:
                 }
             }
     
-    def scan_facture_multipage(self, page_paths):
+    def scan_facture_multipage(self, page_paths, metrics=None):
+        """
+        Scanner toutes les pages d'une facture et fusionner le résultat
+        
+        En-tête (fournisseur, numéro, date) pris sur la première page qui le fournit,
+        lignes produits concaténées dans l'ordre des pages, total de la dernière page
+        qui en indique un. Une page en échec fait échouer le scan (pas de page ignorée).
+        """
         if not page_paths:
-            return self.scan_facture(None)
-        return self.scan_facture(page_paths[0])
+            return self.scan_facture(None, metrics)
+        if len(page_paths) == 1:
+            return self.scan_facture(page_paths[0], metrics)
+        
+        merged = None
+        for page_number, page_path in enumerate(page_paths, 1):
+            result = self.scan_facture(page_path, metrics)
+            if not result.get('success'):
+                error = result.get('error', 'Erreur analyse')
+                return {
+                    'success': False,
+                    'error': f'Page {page_number}/{len(page_paths)}: {error}',
+                    'data': result.get('data', {'products': []})
+                }
+            
+            page_data = dict(result.get('data', result))
+            if merged is None:
+                merged = page_data
+                merged['products'] = list(page_data.get('products') or [])
+                continue
+            
+            for field in ('supplier', 'invoice_number', 'date'):
+                if not merged.get(field) and page_data.get(field):
+                    merged[field] = page_data[field]
+            merged['products'].extend(page_data.get('products') or [])
+            if page_data.get('total_amount'):
+                merged['total_amount'] = page_data['total_amount']
+        
+        print(f"📄 {len(page_paths)} pages scannées: {len(merged['products'])} produits")
+        return {'success': True, 'data': merged}
     
     def get_pending_orders_for_supplier(self, supplier):
         return []
\ No newline at end of file
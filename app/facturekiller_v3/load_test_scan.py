@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+🧪 Test de charge du pipeline de scan (/api/invoices/analyze)
+
+Démarrer le serveur avec le backend Vision factice pour ne consommer aucun crédit API:
+
+    VISION_BACKEND=fake VISION_FAKE_LATENCY_MS=1500 VISION_FAKE_429_RATE=0.02 python main.py
+
+Enregistrer d'abord de vraies réponses avec VISION_BACKEND=record (fixtures dans
+data/vision_fixtures), puis lancer:
+
+    python load_test_scan.py --url http://localhost:8000 --username admin --password ... \\
+        --images tests/factures/*.jpg --concurrency 8 --requests 200
+
+La persistance (compare_prices, sauvegarde des factures) passe par Firestore:
+pointer FIRESTORE_EMULATOR_HOST vers l'émulateur local pour un run isolé.
+"""
+
+import os
+import sys
+import time
+import glob
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+
+def login(base_url: str, username: str, password: str) -> requests.Session:
+    """Ouvrir une session authentifiée"""
+    session = requests.Session()
+    response = session.post(f"{base_url}/api/auth/login", json={
+        'username': username,
+        'password': password
+    })
+    if response.status_code != 200 or not response.json().get('success'):
+        print(f"❌ Connexion impossible: {response.status_code} {response.text[:200]}")
+        sys.exit(1)
+    return session
+
+
+def scan_once(session: requests.Session, base_url: str, image_path: str) -> dict:
+    """Envoyer une facture et mesurer la latence de bout en bout"""
+    start = time.perf_counter()
+    try:
+        with open(image_path, 'rb') as f:
+            response = session.post(
+                f"{base_url}/api/invoices/analyze",
+                files={'file': (os.path.basename(image_path), f)},
+                data={'mode': 'libre'},
+                timeout=300
+            )
+        elapsed = (time.perf_counter() - start) * 1000
+        ok = response.status_code == 200 and response.json().get('success', False)
+        return {'ok': ok, 'status': response.status_code, 'ms': elapsed}
+    except Exception as e:
+        return {'ok': False, 'status': type(e).__name__, 'ms': (time.perf_counter() - start) * 1000}
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile simple (valeurs déjà triées)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du scan de factures")
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--images', nargs='+', required=True, help="Factures à envoyer (glob accepté)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    images = sorted(p for pattern in args.images for p in glob.glob(pattern))
+    if not images:
+        print("❌ Aucune image trouvée")
+        sys.exit(1)
+
+    base_url = args.url.rstrip('/')
+    print("🧪 TEST DE CHARGE SCANNER")
+    print("=" * 50)
+    print(f"   Cible: {base_url} | {len(images)} factures | {args.requests} requêtes | concurrence {args.concurrency}")
+
+    # Une session par thread (cookies non partagés entre threads)
+    local = threading.local()
+
+    def worker(index: int) -> dict:
+        if not hasattr(local, 'session'):
+            local.session = login(base_url, args.username, args.password)
+        return scan_once(local.session, base_url, images[index % len(images)])
+
+    results = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(worker, i) for i in range(args.requests)]
+        for future in as_completed(futures):
+            results.append(future.result())
+    wall = time.perf_counter() - start
+
+    latencies = sorted(r['ms'] for r in results if r['ok'])
+    failures = {}
+    for r in results:
+        if not r['ok']:
+            failures[r['status']] = failures.get(r['status'], 0) + 1
+
+    print("\n📊 RÉSULTATS")
+    print("=" * 50)
+    print(f"   Durée totale: {wall:.1f}s | Débit: {len(latencies) / wall:.2f} scans/s")
+    print(f"   Succès: {len(latencies)}/{len(results)} | Échecs: {failures or 'aucun'}")
+    if latencies:
+        print(f"   Latence p50: {percentile(latencies, 0.50):.0f}ms | "
+              f"p95: {percentile(latencies, 0.95):.0f}ms | max: {latencies[-1]:.0f}ms")
+
+    # Détail par étape côté serveur (nécessite un compte master_admin)
+    try:
+        session = login(base_url, args.username, args.password)
+        stages = session.get(f"{base_url}/api/metrics/scans").json().get('data', {}).get('stages', {})
+        if stages:
+            print("\n⏱️ ÉTAPES SERVEUR (p50 / p95 ms)")
+            for name, values in sorted(stages.items(), key=lambda item: -item[1]['p95']):
+                print(f"   {name:<20} {values['p50']:>9.1f} / {values['p95']:>9.1f}")
+    except Exception as e:
+        print(f"\nℹ️ Métriques serveur indisponibles: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,14 +14,6 @@ import uuid
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from PIL import Image
-try:
-    import pillow_heif
-    # Enregistrer le plugin HEIF AVANT tout autre import PIL
-    pillow_heif.register_heif_opener()
-    HEIF_SUPPORT = True
-except ImportError:
-    HEIF_SUPPORT = False
-    print("⚠️ pillow_heif non disponible - support HEIF désactivé")
 
 import pytesseract
 import cv2
@@ -40,9 +32,29 @@ from modules.invoice_analyzer import InvoiceAnalyzer
 from modules.price_manager import PriceManager
 from modules.stats_calculator import StatsCalculator
 from modules.order_manager import OrderManager
+from modules.order_invoice_validator import OrderInvoiceValidator
+from modules.product_matcher import normalize_product_name
 from modules.invoice_manager import InvoiceManager
+from modules.anomaly_manager import AnomalyManager
 from modules.email_manager import EmailManager
 from modules.auth_manager import AuthManager, login_required, role_required
+from modules.cpu_pool import run_cpu_task, compress_image_bytes, CPUTaskTimeout
+from modules.pdf_reader import PDFReader, DEFAULT_DPI as PDF_DEFAULT_DPI
+from modules.heic_decoder import register_opener as register_heif_opener
+from modules.scan_metrics import ScanMetrics, current_or_new, registry as scan_metrics_registry
+from modules.dashboard_rollups import DashboardRollupManager
+from modules.dashboard_cache import dashboard_cache
+from modules.parallel_fetch import fetch_parallel
+from modules.scanner_history_store import ScannerHistoryStore
+from modules.invoice_ingest import InvoiceIngestPipeline, invoice_anomaly_counts, add_counts
+from modules.sync_manager import SyncManager
+from modules.sync_outbox import SyncOutbox
+from modules.fast_json import init_app as init_fast_json, json_list_response
+
+# Enregistrer le plugin HEIF (une seule fois pour tous les modules)
+HEIF_SUPPORT = register_heif_opener()
+if not HEIF_SUPPORT:
+    print("⚠️ pillow_heif non disponible - support HEIF désactivé")
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
@@ -51,6 +63,9 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# Sérialisation orjson + compression gzip/brotli des réponses JSON
+init_fast_json(app)
+
 # Configuration de sécurité pour les sessions
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'facturekiller-v3-secret-key-2025')
 app.config['SESSION_COOKIE_SECURE'] = False  # True en production avec HTTPS
@@ -68,11 +83,19 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # Initialisation des services
 ocr_engine = OCREngine()
 invoice_analyzer = InvoiceAnalyzer()
-invoice_manager = InvoiceManager()
 price_manager = PriceManager()
+# Détection d'anomalies en flux, notifiée par chaque écriture de facture
+invoice_ingest = InvoiceIngestPipeline(AnomalyManager(price_manager))
+invoice_manager = InvoiceManager(ingest=invoice_ingest)
 stats_calculator = StatsCalculator()
 email_manager = EmailManager()
 auth_manager = AuthManager()
+pdf_reader = PDFReader()
+dashboard_rollups = DashboardRollupManager()
+scanner_history = ScannerHistoryStore()
+# Synchronisations entre restaurants appliquées en arrière-plan (intentions persistées)
+sync_outbox = SyncOutbox(SyncManager(price_manager))
+sync_outbox.start()
 order_manager = OrderManager(email_manager, None)  # Temporaire
 # Assigner auth_manager après
 order_manager.auth_manager = auth_manager
@@ -355,28 +378,27 @@ def compress_image():
         max_height = int(request.form.get('max_height', 1080))
         quality = int(request.form.get('quality', 85))
         
-        # Ouvrir et compresser l'image
-        image = Image.open(file.stream)
-        
-        # Redimensionner si nécessaire
-        if image.width > max_width or image.height > max_height:
-            image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-        
-        # Convertir en RGB si nécessaire
-        if image.mode in ('RGBA', 'P'):
-            image = image.convert('RGB')
+        # Lire l'upload puis compresser dans le pool CPU (libère le thread de requête)
+        original_data = file.read()
+        try:
+            compressed_data = run_cpu_task(
+                compress_image_bytes, original_data, max_width, max_height, quality,
+                timeout=30
+            )
+        except CPUTaskTimeout as e:
+            return jsonify({'success': False, 'error': str(e)}), 504
         
         # Sauvegarder l'image compressée
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"compressed_{timestamp}.jpg"
         filepath = os.path.join(UPLOAD_FOLDER, filename)
         
-        image.save(filepath, 'JPEG', quality=quality, optimize=True)
+        with open(filepath, 'wb') as f:
+            f.write(compressed_data)
         
         # Calculer la réduction de taille
-        original_size = len(file.read())
-        file.seek(0)  # Reset file pointer
-        compressed_size = os.path.getsize(filepath)
+        original_size = len(original_data)
+        compressed_size = len(compressed_data)
         
         return jsonify({
             'success': True,
@@ -401,21 +423,10 @@ def get_scanner_history():
         if not restaurant_id:
             return jsonify({'success': False, 'error': 'Restaurant non défini'}), 400
         
-        # Charger l'historique depuis le fichier
-        history_file = f'data/scanner_history_{restaurant_id}.json'
-        
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        else:
-            history = []
-        
-        # Trier par date décroissante
-        history.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
+        # 50 dernières entrées, déjà triées par date décroissante (index restaurant + date)
         return jsonify({
             'success': True,
-            'data': history[:50]  # Limiter à 50 entrées
+            'data': scanner_history.recent(restaurant_id, limit=50)
         })
         
     except Exception as e:
@@ -447,24 +458,8 @@ def save_scanner_history():
             'restaurant_id': restaurant_id
         }
         
-        # Charger l'historique existant
-        history_file = f'data/scanner_history_{restaurant_id}.json'
-        
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        else:
-            history = []
-        
-        # Ajouter la nouvelle entrée
-        history.insert(0, history_entry)
-        
-        # Limiter à 100 entrées
-        history = history[:100]
-        
-        # Sauvegarder
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        # Ajout atomique (compteur journalier + rétention à 100 entrées dans la même transaction)
+        scanner_history.append(history_entry)
         
         return jsonify({
             'success': True,
@@ -487,20 +482,8 @@ def delete_scanner_history(history_id):
         if not restaurant_id:
             return jsonify({'success': False, 'error': 'Restaurant non défini'}), 400
         
-        history_file = f'data/scanner_history_{restaurant_id}.json'
-        
-        if not os.path.exists(history_file):
-            return jsonify({'success': False, 'error': 'Historique non trouvé'}), 404
-        
-        # Charger et filtrer l'historique
-        with open(history_file, 'r', encoding='utf-8') as f:
-            history = json.load(f)
-        
-        history = [item for item in history if item.get('id') != history_id]
-        
-        # Sauvegarder
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        if not scanner_history.delete(restaurant_id, history_id):
+            return jsonify({'success': False, 'error': 'Élément d\'historique non trouvé'}), 404
         
         return jsonify({
             'success': True,
@@ -591,39 +574,10 @@ def get_scanner_stats():
         if not restaurant_id:
             return jsonify({'success': False, 'error': 'Restaurant non défini'}), 400
         
-        # Charger l'historique
-        history_file = f'data/scanner_history_{restaurant_id}.json'
-        
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        else:
-            history = []
-        
-        # Calculer les statistiques
-        total_scans = len(history)
-        total_savings = sum(item.get('savings', 0) for item in history)
-        total_products = sum(item.get('products_count', 0) for item in history)
-        
-        # Statistiques par période
-        now = datetime.now()
-        today_scans = len([item for item in history 
-                          if datetime.fromisoformat(item.get('timestamp', '2000-01-01')).date() == now.date()])
-        
-        this_week_scans = len([item for item in history 
-                              if (now - datetime.fromisoformat(item.get('timestamp', '2000-01-01'))).days <= 7])
-        
+        # Compteurs journaliers précalculés: pas de relecture de l'historique
         return jsonify({
             'success': True,
-            'data': {
-                'total_scans': total_scans,
-                'total_savings': round(total_savings, 2),
-                'total_products': total_products,
-                'today_scans': today_scans,
-                'this_week_scans': this_week_scans,
-                'average_savings_per_scan': round(total_savings / max(total_scans, 1), 2),
-                'last_scan': history[0].get('timestamp') if history else None
-            }
+            'data': scanner_history.stats(restaurant_id)
         })
         
     except Exception as e:
@@ -661,34 +615,53 @@ def api_test():
         'timestamp': datetime.now().isoformat()
     })
 
-@app.route('/api/stats/dashboard')
-def get_dashboard_stats():
-    """Statistiques pour le dashboard"""
+@app.route('/api/metrics/scans')
+@login_required
+@role_required('master_admin')
+def get_scan_metrics():
+    """Métriques des scans: percentiles par étape (p50/p95) et tokens/coût par restaurant"""
     try:
-        # Importer les modules nécessaires
-        from modules.stats_calculator import StatsCalculator
-        from modules.invoice_manager import InvoiceManager
-        
-        # Initialiser les gestionnaires
-        stats_calculator = StatsCalculator()
-        invoice_manager = InvoiceManager()
-        
-        # Récupérer toutes les données nécessaires
-        all_prices = price_manager.get_all_prices(per_page=99999)['items']
-        all_invoices = invoice_manager.get_all_invoices(per_page=99999)['items']
-        pending_products = price_manager.get_pending_products()
-        
-        # Calculer les statistiques
-        stats = stats_calculator.calculate_dashboard_stats(
-            all_prices, 
-            all_invoices,
-            pending_products
-        )
-        
+        restaurant_id = request.args.get('restaurant_id')
         return jsonify({
             'success': True,
-            'data': stats
+            'data': scan_metrics_registry.summary(restaurant_id)
         })
+    except Exception as e:
+        logger.error(f"Erreur métriques scans: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/stats/dashboard')
+@login_required
+def get_dashboard_stats():
+    """Statistiques pour le dashboard du restaurant courant (cache TTL + ETag)"""
+    try:
+        user_context = auth_manager.get_user_context()
+        current_restaurant = user_context.get('restaurant') if user_context else None
+        restaurant_id = current_restaurant.get('id') if current_restaurant else None
+        restaurant_name = current_restaurant.get('name') if current_restaurant else None
+        
+        # Cache par restaurant: un onglet qui repoll sans changement reçoit un 304
+        cached = dashboard_cache.get(restaurant_id)
+        if cached is None:
+            version = dashboard_cache.version(restaurant_id)
+            stats = compute_dashboard_stats(restaurant_id, restaurant_name)
+            cached = dashboard_cache.set(restaurant_id, stats, version)
+        
+        # contains_weak: l'ETag devient faible quand la réponse est compressée
+        if request.if_none_match.contains_weak(cached['etag']):
+            response = make_response('', 304)
+        else:
+            response = jsonify({
+                'success': True,
+                'data': cached['data'],
+                'restaurant_id': restaurant_id
+            })
+        response.set_etag(cached['etag'])
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         logger.error(f"Erreur API dashboard: {e}")
         return jsonify({
@@ -696,6 +669,34 @@ def get_dashboard_stats():
             'error': str(e)
         }), 500
 
+def compute_dashboard_stats(restaurant_id, restaurant_name):
+    """Calculer les statistiques du dashboard limitées à un restaurant"""
+    # Produits en attente et agrégats mensuels lus en parallèle (agrégats en construction
+    # au-delà de l'échéance: repli None -> calcul complet plus bas)
+    fetched = fetch_parallel({
+        'pending_products': price_manager.get_pending_products,
+        'rollups': lambda: dashboard_rollups.get_rollups(restaurant_id) if restaurant_id else []
+    }, defaults={'rollups': None, 'pending_products': []})
+    
+    # 🔒 Produits en attente du restaurant uniquement (id ou nom selon l'origine)
+    pending_products = [
+        p for p in fetched['pending_products']
+        if (restaurant_id and p.get('restaurant_id') == restaurant_id) or
+           (restaurant_name and restaurant_name in (p.get('restaurant_name'), p.get('restaurant')))
+    ]
+    
+    if not restaurant_id:
+        return stats_calculator.calculate_dashboard_stats_from_rollups([], pending_products)
+    
+    # Agrégats mensuels matérialisés (quelques documents au lieu de tout l'historique)
+    rollups = fetched['rollups']
+    if rollups is not None:
+        return stats_calculator.calculate_dashboard_stats_from_rollups(rollups, pending_products)
+    
+    # Agrégats indisponibles: calcul complet depuis les factures du restaurant
+    invoices = invoice_manager.get_invoices_by_restaurant(restaurant_id, include_details=True)
+    return stats_calculator.calculate_dashboard_stats([], invoices, pending_products)
+
 # ===== SCANNER API =====
 
 @app.route('/api/invoices/analyze', methods=['POST'])
@@ -703,6 +704,36 @@ def get_dashboard_stats():
 def analyze_invoice():
     """Analyser une facture avec OCR et IA - Support multi-pages"""
     
+    # Métriques par étape du scan (durées, tokens), enregistrées quelle que soit l'issue
+    metrics = ScanMetrics()
+    status, error = 'error', None
+    try:
+        response = _analyze_invoice_request(metrics)
+        code = response[1] if isinstance(response, tuple) else getattr(response, 'status_code', 200)
+        if code == 504:
+            status = 'timeout'
+        elif code < 400:
+            status = 'success'
+        if status != 'success':
+            body = response[0] if isinstance(response, tuple) else response
+            error = (body.get_json(silent=True) or {}).get('error')
+        return response
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        if metrics.restaurant_id is None:
+            try:
+                restaurant = (auth_manager.get_user_context() or {}).get('restaurant') or {}
+                metrics.restaurant_id = restaurant.get('id')
+            except Exception:
+                pass
+        metrics.finish(status, error)
+        scan_metrics_registry.record(metrics)
+
+def _analyze_invoice_request(metrics):
+    """Corps de /api/invoices/analyze (single page, multi-pages, PDF)"""
+    
     # Vérifier si c'est un mode multi-pages
     is_multipage = request.form.get('multipage') == 'true'
     
@@ -725,19 +756,30 @@ def analyze_invoice():
                     filename = secure_filename(page_file.filename)
                     filepath = os.path.join(UPLOAD_FOLDER, f"invoice_multipage_{datetime.now().strftime('%Y%m%d_%H%M%S')}_page{i+1}_{filename}")
                     page_file.save(filepath)
-                    page_paths.append(filepath)
+                    if pdf_reader.is_pdf(filepath):
+                        try:
+                            page_paths.extend(pdf_reader.rasterize(filepath))
+                        except RuntimeError as e:
+                            return jsonify({
+                                'success': False,
+                                'error': f'Page {i+1}: PDF non lisible - {str(e)}'
+                            }), 503
+                    else:
+                        page_paths.append(filepath)
                 else:
                     return jsonify({
                         'success': False,
                         'error': f'Page {i+1}: fichier non valide ou non supporté'
                     }), 400
             
+            metrics.upload_bytes = sum(os.path.getsize(p) for p in page_paths)
+            
             # Analyser les pages avec Claude Scanner
             from claude_scanner import ClaudeScanner
             claude_scanner = ClaudeScanner(price_manager)
             
             # Utiliser Claude Vision pour analyser toutes les pages ensemble
-            analysis = claude_scanner.scan_facture_multipage(page_paths)
+            analysis = claude_scanner.scan_facture_multipage(page_paths, metrics)
             
             if analysis['success']:
                 analysis_data = analysis.get('data', analysis)
@@ -746,13 +788,18 @@ def analyze_invoice():
                 analysis_data['page_files'] = [os.path.basename(p) for p in page_paths]
                 
                 # Suite du traitement comme pour une facture normale...
-                return process_invoice_analysis(analysis_data, page_paths[0])  # Utiliser la première page comme référence
+                return process_invoice_analysis(analysis_data, page_paths[0], metrics)  # Utiliser la première page comme référence
             else:
                 return jsonify({
                     'success': False,
                     'error': analysis.get('error', 'Erreur analyse multi-pages')
                 }), 500
                 
+        except CPUTaskTimeout as e:
+            return jsonify({
+                'success': False,
+                'error': f'PDF trop long à traiter: {str(e)}'
+            }), 504
         except Exception as e:
             print(f"❌ Erreur analyse multi-pages: {e}")
             return jsonify({
@@ -779,16 +826,21 @@ def analyze_invoice():
             filename = secure_filename(file.filename)
             filepath = os.path.join(UPLOAD_FOLDER, f"invoice_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}")
             file.save(filepath)
+            metrics.upload_bytes = os.path.getsize(filepath)
+            
+            # Factures PDF: couche texte directe ou pages rastérisées
+            if pdf_reader.is_pdf(filepath):
+                return analyze_pdf_invoice(filepath, metrics)
             
             try:
                 # Analyser avec Claude Scanner
                 from claude_scanner import ClaudeScanner
                 claude_scanner = ClaudeScanner(price_manager)
-                analysis = claude_scanner.scan_facture(filepath)
+                analysis = claude_scanner.scan_facture(filepath, metrics)
                 
                 if analysis['success']:
                     analysis_data = analysis.get('data', analysis)
-                    return process_invoice_analysis(analysis_data, filepath)
+                    return process_invoice_analysis(analysis_data, filepath, metrics)
                 else:
                     return jsonify({
                         'success': False,
@@ -807,8 +859,72 @@ def analyze_invoice():
                 'error': 'Type de fichier non supporté'
             }), 400
 
-def process_invoice_analysis(analysis_data, filepath):
+def analyze_pdf_invoice(filepath, metrics=None):
+    """Analyser une facture PDF: texte embarqué sans OCR, sinon scan multi-pages des pages rastérisées"""
+    metrics = current_or_new(metrics)
+    try:
+        # 1. PDF avec couche texte: analyse directe, sans OCR ni appel vision
+        with metrics.stage('pdf_text'):
+            text_result = pdf_reader.extract_text(filepath)
+        if text_result.get('has_text_layer'):
+            with metrics.stage('text_analysis'):
+                analysis = invoice_analyzer.analyze(text_result['text'])
+            analysis_data = analysis.get('data', {})
+            if analysis.get('success') and analysis_data.get('products'):
+                print(f"📄 PDF texte analysé directement: {len(analysis_data['products'])} produits")
+                analysis_data['analysis_method'] = 'pdf-text'
+                analysis_data['total_pages'] = text_result.get('page_count', 1)
+                return process_invoice_analysis(analysis_data, filepath, metrics)
+            print("⚠️ Couche texte PDF inexploitable - passage en rastérisation")
+        
+        # 2. PDF scanné: rastériser les pages puis scan multi-pages
+        dpi = request.form.get('dpi', PDF_DEFAULT_DPI, type=int)
+        try:
+            with metrics.stage('pdf_rasterize'):
+                page_paths = pdf_reader.rasterize(filepath, dpi=dpi)
+        except RuntimeError as e:
+            return jsonify({
+                'success': False,
+                'error': f'PDF scanné non lisible: {str(e)}'
+            }), 503
+        if not page_paths:
+            return jsonify({
+                'success': False,
+                'error': 'PDF vide'
+            }), 400
+        
+        from claude_scanner import ClaudeScanner
+        claude_scanner = ClaudeScanner(price_manager)
+        analysis = claude_scanner.scan_facture_multipage(page_paths, metrics)
+        
+        if analysis['success']:
+            analysis_data = analysis.get('data', analysis)
+            analysis_data['analysis_method'] = 'pdf-raster'
+            analysis_data['is_multipage'] = len(page_paths) > 1
+            analysis_data['total_pages'] = len(page_paths)
+            analysis_data['page_files'] = [os.path.basename(p) for p in page_paths]
+            return process_invoice_analysis(analysis_data, filepath, metrics)
+        else:
+            return jsonify({
+                'success': False,
+                'error': analysis.get('error', 'Erreur analyse PDF')
+            }), 500
+    
+    except CPUTaskTimeout as e:
+        return jsonify({
+            'success': False,
+            'error': f'PDF trop long à traiter: {str(e)}'
+        }), 504
+    except Exception as e:
+        print(f"❌ Erreur analyse PDF: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erreur lors de l\'analyse du PDF: {str(e)}'
+        }), 500
+
+def process_invoice_analysis(analysis_data, filepath, metrics=None):
     """Traiter les données d'analyse d'une facture (commune single/multi-page)"""
+    metrics = current_or_new(metrics)
     try:
         # Mode de scan (libre ou commande)
         scan_mode = request.form.get('mode', 'libre')
@@ -858,10 +974,11 @@ def process_invoice_analysis(analysis_data, filepath):
 
                 # Passer le restaurant au price_manager
                 print(f"🔄 PROCESS_INVOICE: Appel compare_prices avec restaurant '{restaurant_name}'")
-                comparison = price_manager.compare_prices(
-                    analysis_data['products'], 
-                    restaurant_name=restaurant_name
-                )
+                with metrics.stage('price_comparison'):
+                    comparison = price_manager.compare_prices(
+                        analysis_data['products'], 
+                        restaurant_name=restaurant_name
+                    )
                 analysis_data['price_comparison'] = comparison
                 analysis_data['restaurant_context'] = restaurant_name
                 
@@ -875,7 +992,8 @@ def process_invoice_analysis(analysis_data, filepath):
             else:
                 print(f"⚠️ PROCESS_INVOICE: Aucun restaurant sélectionné")
                 # Pas de restaurant sélectionné - utiliser tous les prix
-                comparison = price_manager.compare_prices(analysis_data['products'])
+                with metrics.stage('price_comparison'):
+                    comparison = price_manager.compare_prices(analysis_data['products'])
                 analysis_data['price_comparison'] = comparison
                 analysis_data['warning'] = 'Aucun restaurant sélectionné - prix génériques utilisés'
             
@@ -893,14 +1011,16 @@ def process_invoice_analysis(analysis_data, filepath):
         
         restaurant_id = current_restaurant.get('id') if current_restaurant else None;
         restaurant_name = current_restaurant.get('name') if current_restaurant else None;
+        metrics.restaurant_id = restaurant_id
         
         # ▶️  3A. Sauvegarde via InvoiceAnalyzer (historique brut)
-        invoice_id = invoice_analyzer.save_invoice(
-            {'data': analysis_data}, 
-            filepath,
-            restaurant_id=restaurant_id,
-            restaurant_name=restaurant_name
-        )
+        with metrics.stage('history_write'):
+            invoice_id = invoice_analyzer.save_invoice(
+                {'data': analysis_data}, 
+                filepath,
+                restaurant_id=restaurant_id,
+                restaurant_name=restaurant_name
+            )
         analysis_data['invoice_id'] = invoice_id
 
         # ▶️  3B. Sauvegarde dans InvoiceManager pour lister dans /factures
@@ -915,15 +1035,20 @@ def process_invoice_analysis(analysis_data, filepath):
                 'filename': os.path.basename(filepath),
                 'scan_date': datetime.now().isoformat(),
                 'restaurant_id': restaurant_id,
-                'restaurant_name': restaurant_name
+                'restaurant_name': restaurant_name,
+                # Métriques du scan jusqu'à l'écriture (la durée d'écriture est dans /api/metrics/scans)
+                'scan_metrics': metrics.to_dict()
             }
-            invoice_manager.save_invoice(invoice_record)
+            with metrics.stage('firestore_write'):
+                invoice_manager.save_invoice(invoice_record)
         except Exception as save_err:
             logger.warning(f"⚠️ Impossible d'enregistrer la facture dans InvoiceManager: {save_err}")
         
+        metrics.finish('success')
         return jsonify({
             'success': True,
-            'data': analysis_data
+            'data': analysis_data,
+            'metrics': metrics.to_dict()
         })
         
     except Exception as e:
@@ -940,8 +1065,16 @@ def process_invoice_analysis(analysis_data, filepath):
 def manage_suppliers():
     """Gérer les fournisseurs - filtrés par restaurant"""
     try:
-        # Récupérer le contexte utilisateur
-        user_context = auth_manager.get_user_context()
+        from modules.supplier_manager import SupplierManager
+        supplier_manager = SupplierManager()
+        
+        # Contexte utilisateur et fournisseurs (GET) lus en parallèle
+        reads = {'user_context': auth_manager.get_user_context}
+        if request.method == 'GET':
+            reads['all_suppliers'] = supplier_manager.get_all_suppliers
+        fetched = fetch_parallel(reads)
+        
+        user_context = fetched['user_context']
         current_restaurant = user_context.get('restaurant')
         
         # Vérifier qu'un restaurant est sélectionné
@@ -952,13 +1085,10 @@ def manage_suppliers():
                 'requires_restaurant': True
             }), 400
         
-        from modules.supplier_manager import SupplierManager
-        supplier_manager = SupplierManager()
-        
         if request.method == 'GET':
             # Récupérer les fournisseurs du restaurant
             restaurant_suppliers = current_restaurant.get('suppliers', [])
-            all_suppliers = supplier_manager.get_all_suppliers()
+            all_suppliers = fetched['all_suppliers']
             
             # ✅ CORRECTION : Inclure TOUS les fournisseurs qui ont des produits pour ce restaurant
             # Pas seulement ceux dans la liste restaurant_suppliers
@@ -1204,9 +1334,9 @@ def get_prices():
             restaurant_name=restaurant_name  # NOUVEAU FILTRE
         )
         
-        return jsonify({
+        # Catalogue complet (per_page=99999): liste streamée par paquets
+        return json_list_response(prices['items'], {
             'success': True,
-            'data': prices['items'],
             'total': prices['total'],
             'page': prices['page'],
             'pages': prices['pages'],
@@ -1352,9 +1482,8 @@ def validate_pending_product(pending_id):
         user_context = auth_manager.get_user_context()
         current_restaurant = user_context.get('restaurant')
         
-        # Récupérer les détails du produit avant validation
-        pending_products = price_manager.get_pending_products()
-        product_to_validate = next((p for p in pending_products if p.get('id') == pending_id), None)
+        # Récupérer les détails du produit avant validation (lecture directe par id)
+        product_to_validate = price_manager.get_pending_product(pending_id)
         
         success = price_manager.validate_pending_product(pending_id)
         
@@ -1362,9 +1491,6 @@ def validate_pending_product(pending_id):
             # 🔄 SYNCHRONISER LE NOUVEAU PRIX VERS LES AUTRES RESTAURANTS DU GROUPE
             if current_restaurant and product_to_validate:
                 try:
-                    from modules.sync_manager import SyncManager
-                    sync_manager = SyncManager()
-                    
                     # Préparer les données du produit pour la synchronisation
                     product_data = {
                         'produit': product_to_validate.get('produit'),
@@ -1375,15 +1501,17 @@ def validate_pending_product(pending_id):
                         'restaurant': current_restaurant.get('name')
                     }
                     
-                    sync_result = sync_manager.sync_prices_to_group(current_restaurant.get('name'), product_data)
-                    if sync_result.get('synced_count', 0) > 0:
-                        print(f"✅ Prix validé et synchronisé vers {sync_result['synced_count']} restaurant(s)")
+                    # Intention persistée: le worker de l'outbox l'applique au groupe
+                    sync_result = sync_outbox.enqueue_price(current_restaurant.get('name'), product_data)
+                    if sync_result.get('queued'):
+                        print(f"🔄 Prix validé, synchronisation {sync_result['sync_group']} en file")
                         
                         return jsonify({
                             'success': True,
-                            'message': f'Produit validé et synchronisé vers {sync_result["synced_count"]} restaurant(s)',
-                            'sync_count': sync_result['synced_count'],
-                            'sync_restaurants': sync_result.get('synced_restaurants', [])
+                            'message': f'Produit validé - synchronisation du groupe {sync_result["sync_group"]} en cours',
+                            'sync_queued': True,
+                            'sync_intent_id': sync_result['intent_id'],
+                            'sync_group': sync_result['sync_group']
                         })
                 except Exception as sync_error:
                     logger.warning(f"Erreur synchronisation prix validé: {sync_error}")
@@ -1497,16 +1625,20 @@ def validate_pending_bulk():
                 'error': 'Aucun ID fourni'
             }), 400
         
-        validated_count = 0
-        for product_id in product_ids:
-            success = price_manager.validate_pending_product(product_id)
-            if success:
-                validated_count += 1
+        # Validation par lots transactionnels (pending_products -> prices)
+        result = price_manager.validate_pending_products(product_ids)
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'error': result.get('error', 'Erreur lors de la validation')
+            }), 500
         
+        validated_count = result['processed']
         return jsonify({
             'success': True,
             'message': f'{validated_count} produits validés',
-            'validated_count': validated_count
+            'validated_count': validated_count,
+            'not_found': result['not_found']
         })
         
     except Exception as e:
@@ -1528,16 +1660,20 @@ def reject_pending_bulk():
                 'error': 'Aucun ID fourni'
             }), 400
         
-        rejected_count = 0
-        for product_id in product_ids:
-            success = price_manager.reject_pending_product(product_id)
-            if success:
-                rejected_count += 1
+        # Rejet par lots transactionnels
+        result = price_manager.reject_pending_products(product_ids)
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'error': result.get('error', 'Erreur lors du rejet')
+            }), 500
         
+        rejected_count = result['processed']
         return jsonify({
             'success': True,
             'message': f'{rejected_count} produits rejetés',
-            'rejected_count': rejected_count
+            'rejected_count': rejected_count,
+            'not_found': result['not_found']
         })
         
     except Exception as e:
@@ -1646,9 +1782,8 @@ def get_invoices():
             restaurant_id=restaurant_id  # 🔒 Filtrage sécurisé
         )
         
-        return jsonify({
+        return json_list_response(invoices['items'], {
             'success': True,
-            'data': invoices['items'],
             'total': invoices['total'],
             'page': invoices['page'],
             'pages': invoices['pages'],
@@ -1695,28 +1830,8 @@ def save_invoice():
         user_context = auth_manager.get_user_context()
         current_restaurant = user_context.get('restaurant')
         
-        # 🎯 GÉNÉRATION AUTOMATIQUE DU CODE FACTURE FCT-XXXX-XXXX
-        def generate_invoice_code():
-            """Génère un code unique FCT-XXXX-XXXX"""
-            now = datetime.now()
-            # Format: FCT-YYYYMM-XXXX où XXXX est un compteur journalier
-            year_month = now.strftime('%Y%m')
-            
-            # Compter les factures du jour pour générer le numéro séquentiel
-            today_str = now.strftime('%Y-%m-%d')
-            existing_invoices = invoice_manager.get_all_invoices()
-            
-            # Filtrer les factures du jour
-            today_count = 0
-            for inv in existing_invoices:
-                if inv.get('scan_date', '').startswith(today_str):
-                    today_count += 1
-            
-            # Générer le code avec compteur (format XXXX avec zéros)
-            sequence = str(today_count + 1).zfill(4)
-            return f"FCT-{year_month}-{sequence}"
-        
-        invoice_code = generate_invoice_code()
+        # 🎯 GÉNÉRATION AUTOMATIQUE DU CODE FACTURE FCT-XXXX-XXXX (compteur transactionnel)
+        invoice_code = invoice_manager.next_invoice_code()
         
         # 🎯 GÉNÉRER AUTOMATIQUEMENT UN FILENAME SI NON FOURNI
         filename = data.get('filename')
@@ -1824,37 +1939,9 @@ def save_invoice():
         else:
             print("⚠️ Aucun restaurant sélectionné - facture sans association")
         
-        # 💾 SAUVEGARDER DANS LE GESTIONNAIRE DE FACTURES
+        # 💾 SAUVEGARDER DANS LE GESTIONNAIRE DE FACTURES (détection d'anomalies en arrière-plan)
         invoice_id = invoice_manager.save_invoice(invoice_data)
         
-        # 🎯 CRÉER LE SUIVI D'ANOMALIES DANS LE SYSTÈME
-        if anomalies:
-            # Créer une entrée dans le système d'anomalies pour chaque anomalie
-            for anomaly in anomalies:
-                anomaly_data = {
-                    'invoice_id': invoice_id,
-                    'invoice_code': invoice_code,
-                    'supplier': invoice_data['supplier'],
-                    'type': anomaly['type'],
-                    'description': anomaly['description'],
-                    'status': 'pending',  # pending, investigating, resolved, closed
-                    'severity': anomaly.get('severity', 'medium'),
-                    'created_at': datetime.now().isoformat(),
-                    'restaurant_id': current_restaurant.get('id') if current_restaurant else None,
-                    'restaurant_name': current_restaurant.get('name') if current_restaurant else None,
-                    'auto_detected': anomaly.get('auto_detected', False),
-                    'metadata': {
-                        'product_name': anomaly.get('product_name'),
-                        'invoice_price': anomaly.get('invoice_price'),
-                        'reference_price': anomaly.get('reference_price'),
-                        'price_difference': anomaly.get('price_difference')
-                    }
-                }
-                
-                # Sauvegarder l'anomalie dans le système de suivi
-                # (Utiliser le système d'anomalies existant ou créer un nouveau)
-                print(f"🚨 Anomalie créée: {anomaly['type']} pour {invoice_code}")
-        
         # 📊 STATISTIQUES ET RAPPORTS
         stats_summary = {
             'products_count': len(invoice_data['products']),
@@ -1937,21 +2024,9 @@ def save_invoice_simple():
         user_context = auth_manager.get_user_context()
         current_restaurant = user_context.get('restaurant') if user_context else None
         
-        # 🎯 GÉNÉRATION AUTOMATIQUE DU CODE FACTURE FCT-XXXX-XXXX
+        # 🎯 GÉNÉRATION AUTOMATIQUE DU CODE FACTURE FCT-XXXX-XXXX (compteur transactionnel)
         now = datetime.now()
-        year_month = now.strftime('%Y%m')
-        
-        # Compter les factures du jour pour générer le numéro séquentiel
-        today_str = now.strftime('%Y-%m-%d')
-        try:
-            existing_invoices = invoice_manager.get_all_invoices()
-            today_count = sum(1 for inv in existing_invoices if str(inv.get('scan_date', '')).startswith(today_str))
-        except:
-            today_count = 0
-        
-        # Générer le code avec compteur
-        sequence = str(today_count + 1).zfill(4)
-        invoice_code = f"FCT-{year_month}-{sequence}"
+        invoice_code = invoice_manager.next_invoice_code(now)
         
         # 🎯 DONNÉES DE BASE SÉCURISÉES
         supplier = str(data.get('supplier', 'Inconnu'))
@@ -2466,7 +2541,7 @@ def validate_invoice():
                 }), 404
             
             # Validation avec l'ordre
-            validator = OrderInvoiceValidator()
+            validator = OrderInvoiceValidator(order_manager, price_manager.aliases)
             validation_result = validator.validate_invoice_against_order(
                 invoice_data, order
             )
@@ -2493,6 +2568,13 @@ def validate_invoice():
                     }
                     price_manager.add_price(price_data)
                 
+                # Mémoriser les rapprochements confirmés (libellé facture -> produit commandé)
+                price_manager.aliases.record_many(order['supplier'], [
+                    (item['invoice_product'], item['order_product'])
+                    for item in validation_result.get('products_comparison', [])
+                    if item.get('invoice_product') and item.get('order_product')
+                ], source='invoice_validation')
+                
                 # Mettre à jour le statut de la commande
                 order_manager.update_order_status(order_id, 'invoiced')
                 
@@ -2546,11 +2628,17 @@ def validate_order_manual():
         invoice_products = []
         total_amount = 0
         has_anomalies = False
+        alias_pairs = []
         
         for item in verification_data:
             received = item['received']
             original = item['original']
             
+            # Libellé lu sur la facture, s'il a été saisi/rapproché côté client
+            invoice_label = received.get('name') or item.get('invoice_name')
+            if invoice_label and received['quantity'] > 0:
+                alias_pairs.append((invoice_label, original['name']))
+            
             # Calculer les différences
             qty_diff = received['quantity'] - original['quantity']
             price_diff = received['unit_price'] - original['unit_price']
@@ -2651,6 +2739,10 @@ def validate_order_manual():
                 }
                 price_manager.add_price(price_data)
         
+        # Mémoriser les rapprochements confirmés par la vérification
+        if alias_pairs:
+            price_manager.aliases.record_many(order['supplier'], alias_pairs, source='manual_verification')
+        
         # Mettre à jour le statut de la commande
         status = 'delivered_with_anomalies' if has_anomalies else 'delivered'
         comment = f'Vérification manuelle - {len(anomalies)} anomalie(s) détectée(s)' if has_anomalies else 'Vérification manuelle - Aucune anomalie'
@@ -2930,6 +3022,36 @@ def create_admin_client():
             'error': str(e)
         }), 500
 
+@app.route('/api/admin/invoices/migrate-details', methods=['POST'])
+@login_required
+@role_required('master_admin')
+def migrate_invoice_details():
+    """Alléger les anciennes factures: analyse complète déplacée vers le document de détail"""
+    try:
+        result = invoice_manager.migrate_to_detail_documents()
+        return jsonify(result), (200 if result.get('success') else 500)
+    except Exception as e:
+        logger.error(f"Erreur migration détails factures: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/admin/pending-products/migrate-ids', methods=['POST'])
+@login_required
+@role_required('master_admin')
+def migrate_pending_product_ids():
+    """Réindexer les anciens produits en attente sous leur id numérique (migration ponctuelle)"""
+    try:
+        result = price_manager.migrate_pending_doc_ids()
+        return jsonify(result), (200 if result.get('success') else 500)
+    except Exception as e:
+        logger.error(f"Erreur migration ids produits en attente: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/admin/restaurants', methods=['GET'])
 @login_required
 @role_required('master_admin')
@@ -3529,18 +3651,21 @@ def test_admin_email():
 def get_restaurant_suppliers():
     """Récupérer les fournisseurs du restaurant sélectionné (Firestore only)"""
     try:
-        user_context = auth_manager.get_user_context()
-        current_restaurant = user_context.get('restaurant')
+        from modules.supplier_manager import SupplierManager
+        supplier_manager = SupplierManager()
+        fetched = fetch_parallel({
+            'user_context': auth_manager.get_user_context,
+            'all_suppliers': supplier_manager.get_all_suppliers
+        })
+        current_restaurant = fetched['user_context'].get('restaurant')
         if not current_restaurant:
             return jsonify({
                 'success': False,
                 'error': 'Aucun restaurant sélectionné. Veuillez sélectionner un restaurant.',
                 'requires_restaurant': True
             }), 400
-        from modules.supplier_manager import SupplierManager
-        supplier_manager = SupplierManager()
         restaurant_suppliers = current_restaurant.get('suppliers', [])
-        all_suppliers = supplier_manager.get_all_suppliers()
+        all_suppliers = fetched['all_suppliers']
         # Filtrage strict : uniquement les fournisseurs explicitement associés (Firestore)
         filtered_suppliers = [s for s in all_suppliers if s['name'] in restaurant_suppliers]
         return jsonify({
@@ -3789,10 +3914,7 @@ def sync_remove_supplier():
                 'error': 'Paramètres manquants: restaurant_id, supplier_name'
             }), 400
             
-        from modules.sync_manager import SyncManager
-        sync_manager = SyncManager()
-        
-        result = sync_manager.sync_supplier_removal_to_group(restaurant_id, supplier_name)
+        result = sync_outbox.enqueue_supplier_removed(restaurant_id, supplier_name)
         return jsonify(result)
         
     except Exception as e:
@@ -3816,10 +3938,7 @@ def sync_full_suppliers():
                 'error': 'Paramètre manquant: restaurant_id'
             }), 400
             
-        from modules.sync_manager import SyncManager
-        sync_manager = SyncManager()
-        
-        result = sync_manager.sync_full_suppliers_list_to_group(restaurant_id)
+        result = sync_outbox.enqueue_full_suppliers(restaurant_id)
         return jsonify(result)
         
     except Exception as e:
@@ -3868,10 +3987,7 @@ def test_sync_supplier():
                 'error': 'Paramètres manquants: source_restaurant_id, supplier_name'
             }), 400
         
-        from modules.sync_manager import SyncManager
-        sync_manager = SyncManager()
-        
-        result = sync_manager.sync_suppliers_to_group(source_restaurant_id, supplier_name)
+        result = sync_outbox.enqueue_supplier_added(source_restaurant_id, supplier_name)
         return jsonify(result)
         
     except Exception as e:
@@ -3881,6 +3997,21 @@ def test_sync_supplier():
             'error': str(e)
         }), 500
 
+@app.route('/api/sync/outbox/status', methods=['GET'])
+@login_required
+@role_required('master_admin')
+def get_sync_outbox_status():
+    """Retard et échecs de la file de synchronisation, par groupe"""
+    try:
+        return jsonify(sync_outbox.get_status())
+        
+    except Exception as e:
+        logger.error(f"Erreur API sync outbox status: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ===== INTERFACE SYNCHRONISATION =====
 
 @app.route('/synchronisation')
@@ -4347,6 +4478,18 @@ def confirm_scan_verification():
         # Nettoyer le fichier temporaire
         os.remove(temp_scan_file)
 
+        # Mémoriser les rapprochements confirmés (libellé facture -> produit commandé)
+        try:
+            scan_order = order_manager.get_order_by_id(order_id)
+            if scan_order and scan_order.get('supplier'):
+                price_manager.aliases.record_many(scan_order['supplier'], [
+                    (item['invoice_product_name'], item['product_name'])
+                    for item in (scan_data.get('comparison') or {}).get('items', [])
+                    if item.get('invoice_product_name') and item.get('product_name')
+                ], source='scan_verification')
+        except Exception as alias_err:
+            logger.warning(f"⚠️ Alias produits non enregistrés: {alias_err}")
+
         # === NOUVEAUTÉ : créer la facture associée et mettre à jour la commande ===
         try:
             order = order_manager.get_order_by_id(order_id)
@@ -4407,13 +4550,22 @@ def compare_order_with_invoice(order, scanned_items):
             ordered_products[product_name] = item
             total_ordered += (item.get('quantity', 0) * item.get('unit_price', 0))
         
+        # Alias confirmés: libellé scanné -> produit du catalogue
+        canonical_names = price_manager.aliases.canonical_names(
+            order.get('supplier', ''), [item.get('name', '') for item in scanned_items]
+        ) if order.get('supplier') else [None] * len(scanned_items)
+        aliased_items = {}
+        for scanned_item, canonical_name in zip(scanned_items, canonical_names):
+            if canonical_name:
+                aliased_items.setdefault(normalize_product_name(canonical_name), scanned_item)
+        
         # Comparer chaque produit commandé
         for ordered_item in ordered_items:
             product_name = (ordered_item.get('product_name') or ordered_item.get('name', '')).lower().strip()
             
-            # Chercher le produit dans les items scannés
-            found_item = None
-            for scanned_item in scanned_items:
+            # Chercher le produit dans les items scannés (alias connu d'abord)
+            found_item = aliased_items.get(normalize_product_name(product_name))
+            for scanned_item in ([] if found_item else scanned_items):
                 scanned_name = scanned_item.get('name', '').lower().strip()
                 
                 # Comparaison simple (peut être améliorée avec de la logique floue)
@@ -4429,6 +4581,7 @@ def compare_order_with_invoice(order, scanned_items):
                 'received_quantity': found_item.get('quantity', 0) if found_item else 0,
                 'received_unit': found_item.get('unit', '') if found_item else '',
                 'received_price': found_item.get('price', 0) if found_item else 0,
+                'invoice_product_name': found_item.get('name') if found_item else None,
                 'status': 'not_found'
             }
             
@@ -4473,48 +4626,38 @@ def compare_order_with_invoice(order, scanned_items):
 @app.route('/api/anomalies/stats', methods=['GET'])
 @login_required
 def get_anomalies_stats():
-    """Récupérer les statistiques des anomalies"""
+    """Récupérer les statistiques des anomalies (compteurs tenus par le pipeline d'ingestion)"""
     try:
-        # Récupérer toutes les factures
-        all_invoices = invoice_manager.get_all_invoices(per_page=9999)['items']
-        
-        total_invoices = len(all_invoices)
-        invoices_with_anomalies = len([inv for inv in all_invoices if inv.get('has_anomalies', False)])
-        invoices_without_anomalies = total_invoices - invoices_with_anomalies
+        counters = invoice_ingest.get_counters()
         
-        # Compter les types d'anomalies
-        anomaly_types = {'quantity': 0, 'price': 0, 'missing': 0}
-        critical_anomalies = 0
+        if counters is None:
+            # Compteurs indisponibles: recomptage depuis toutes les factures
+            counters = {}
+            all_invoices = invoice_manager.get_all_invoices(
+                per_page=9999, fields=['supplier', 'has_anomalies', 'anomalies']
+            )['items']
+            for invoice in all_invoices:
+                add_counts(counters, invoice_anomaly_counts(invoice))
         
-        for invoice in all_invoices:
-            if invoice.get('anomalies'):
-                for product_anomaly in invoice['anomalies']:
-                    for anomaly in product_anomaly['anomalies']:
-                        anomaly_type = anomaly.get('type', 'unknown')
-                        if anomaly_type in anomaly_types:
-                            anomaly_types[anomaly_type] += 1
-                        if anomaly.get('severity') == 'critical':
-                            critical_anomalies += 1
-        
-        # Anomalies par fournisseur
-        supplier_anomalies = {}
-        for invoice in all_invoices:
-            if invoice.get('has_anomalies'):
-                supplier = invoice.get('supplier', 'Inconnu')
-                if supplier not in supplier_anomalies:
-                    supplier_anomalies[supplier] = 0
-                supplier_anomalies[supplier] += len(invoice.get('anomalies', []))
+        total_invoices = counters.get('total_invoices', 0)
+        invoices_with_anomalies = counters.get('invoices_with_anomalies', 0)
+        anomaly_types = counters.get('anomaly_types', {})
         
         return jsonify({
             'success': True,
             'data': {
                 'total_invoices': total_invoices,
                 'invoices_with_anomalies': invoices_with_anomalies,
-                'invoices_without_anomalies': invoices_without_anomalies,
+                'invoices_without_anomalies': total_invoices - invoices_with_anomalies,
                 'anomaly_rate': round((invoices_with_anomalies / total_invoices * 100) if total_invoices > 0 else 0, 1),
-                'anomaly_types': anomaly_types,
-                'critical_anomalies': critical_anomalies,
-                'supplier_anomalies': supplier_anomalies
+                'anomaly_types': {t: anomaly_types.get(t, 0) for t in ('quantity', 'price', 'missing')},
+                'critical_anomalies': counters.get('critical_anomalies', 0),
+                'supplier_anomalies': counters.get('supplier_anomalies', {}),
+                # Détection serveur (catalogue + statistiques de prix)
+                'detected_anomalies': counters.get('detected_anomalies', 0),
+                'detected_types': counters.get('detected_types', {}),
+                'detected_by_supplier': counters.get('detected_by_supplier', {}),
+                'montant_total_ecarts': round(counters.get('montant_total_ecarts', 0), 2)
             }
         })
     except Exception as e:
@@ -4751,9 +4894,8 @@ def validate_ai_suggestion(suggestion_id):
         from modules.ai_anomaly_detector import AIAnomalyDetector
         ai_detector = AIAnomalyDetector()
         
-        # Récupérer la suggestion
-        suggestions = ai_detector.get_pending_suggestions()
-        suggestion = next((s for s in suggestions if s['id'] == suggestion_id), None)
+        # Récupérer la suggestion (lecture directe par identifiant)
+        suggestion = ai_detector.get_suggestions_by_ids([suggestion_id]).get(suggestion_id)
         
         if not suggestion:
             return jsonify({
@@ -4837,57 +4979,78 @@ def bulk_validate_suggestions():
             'accepted': 0,
             'rejected': 0,
             'modified': 0,
-            'errors': []
+            'errors': [],
+            'items': []
         }
         
+        # Suggestions référencées lues une seule fois (get_all par identifiant)
+        suggestions = ai_detector.get_suggestions_by_ids([v.get('suggestion_id') for v in validations])
+        
+        counters = {'accept': 'accepted', 'modify': 'modified', 'reject': 'rejected'}
+        new_prices = []   # (item, price_data)
+        reviews = []      # (item, review)
+        seen = set()
+        
         for validation in validations:
+            suggestion_id = validation.get('suggestion_id')
+            decision = validation.get('decision')
+            item = {'suggestion_id': suggestion_id, 'decision': decision, 'success': False}
+            results['items'].append(item)
+            
+            suggestion = suggestions.get(suggestion_id)
+            if not suggestion or suggestion_id in seen:
+                item['error'] = f"Suggestion {suggestion_id} non trouvée" if not suggestion else f"Suggestion {suggestion_id} déjà traitée dans ce lot"
+                continue
+            if decision not in counters:
+                item['error'] = f"Décision invalide pour {suggestion_id}"
+                continue
+            
             try:
-                suggestion_id = validation.get('suggestion_id')
-                decision = validation.get('decision')
-                modified_price = validation.get('modified_price')
-                notes = validation.get('notes', '')
-                
-                # Récupérer la suggestion
-                suggestions = ai_detector.get_pending_suggestions()
-                suggestion = next((s for s in suggestions if s['id'] == suggestion_id), None)
-                
-                if not suggestion:
-                    results['errors'].append(f"Suggestion {suggestion_id} non trouvée")
-                    continue
-                
-                # Traiter selon la décision
-                if decision == 'accept':
-                    final_price = suggestion['suggested_new_price']
-                    results['accepted'] += 1
-                    
-                elif decision == 'modify':
-                    if not modified_price:
-                        results['errors'].append(f"Prix modifié requis pour {suggestion_id}")
+                if decision == 'modify':
+                    if not validation.get('modified_price'):
+                        item['error'] = f"Prix modifié requis pour {suggestion_id}"
                         continue
-                    final_price = float(modified_price)
-                    results['modified'] += 1
-                    
-                elif decision == 'reject':
-                    ai_detector.mark_suggestion_reviewed(suggestion_id, 'rejected', notes)
-                    results['rejected'] += 1
-                    continue
-                
-                # Appliquer la mise à jour de prix
-                if decision in ['accept', 'modify']:
-                    price_data = {
-                        'produit': suggestion['product_name'],
-                        'prix': final_price,
-                        'fournisseur': suggestion['supplier'],
-                        'categorie': 'Validation client IA (batch)',
-                        'date': datetime.now().isoformat(),
-                        'note': f"Suggestion IA {decision} par le client"
-                    }
-                    
-                    price_manager.add_price(price_data)
-                    ai_detector.mark_suggestion_reviewed(suggestion_id, decision, notes)
-                
-            except Exception as e:
-                results['errors'].append(f"Erreur pour {suggestion_id}: {str(e)}")
+                    final_price = float(validation['modified_price'])
+                elif decision == 'accept':
+                    final_price = suggestion['suggested_new_price']
+                else:
+                    final_price = None
+            except (TypeError, ValueError) as e:
+                item['error'] = f"Erreur pour {suggestion_id}: {str(e)}"
+                continue
+            
+            seen.add(suggestion_id)
+            if final_price is not None:
+                item['final_price'] = final_price
+                new_prices.append((item, {
+                    'produit': suggestion['product_name'],
+                    'prix': final_price,
+                    'fournisseur': suggestion['supplier'],
+                    'categorie': 'Validation client IA (batch)',
+                    'date': datetime.now().isoformat(),
+                    'note': f"Suggestion IA {decision} par le client"
+                }))
+            reviews.append((item, {'id': suggestion_id, 'decision': 'rejected' if decision == 'reject' else decision,
+                                   'notes': validation.get('notes', '')}))
+        
+        # Nouveaux prix en écritures groupées; une suggestion n'est marquée traitée que si son prix est écrit
+        price_ids = price_manager.add_prices([price_data for _, price_data in new_prices])
+        for (item, _), price_id in zip(new_prices, price_ids):
+            if price_id:
+                item['price_id'] = price_id
+            else:
+                item['error'] = f"Erreur pour {item['suggestion_id']}: prix non enregistré"
+        
+        reviews = [(item, review) for item, review in reviews if 'error' not in item]
+        if ai_detector.mark_suggestions_reviewed([review for _, review in reviews]):
+            for item, _ in reviews:
+                item['success'] = True
+                results[counters[item['decision']]] += 1
+        else:
+            for item, _ in reviews:
+                item['error'] = f"Erreur pour {item['suggestion_id']}: statut non mis à jour"
+        
+        results['errors'] = [item['error'] for item in results['items'] if item.get('error')]
         
         return jsonify({
             'success': True,
@@ -4913,8 +5076,15 @@ def bulk_validate_suggestions():
 def get_verifiable_orders():
     """Récupérer les commandes vérifiables (date de livraison passée ou aujourd'hui) FILTRÉES PAR RESTAURANT"""
     try:
-        # Récupérer le contexte utilisateur pour le restaurant
-        user_context = auth_manager.get_user_context()
+        # Contexte utilisateur et commandes lus en parallèle (lectures indépendantes)
+        fetched = fetch_parallel({
+            'user_context': auth_manager.get_user_context,
+            'all_orders': lambda: order_manager.get_all_orders(
+                page=1,
+                per_page=9999  # Récupérer toutes les commandes
+            )
+        })
+        user_context = fetched['user_context']
         current_restaurant = user_context.get('restaurant')
         
         # Paramètres de filtrage
@@ -4930,11 +5100,8 @@ def get_verifiable_orders():
             logger.info(f"🔍 Filtrage commandes vérifiables - Restaurant: {current_restaurant.get('name')} (ID: {restaurant_id})")
             logger.info(f"🏪 Fournisseurs autorisés: {restaurant_suppliers}")
         
-        # Récupérer TOUTES les commandes puis filtrer manuellement
-        all_orders = order_manager.get_all_orders(
-            page=1,
-            per_page=9999  # Récupérer toutes les commandes
-        )
+        # TOUTES les commandes (lues ci-dessus) filtrées manuellement
+        all_orders = fetched['all_orders']
         
         # DOUBLE FILTRAGE: par restaurant_id ET par fournisseurs
         restaurant_orders = []
@@ -5082,9 +5249,8 @@ def validate_supplier_pending_product(supplier_name, pending_id):
         user_context = auth_manager.get_user_context()
         current_restaurant = user_context.get('restaurant')
         
-        # Récupérer le produit en attente
-        all_pending = price_manager.get_pending_products()
-        pending_product = next((p for p in all_pending if p.get('id') == pending_id), None)
+        # Récupérer le produit en attente (lecture directe par id)
+        pending_product = price_manager.get_pending_product(pending_id)
         
         if not pending_product:
             return jsonify({
@@ -5385,4 +5551,4 @@ if __name__ == '__main__':
     print("   • Factures: http://localhost:5003/factures")
     
     # Démarrer le serveur
-   app.run(debug=False, port=int(os.environ.get('PORT', 8000)), host='0.0.0.0')
\ No newline at end of file
+    app.run(debug=False, port=int(os.environ.get('PORT', 8000)), host='0.0.0.0')
\ No newline at end of file
@@ -7,11 +7,42 @@ Système intelligent pour détecter les patterns d'anomalies et SUGGÉRER des mi
 
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
+import uuid
+import json
+import hashlib
 import logging
 from collections import defaultdict, Counter
 
+import numpy as np
+import pandas as pd
+
+from modules.price_stats_store import PriceStatsStore, stats_key, ANOMALY_COLLECTION
+
 logger = logging.getLogger(__name__)
 
+# Limite Firestore: 500 écritures par batch
+HISTORY_BATCH_SIZE = 400
+
+
+def scan_fingerprint(scan_result: Dict) -> str:
+    """
+    Identifiant stable d'un scan du batch (clé des observations de prix)
+
+    Identifiant fourni par le client s'il existe, sinon empreinte du contenu: un même
+    batch posté deux fois produit les mêmes identifiants d'observation.
+    """
+    explicit = scan_result.get('scan_id') or scan_result.get('invoice_id') or scan_result.get('id')
+    if explicit:
+        return str(explicit)
+    content = json.dumps({
+        'supplier': scan_result.get('supplier'),
+        'invoice_number': scan_result.get('invoice_number'),
+        'analysis_timestamp': scan_result.get('analysis_timestamp'),
+        'price_variations': (scan_result.get('price_comparison') or {}).get('price_variations', [])
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:20]
+
+
 class AIAnomalyDetector:
     def __init__(self):
         self.confidence_threshold = 0.8  # Seuil de confiance pour suggestions
@@ -30,6 +61,10 @@ class AIAnomalyDetector:
             print(f"❌ Erreur initialisation Firestore AIAnomalyDetector: {e}")
             self._fs_enabled = False
             self._fs = None
+        
+        # Statistiques glissantes par (fournisseur, produit) des prix signalés en anomalie
+        # (collection propre: price_stats décrit toutes les lignes des factures sauvegardées)
+        self.price_stats = PriceStatsStore(self._fs, collection=ANOMALY_COLLECTION)
     
     def _load_anomaly_history(self) -> List[Dict]:
         """Charger l'historique des anomalies détectées depuis Firestore"""
@@ -61,9 +96,15 @@ class AIAnomalyDetector:
             if not self._fs_enabled or not self._fs:
                 return
             
-            for anomaly in anomalies:
-                anomaly_id = f"hist_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{anomaly.get('product_name', 'unknown')}"
-                self._fs.collection('anomaly_history').document(anomaly_id).set(anomaly)
+            # Identifiant unique même pour deux anomalies du même produit dans la même seconde
+            collection = self._fs.collection('anomaly_history')
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            for start in range(0, len(anomalies), HISTORY_BATCH_SIZE):
+                batch = self._fs.batch()
+                for anomaly in anomalies[start:start + HISTORY_BATCH_SIZE]:
+                    anomaly_id = f"hist_{timestamp}_{uuid.uuid4().hex[:12]}"
+                    batch.set(collection.document(anomaly_id), anomaly)
+                batch.commit()
         except Exception as e:
             logger.error(f"Erreur sauvegarde historique anomalies: {e}")
     
@@ -73,9 +114,13 @@ class AIAnomalyDetector:
             if not self._fs_enabled or not self._fs:
                 return
             
-            for suggestion in suggestions:
-                suggestion_id = suggestion.get('id', f"sugg_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-                self._fs.collection('ai_suggestions').document(suggestion_id).set(suggestion)
+            collection = self._fs.collection('ai_suggestions')
+            for start in range(0, len(suggestions), HISTORY_BATCH_SIZE):
+                batch = self._fs.batch()
+                for suggestion in suggestions[start:start + HISTORY_BATCH_SIZE]:
+                    suggestion_id = suggestion.get('id') or f"sugg_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+                    batch.set(collection.document(suggestion_id), suggestion)
+                batch.commit()
         except Exception as e:
             logger.error(f"Erreur sauvegarde suggestions IA: {e}")
     
@@ -102,11 +147,14 @@ class AIAnomalyDetector:
         
         # Collecter toutes les anomalies du batch
         all_anomalies = []
+        observation_ids = []
         supplier_stats = defaultdict(lambda: {'total_products': 0, 'anomalies': 0})
         
         for scan_result in batch_results:
             scan_anomalies = self._extract_anomalies_from_scan(scan_result)
             all_anomalies.extend(scan_anomalies)
+            scan_key = scan_fingerprint(scan_result)
+            observation_ids.extend(f"{scan_key}:{line}" for line in range(len(scan_anomalies)))
             
             # Statistiques par fournisseur
             supplier = scan_result.get('supplier', 'Inconnu')
@@ -118,8 +166,19 @@ class AIAnomalyDetector:
         
         analysis['anomalies_detected'] = len(all_anomalies)
         
+        # 📈 Statistiques glissantes mises à jour avec les anomalies du batch
+        # (clé scan:ligne: un batch reposté n'est pas compté deux fois)
+        history = self.price_stats.observe_many({
+            'supplier': a['supplier'],
+            'product_name': a['product_name'],
+            'price': a['invoice_price'],
+            'reference_price': a['reference_price'],
+            'date': a['scan_date'],
+            'observation_id': observation_id
+        } for a, observation_id in zip(all_anomalies, observation_ids))
+        
         # 🧠 DÉTECTION INTELLIGENTE DES PATTERNS
-        patterns = self._detect_intelligent_patterns(all_anomalies)
+        patterns = self._detect_intelligent_patterns(all_anomalies, history)
         analysis['recurring_price_patterns'] = patterns
         analysis['summary']['patterns_detected'] = len(patterns)
         
@@ -163,75 +222,114 @@ class AIAnomalyDetector:
         
         return anomalies
     
-    def _detect_intelligent_patterns(self, anomalies: List[Dict]) -> List[Dict]:
+    def _detect_intelligent_patterns(self, anomalies: List[Dict], history: Dict = None) -> List[Dict]:
         """
         🧠 DÉTECTION INTELLIGENTE DES PATTERNS
         Identifie les produits avec des anomalies récurrentes qui pourraient indiquer un changement de prix
-        """
-        patterns = []
         
-        # Grouper par produit + fournisseur
-        product_groups = defaultdict(list)
-        for anomaly in anomalies:
-            key = f"{anomaly['product_name']}_{anomaly['supplier']}"
-            product_groups[key].append(anomaly)
+        Pipeline colonnaire: colonnes numpy de toutes les anomalies du batch, agrégations
+        groupées par bincount (effectif, moyenne, écart-type, variation moyenne, tendance)
+        et score de confiance vectorisé. Sommes accumulées dans l'ordre des anomalies, comme
+        l'implémentation de référence de benchmark_ai_patterns.py: mêmes résultats.
         
-        # Analyser chaque groupe
-        for group_key, group_anomalies in product_groups.items():
-            if len(group_anomalies) >= self.pattern_min_occurrences:
-                pattern = self._analyze_pattern_group(group_key, group_anomalies)
-                if pattern:
-                    patterns.append(pattern)
+        Tendance: pente des moindres carrés du prix selon le rang d'occurrence, rapportée
+        à la moyenne du groupe (champ price_trend ajouté aux patterns, sans effet sur la
+        confiance: les seuils de suggestion restent ceux de l'analyse groupe par groupe).
         
-        return patterns
-    
-    def _analyze_pattern_group(self, group_key: str, anomalies: List[Dict]) -> Optional[Dict]:
-        """Analyser un groupe d'anomalies pour détecter un pattern"""
+        history: statistiques glissantes {(fournisseur, produit normalisé): état} incluant le
+        batch; les occurrences et la consistance portent alors sur tout l'historique.
+        """
         if not anomalies:
-            return None
-        
-        # Statistiques du groupe
-        prices = [a['invoice_price'] for a in anomalies]
-        percentages = [a['percentage_difference'] for a in anomalies]
+            return []
+        history = history or {}
+        
+        # Codes de groupe (ordre de première apparition) et colonnes numériques
+        codes, group_keys = pd.factorize(np.array([f"{a['product_name']}_{a['supplier']}" for a in anomalies],
+                                                  dtype=object))
+        n_groups = len(group_keys)
+        prices = np.fromiter((a['invoice_price'] for a in anomalies), dtype=np.float64, count=len(anomalies))
+        percentages = np.fromiter((a['percentage_difference'] for a in anomalies), dtype=np.float64,
+                                  count=len(anomalies))
+        
+        count = np.bincount(codes, minlength=n_groups)
+        price_mean = np.bincount(codes, weights=prices, minlength=n_groups) / count
+        # Écart-type de population: moyenne des carrés des écarts à la moyenne du groupe
+        price_var = np.bincount(codes, weights=(prices - price_mean[codes]) ** 2, minlength=n_groups) / count
+        percentage_mean = np.bincount(codes, weights=percentages, minlength=n_groups) / count
+        
+        # Première et dernières lignes de chaque groupe (tri stable: ordre d'origine conservé)
+        order = np.argsort(codes, kind='stable')
+        ends = np.cumsum(count)
+        starts = ends - count
+        first_rows = order[starts]
+        
+        # Tendance par groupe: rang de chaque anomalie dans son groupe, pente Sxy / Sxx
+        rank = np.empty(len(anomalies))
+        rank[order] = np.arange(len(anomalies)) - np.repeat(starts, count)
+        rank_mean = (count - 1) / 2
+        sxx = count * (count ** 2 - 1) / 12
+        sxy = np.bincount(codes, weights=(rank - rank_mean[codes]) * (prices - price_mean[codes]),
+                          minlength=n_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trend = np.where((sxx > 0) & (price_mean > 0), sxy / sxx / price_mean, 0.0)
+        
+        # Historique aligné sur les groupes (une lecture de dict par groupe)
+        if history:
+            stats = [history.get(stats_key(anomalies[row]['supplier'], anomalies[row]['product_name']))
+                     for row in first_rows]
+        else:
+            stats = [None] * n_groups
+        hist_count = np.array([st['count'] if st else 0 for st in stats], dtype=np.int64)
+        use_history = hist_count >= count
+        
+        occurrences = np.maximum(count, hist_count)
+        if use_history.any():
+            price_mean = np.where(use_history, [st['mean'] if st else 0.0 for st in stats], price_mean)
+            price_std = np.where(use_history, [st['std'] if st else 0.0 for st in stats], np.sqrt(price_var))
+            new_price = np.where(use_history, [st['ewma'] if st else 0.0 for st in stats], price_mean)
+        else:
+            price_std = np.sqrt(price_var)
+            new_price = price_mean
         
-        price_mean = sum(prices) / len(prices)
-        price_std = (sum((p - price_mean) ** 2 for p in prices) / len(prices)) ** 0.5
-        percentage_mean = sum(percentages) / len(percentages)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variation = np.where(price_mean > 0, price_std / price_mean, np.inf)
+        # Récurrent et consistant (coefficient de variation < 20%)
+        selected = (occurrences >= self.pattern_min_occurrences) & (variation < 0.20)
+        confidence = np.minimum(1.0, 0.6 + np.minimum(0.2, occurrences * 0.1) + (1 - variation) * 0.2)
         
-        # Vérifier la consistance (coefficient de variation < 20%)
-        if price_std / price_mean < 0.20:
-            confidence = self._calculate_pattern_confidence(anomalies, price_std, price_mean)
-            
-            return {
-                'group_key': group_key,
-                'product_name': anomalies[0]['product_name'],
-                'supplier': anomalies[0]['supplier'],
-                'occurrences': len(anomalies),
-                'consistent_new_price': round(price_mean, 2),
-                'old_reference_price': anomalies[0]['reference_price'],
-                'average_percentage_change': round(percentage_mean, 1),
-                'price_consistency': round(1 - (price_std / price_mean), 2),
-                'confidence_score': confidence,
-                'total_impact': sum(a.get('total_impact', 0) for a in anomalies),
-                'evidence': [
-                    f"Prix facturé: {a['invoice_price']}€ le {a['scan_date'][:10]}" 
-                    for a in anomalies[-3:]  # Dernières 3 occurrences
+        patterns = []
+        for group in np.nonzero(selected)[0]:
+            group_rows = order[starts[group]:ends[group]]
+            first = anomalies[group_rows[0]]
+            st = stats[group] if use_history[group] else None
+            if st:
+                reference_price = st.get('reference_price', first['reference_price'])
+                evidence = [
+                    f"Prix facturé: {o['price']}€ le {(o.get('date') or '')[:10]}"
+                    for o in st.get('recent', [])[-3:]
                 ]
-            }
-        
-        return None
-    
-    def _calculate_pattern_confidence(self, anomalies: List[Dict], price_std: float, price_mean: float) -> float:
-        """Calculer la confiance d'un pattern"""
-        base_confidence = 0.6
-        
-        # Bonus pour nombre d'occurrences
-        occurrence_bonus = min(0.2, len(anomalies) * 0.1)
-        
-        # Bonus pour consistance des prix
-        consistency_bonus = (1 - (price_std / price_mean)) * 0.2
+            else:
+                reference_price = first['reference_price']
+                evidence = [
+                    f"Prix facturé: {anomalies[row]['invoice_price']}€ le {anomalies[row]['scan_date'][:10]}"
+                    for row in group_rows[-3:]  # Dernières 3 occurrences
+                ]
+            patterns.append({
+                'group_key': group_keys[group],
+                'product_name': first['product_name'],
+                'supplier': first['supplier'],
+                'occurrences': int(occurrences[group]),
+                'consistent_new_price': round(float(new_price[group]), 2),
+                'old_reference_price': reference_price,
+                'average_percentage_change': round(float(percentage_mean[group]), 1),
+                'price_consistency': round(float(1 - variation[group]), 2),
+                'confidence_score': float(confidence[group]),
+                'total_impact': sum(anomalies[row].get('total_impact', 0) for row in group_rows),
+                'evidence': evidence,
+                'price_trend': round(float(trend[group]), 4)
+            })
         
-        return min(1.0, base_confidence + occurrence_bonus + consistency_bonus)
+        return patterns
     
     def _generate_price_suggestions(self, patterns: List[Dict]) -> List[Dict]:
         """
@@ -243,7 +341,7 @@ class AIAnomalyDetector:
         for pattern in patterns:
             if pattern['confidence_score'] >= 0.6:  # Seuil plus bas pour suggestions
                 suggestion = {
-                    'id': f"suggestion_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{pattern['group_key']}",
+                    'id': f"suggestion_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{pattern['group_key']}",
                     'type': 'price_update_suggestion',
                     'product_name': pattern['product_name'],
                     'supplier': pattern['supplier'],
@@ -340,6 +438,53 @@ class AIAnomalyDetector:
             logger.error(f"Erreur récupération suggestions en attente: {e}")
             return []
     
+    def get_suggestions_by_ids(self, suggestion_ids: List[str], pending_only: bool = True) -> Dict[str, Dict]:
+        """Suggestions demandées, lues en un get_all sur leurs identifiants: {id: suggestion}"""
+        try:
+            if not self._fs_enabled or not self._fs:
+                return {}
+            
+            collection = self._fs.collection('ai_suggestions')
+            unique_ids = list(dict.fromkeys(sid for sid in suggestion_ids if sid))
+            if not unique_ids:
+                return {}
+            suggestions = {}
+            for snapshot in self._fs.get_all([collection.document(sid) for sid in unique_ids]):
+                if not snapshot.exists:
+                    continue
+                suggestion = snapshot.to_dict()
+                if pending_only and suggestion.get('status') != 'pending_validation':
+                    continue
+                suggestion.setdefault('id', snapshot.id)
+                suggestions[snapshot.id] = suggestion
+            return suggestions
+        except Exception as e:
+            logger.error(f"Erreur lecture suggestions par id: {e}")
+            return {}
+    
+    def mark_suggestions_reviewed(self, reviews: List[Dict]) -> bool:
+        """Marquer plusieurs suggestions examinées ({'id', 'decision', 'notes'}) en écritures groupées"""
+        try:
+            if not self._fs_enabled or not self._fs:
+                return False
+            
+            collection = self._fs.collection('ai_suggestions')
+            reviewed_at = datetime.now().isoformat()
+            for start in range(0, len(reviews), HISTORY_BATCH_SIZE):
+                batch = self._fs.batch()
+                for review in reviews[start:start + HISTORY_BATCH_SIZE]:
+                    batch.update(collection.document(review['id']), {
+                        'status': 'reviewed',
+                        'client_decision': review['decision'],
+                        'client_notes': review.get('notes', ''),
+                        'reviewed_at': reviewed_at
+                    })
+                batch.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Erreur mise à jour suggestions: {e}")
+            return False
+    
     def mark_suggestion_reviewed(self, suggestion_id: str, client_decision: str, notes: str = '') -> bool:
         """Marquer une suggestion comme examinée par le client"""
         try:
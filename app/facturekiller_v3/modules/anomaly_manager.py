@@ -8,10 +8,15 @@ from datetime import datetime
 from typing import Dict, List, Optional, Any
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Limite Firestore: 500 écritures par batch
+ANOMALY_BATCH_SIZE = 400
+
 class AnomalyManager:
-    def __init__(self):
+    def __init__(self, price_manager=None):
         # Initialiser Firestore
         try:
             from modules.firestore_db import get_client
@@ -25,51 +30,131 @@ class AnomalyManager:
             print(f"❌ Erreur initialisation Firestore AnomalyManager: {e}")
             self._fs_enabled = False
             self._fs = None
+        self._sequences = None
+        # PriceManager de l'application (injecté): son index du catalogue est tenu à jour
+        # à chaque écriture de prix, une instance privée resterait périmée jusqu'au TTL
+        self._price_manager = price_manager
+    
+    def _get_price_manager(self):
+        """PriceManager partagé (instance privée seulement hors application)"""
+        if self._price_manager is None:
+            from modules.price_manager import PriceManager
+            self._price_manager = PriceManager()
+        return self._price_manager
+    
+    def _catalogue_prices(self, facture_products) -> np.ndarray:
+        """
+        Prix catalogue de chaque ligne (0 si inconnu), résolus par restaurant en un lot
+        
+        Libellé exact ou alias confirmé uniquement: un rapprochement flou pourrait
+        signaler un écart de prix contre un autre produit.
+        """
+        price_manager = self._get_price_manager()
+        prix_catalogue = np.zeros(len(facture_products))
+        by_restaurant: Dict[str, List[int]] = {}
+        for index, product in enumerate(facture_products):
+            by_restaurant.setdefault(product.get('restaurant', 'Général'), []).append(index)
+        
+        for restaurant, indexes in by_restaurant.items():
+            lines = [facture_products[i] for i in indexes]
+            for index, ref_price in zip(indexes, price_manager.find_product_prices(lines, restaurant, exact_only=True)):
+                if ref_price:
+                    prix_catalogue[index] = float(ref_price.get('prix_unitaire') or ref_price.get('prix') or 0)
+        return prix_catalogue
     
-    def detect_price_anomalies(self, facture_products, seuil_pourcent=10, seuil_euros=2):
+    def detect_price_anomalies(self, facture_products, seuil_pourcent=10, seuil_euros=2,
+                               save=False, facture_id=None):
         """
         Détecter les anomalies de prix automatiquement
+        
+        Toutes les lignes de la facture sont résolues en un lot contre le catalogue, les
+        écarts calculés en une opération vectorielle; save=True persiste les anomalies
+        en un seul batch (identifiants renseignés dans les dicts retournés).
         """
-        from modules.price_manager import PriceManager
+        if not facture_products:
+            return []
+        
+        prix_facture = np.array([float(p.get('unit_price', 0) or 0) for p in facture_products])
+        prix_catalogue = self._catalogue_prices(facture_products)
+        
+        # Écarts vectorisés (lignes sans prix catalogue ignorées)
+        known = prix_catalogue > 0
+        ecart_euros = np.where(known, prix_facture - prix_catalogue, 0.0)
+        ecart_pourcent = np.divide(ecart_euros, prix_catalogue, out=np.zeros_like(ecart_euros), where=known) * 100
+        flagged = known & ((np.abs(ecart_pourcent) >= seuil_pourcent) | (np.abs(ecart_euros) >= seuil_euros))
         
+        date_detection = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         anomalies = []
-        price_manager = PriceManager()
+        for index in np.nonzero(flagged)[0]:
+            product = facture_products[index]
+            anomalies.append({
+                'produit_nom': product['name'],
+                'fournisseur': product.get('supplier', ''),
+                'restaurant': product.get('restaurant', 'Général'),
+                'type_anomalie': 'prix_different',
+                'prix_facture': float(prix_facture[index]),
+                'prix_catalogue': float(prix_catalogue[index]),
+                'ecart_euros': round(float(ecart_euros[index]), 2),
+                'ecart_pourcent': round(float(ecart_pourcent[index]), 1),
+                'statut': 'detectee',
+                'date_detection': date_detection
+            })
         
-        for product in facture_products:
-            # Rechercher le prix catalogue
-            catalogue_price = price_manager.find_product_price(
-                product['name'], 
-                product.get('supplier', ''),
-                product.get('restaurant', 'Général')
-            )
-            
-            if catalogue_price:
-                prix_facture = float(product.get('unit_price', 0))
-                prix_catalogue = float(catalogue_price.get('prix_unitaire', 0))
-                
-                # Calculer l'écart
-                if prix_catalogue > 0:
-                    ecart_euros = prix_facture - prix_catalogue
-                    ecart_pourcent = (ecart_euros / prix_catalogue) * 100
-                    
-                    # Détecter anomalie
-                    if abs(ecart_pourcent) >= seuil_pourcent or abs(ecart_euros) >= seuil_euros:
-                        anomalie = {
-                            'produit_nom': product['name'],
-                            'fournisseur': product.get('supplier', ''),
-                            'restaurant': product.get('restaurant', 'Général'),
-                            'type_anomalie': 'prix_different',
-                            'prix_facture': prix_facture,
-                            'prix_catalogue': prix_catalogue,
-                            'ecart_euros': round(ecart_euros, 2),
-                            'ecart_pourcent': round(ecart_pourcent, 1),
-                            'statut': 'detectee',
-                            'date_detection': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        }
-                        anomalies.append(anomalie)
+        if save and anomalies:
+            self.save_anomalies(anomalies, facture_id)
         
         return anomalies
     
+    def save_anomalies(self, anomalies: List[Dict[str, Any]], facture_id=None,
+                       raise_errors: bool = False) -> List[str]:
+        """
+        Sauvegarder plusieurs anomalies: un bloc de numéros réservé, écritures en batch (facture_id propre à chaque anomalie prioritaire)
+        
+        Si toutes les anomalies portent déjà un 'id' (identifiants déterministes du pipeline
+        d'ingestion), il est conservé: réécrire le même lot est alors sans effet.
+        raise_errors: propager l'échec au lieu de retourner [] (l'appelant retente)
+        """
+        try:
+            if not self._fs_enabled or not self._fs:
+                logger.error("Firestore non disponible pour sauvegarder les anomalies")
+                if raise_errors:
+                    raise RuntimeError("Firestore non disponible pour sauvegarder les anomalies")
+                return []
+            if not anomalies:
+                return []
+            
+            now = datetime.now()
+            preset_ids = all(anomalie.get('id') for anomalie in anomalies)
+            if not preset_ids:
+                last_number = self._get_next_anomaly_number(now, count=len(anomalies))
+                first_number = last_number - len(anomalies) + 1
+            collection = self._fs.collection('anomalies')
+            anomalie_ids = []
+            
+            for start in range(0, len(anomalies), ANOMALY_BATCH_SIZE):
+                batch = self._fs.batch()
+                for offset, anomalie_data in enumerate(anomalies[start:start + ANOMALY_BATCH_SIZE], start):
+                    if preset_ids:
+                        anomalie_id = anomalie_data['id']
+                    else:
+                        anomalie_id = f"ANOM_{now.strftime('%Y%m%d_%H%M%S')}_{first_number + offset}"
+                    anomalie_data['id'] = anomalie_id
+                    anomalie_data['facture_id'] = anomalie_data.get('facture_id') or facture_id
+                    anomalie_data.setdefault('created_at', now.isoformat())
+                    anomalie_data.setdefault('updated_at', now.isoformat())
+                    batch.set(collection.document(anomalie_id), anomalie_data)
+                    anomalie_ids.append(anomalie_id)
+                batch.commit()
+            
+            logger.info(f"{len(anomalie_ids)} anomalie(s) sauvegardée(s) en batch")
+            return anomalie_ids
+            
+        except Exception as e:
+            logger.error(f"Erreur sauvegarde anomalies: {e}")
+            if raise_errors:
+                raise
+            return []
+    
     def save_anomaly(self, anomalie_data, facture_id=None):
         """Sauvegarder une nouvelle anomalie dans Firestore"""
         try:
@@ -78,7 +163,8 @@ class AnomalyManager:
                 return None
             
             # Générer un ID unique
-            anomalie_id = f"ANOM_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self._get_next_anomaly_number()}"
+            now = datetime.now()
+            anomalie_id = f"ANOM_{now.strftime('%Y%m%d_%H%M%S')}_{self._get_next_anomaly_number(now)}"
             
             anomalie_data['id'] = anomalie_id
             anomalie_data['facture_id'] = facture_id
@@ -95,15 +181,17 @@ class AnomalyManager:
             logger.error(f"Erreur sauvegarde anomalie: {e}")
             return None
     
-    def _get_next_anomaly_number(self):
-        """Obtenir le prochain numéro d'anomalie"""
-        try:
-            if not self._fs_enabled or not self._fs:
-                return 1
-            docs = list(self._fs.collection('anomalies').stream())
-            return len(docs) + 1
-        except:
+    def _get_next_anomaly_number(self, now: datetime = None, count: int = 1):
+        """Obtenir le prochain numéro d'anomalie (compteur transactionnel journalier; dernier du bloc si count > 1)"""
+        now = now or datetime.now()
+        if not self._fs_enabled or not self._fs:
             return 1
+        if self._sequences is None:
+            from modules.sequence_service import SequenceService
+            self._sequences = SequenceService(self._fs)
+        # L'identifiant porte déjà la date: un compteur par jour suffit à l'unicité
+        number = self._sequences.next_value('anomaly_number', scope=now.strftime('%Y%m%d'), count=count)
+        return number if number is not None else now.microsecond + count - 1
     
     def get_anomalies(self, statut=None, fournisseur=None, restaurant=None):
         """Récupérer les anomalies avec filtres depuis Firestore"""
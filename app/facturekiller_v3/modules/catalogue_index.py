@@ -0,0 +1,262 @@
+"""
+Index de similarité du catalogue de prix, par fournisseur
+Chargé une fois par fournisseur (une requête Firestore), interrogé en mémoire: noms
+normalisés, trigrammes indexés (ProductMatcher) et tailles/conditionnements extraits
+pour départager les variantes (BAVETTE 180/200 vs 220/240)
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from modules.product_matcher import ProductMatcher
+
+logger = logging.getLogger(__name__)
+
+# Score minimum pour substituer un prix du catalogue à un libellé non exact
+CATALOGUE_MATCH_THRESHOLD = 0.75
+# Tailles incompatibles (1KG vs 5KG): score multiplié par ce facteur
+SIZE_MISMATCH_PENALTY = 0.85
+# Les écritures des autres workers sont reprises au plus tard après ce délai (secondes)
+CATALOGUE_INDEX_TTL = int(os.getenv('CATALOGUE_INDEX_TTL', '300'))
+
+_UNITS = {
+    'KG': 'KG', 'KGS': 'KG', 'G': 'G', 'GR': 'G', 'GRS': 'G',
+    'L': 'L', 'LT': 'L', 'CL': 'CL', 'ML': 'ML',
+    'PC': 'PC', 'PCS': 'PC', 'PIECE': 'PC', 'PIECES': 'PC', 'X': 'X', '%': '%'
+}
+_SIZE_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(%|(?:KGS?|GRS?|G|LT|L|CL|ML|PCS?|PIECES?)\b)'
+                      r'|\bX\s*(\d+)\b|(\d+)\s*X\b'
+                      r'|\b(\d+)\s*/\s*(\d+)\b')
+
+
+def extract_sizes(name: str) -> FrozenSet[str]:
+    """Tailles et conditionnements d'un libellé: {'1KG', 'X6', '220/240', '35%'}"""
+    sizes = set()
+    for match in _SIZE_RE.finditer((name or '').upper()):
+        value, unit, pack_after, pack_before, low, high = match.groups()
+        if value:
+            sizes.add(f"{float(value.replace(',', '.')):g}{_UNITS[unit]}")
+        elif pack_after or pack_before:
+            sizes.add(f"X{int(pack_after or pack_before)}")
+        else:
+            sizes.add(f"{int(low)}/{int(high)}")
+    return frozenset(sizes)
+
+
+def exact_label(name: str) -> str:
+    """Libellé brut comparé sans casse ni espaces de bord (tailles et petits mots conservés)"""
+    return (name or '').casefold().strip()
+
+
+class _SupplierIndex:
+    """
+    Catalogue d'un fournisseur: entrées {doc_id: prix}, matcher et masques reconstruits
+    à la demande après une modification
+    """
+
+    def __init__(self, entries: Dict[str, Dict[str, Any]]):
+        self.entries = entries
+        self.loaded_at = time.monotonic()
+        self.invalidate()
+
+    def invalidate(self):
+        self.matcher: Optional[ProductMatcher] = None
+        self.rows: List[Dict[str, Any]] = []
+        self._has_size = None
+        self._labels: Dict[str, List[int]] = {}
+        self._size_masks: Dict[str, np.ndarray] = {}
+        self._restaurant_masks: Dict[str, np.ndarray] = {}
+
+    def build(self) -> '_SupplierIndex':
+        if self.matcher is None:
+            self.rows = list(self.entries.values())
+            names = [row.get('produit', '') for row in self.rows]
+            sizes = [extract_sizes(name) for name in names]
+            self._has_size = np.array([bool(size) for size in sizes], dtype=bool)
+            for col, name in enumerate(names):
+                self._labels.setdefault(exact_label(name), []).append(col)
+            columns: Dict[str, List[int]] = {}
+            for col, size in enumerate(sizes):
+                for token in size:
+                    columns.setdefault(token, []).append(col)
+            for token, cols in columns.items():
+                mask = np.zeros(len(self.rows), dtype=bool)
+                mask[cols] = True
+                self._size_masks[token] = mask
+            self.matcher = ProductMatcher(names)
+        return self
+
+    def size_mismatch(self, query_sizes: FrozenSet[str]) -> np.ndarray:
+        """Colonnes dont les tailles sont toutes incompatibles avec celles du libellé"""
+        compatible = np.zeros(len(self.rows), dtype=bool)
+        if not query_sizes:
+            return compatible
+        for token in query_sizes:
+            mask = self._size_masks.get(token)
+            if mask is not None:
+                compatible |= mask
+        return self._has_size & ~compatible
+
+    def exact_columns(self, name: str) -> List[int]:
+        """Colonnes dont le libellé brut est celui demandé"""
+        return self._labels.get(exact_label(name), [])
+
+    def restaurant_mask(self, restaurant: str) -> np.ndarray:
+        """Colonnes utilisables pour ce restaurant (prix du restaurant ou généraux)"""
+        mask = self._restaurant_masks.get(restaurant)
+        if mask is None:
+            mask = np.array([row.get('restaurant') in (None, '', restaurant, 'Général') for row in self.rows],
+                            dtype=bool)
+            self._restaurant_masks[restaurant] = mask
+        return mask
+
+
+class CatalogueIndex:
+    """Recherche floue top-k dans le catalogue de prix de chaque fournisseur"""
+
+    def __init__(self, fs_client: Any = None, ttl: int = CATALOGUE_INDEX_TTL):
+        self._fs = fs_client
+        self._fs_enabled = fs_client is not None
+        self.ttl = ttl
+        self._suppliers: Dict[str, _SupplierIndex] = {}
+        self._lock = threading.RLock()
+
+    # ===== CHARGEMENT =====
+
+    def _load(self, supplier: str) -> Optional[_SupplierIndex]:
+        """Index du fournisseur, chargé (ou rechargé après TTL) en une requête"""
+        with self._lock:
+            index = self._suppliers.get(supplier)
+            if index is not None and time.monotonic() - index.loaded_at < self.ttl:
+                return index
+
+        if not self._fs_enabled:
+            return None
+
+        try:
+            docs = self._fs.collection('prices').where('fournisseur', '==', supplier).stream()
+            entries = {}
+            for doc in docs:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                entries[doc.id] = data
+        except Exception as e:
+            logger.error(f"❌ Erreur chargement catalogue {supplier}: {e}")
+            return None
+
+        index = _SupplierIndex(entries)
+        with self._lock:
+            self._suppliers[supplier] = index
+        logger.info(f"📚 Catalogue {supplier}: {len(entries)} prix indexés")
+        return index
+
+    def is_loaded(self, supplier: str) -> bool:
+        """Catalogue du fournisseur disponible en mémoire (chargé si besoin)"""
+        return self._load(supplier) is not None
+
+    # ===== MISE À JOUR INCRÉMENTALE =====
+
+    def upsert(self, doc_id: str, price_data: Dict[str, Any], previous_supplier: str = None):
+        """Prix ajouté ou modifié: seul l'index du fournisseur concerné est reconstruit"""
+        with self._lock:
+            if previous_supplier and previous_supplier != price_data.get('fournisseur'):
+                self.remove(doc_id, previous_supplier)
+            index = self._suppliers.get(price_data.get('fournisseur', ''))
+            if index is None:
+                return
+            entry = dict(index.entries.get(doc_id, {}))
+            entry.update(price_data)
+            entry['id'] = doc_id
+            index.entries[doc_id] = entry
+            index.invalidate()
+
+    def remove(self, doc_id: str, supplier: str):
+        """Prix supprimé du catalogue"""
+        with self._lock:
+            index = self._suppliers.get(supplier)
+            if index is not None and index.entries.pop(doc_id, None) is not None:
+                index.invalidate()
+
+    def invalidate(self, supplier: str = None):
+        """Oublier un fournisseur (ou tout le catalogue): rechargé à la prochaine recherche"""
+        with self._lock:
+            if supplier is None:
+                self._suppliers.clear()
+            else:
+                self._suppliers.pop(supplier, None)
+
+    # ===== RECHERCHE =====
+
+    def _score_rows(self, supplier: str, names: List[str],
+                    restaurant: str = None) -> Tuple[Optional[np.ndarray], List[Dict[str, Any]]]:
+        """Matrice libellés x prix du fournisseur (tailles et restaurant pris en compte)"""
+        index = self._load(supplier)
+        if index is None:
+            return None, []
+        with self._lock:
+            # Instantané cohérent: une écriture concurrente reconstruit un nouvel état
+            index.build()
+            entries, matcher = index.rows, index.matcher
+            restaurant_mask = index.restaurant_mask(restaurant) if restaurant else None
+            mismatches = [index.size_mismatch(extract_sizes(name)) for name in names]
+        if not entries or not names:
+            return None, entries
+
+        scores = matcher.score_matrix(names)
+        for row, mismatch in enumerate(mismatches):
+            # Noms normalisés égaux mais tailles différentes (HUILE 1L / 5L): pénalisés aussi
+            scores[row, mismatch] *= SIZE_MISMATCH_PENALTY
+
+        if restaurant_mask is not None:
+            # Prix d'un autre restaurant exclus (comme find_product_price)
+            scores[:, ~restaurant_mask] = 0.0
+        return scores, entries
+
+    def top_k(self, supplier: str, name: str, k: int = 5, threshold: float = 0.0,
+              restaurant: str = None) -> List[Tuple[Dict[str, Any], float]]:
+        """Les k prix du fournisseur les plus proches du libellé: [(prix, score)] décroissants"""
+        scores, entries = self._score_rows(supplier, [name], restaurant)
+        if scores is None:
+            return []
+        row = scores[0]
+        candidates = np.nonzero((row >= threshold) & (row > 0))[0]
+        if len(candidates) > k:
+            # Sélection partielle des k meilleurs avant le tri
+            candidates = candidates[np.argpartition(-row[candidates], k - 1)[:k]]
+        ranked = candidates[np.lexsort((candidates, -row[candidates]))]
+        return [(entries[col], float(row[col])) for col in ranked]
+
+    def exact_many(self, supplier: str, names: List[str],
+                   restaurant: str = None) -> List[Optional[Tuple[Dict[str, Any], float]]]:
+        """Prix dont le libellé brut (sans casse) est celui demandé, score 1.0 (ou None)"""
+        index = self._load(supplier)
+        if index is None:
+            return [None] * len(names)
+        with self._lock:
+            index.build()
+            entries = index.rows
+            restaurant_mask = index.restaurant_mask(restaurant) if restaurant else None
+            columns = [index.exact_columns(name) for name in names]
+        result: List[Optional[Tuple[Dict[str, Any], float]]] = []
+        for cols in columns:
+            usable = [col for col in cols if restaurant_mask is None or restaurant_mask[col]]
+            result.append((entries[usable[0]], 1.0) if usable else None)
+        return result
+
+    def best_many(self, supplier: str, names: List[str], restaurant: str = None,
+                  threshold: float = CATALOGUE_MATCH_THRESHOLD) -> List[Optional[Tuple[Dict[str, Any], float]]]:
+        """Meilleur prix de chaque libellé (ou None), une seule matrice pour tout le lot"""
+        scores, entries = self._score_rows(supplier, names, restaurant)
+        if scores is None:
+            return [None] * len(names)
+        result: List[Optional[Tuple[Dict[str, Any], float]]] = []
+        for row in scores:
+            col = int(np.argmax(row))
+            result.append((entries[col], float(row[col])) if row[col] >= threshold and row[col] > 0 else None)
+        return result
@@ -12,44 +12,42 @@ import logging
 from datetime import datetime
 import anthropic
 from PIL import Image
+from modules.cpu_pool import run_cpu_task, CPUTaskTimeout
+
+from modules.heic_decoder import register_opener, get_decoded_path
+from modules.scan_metrics import ScanMetrics, current_or_new
+from modules.vision_backends import backend_mode, get_fake_backend, RecordingVisionBackend
 
 # Support HEIF/HEIC avec gestion d'erreur
-try:
-    import pillow_heif
-    # Enregistrer le support HEIF
-    pillow_heif.register_heif_opener()
-    HEIF_SUPPORT = True
+HEIF_SUPPORT = register_opener()
+if HEIF_SUPPORT:
     print("✅ Support HEIF/HEIC activé")
-except ImportError as e:
-    HEIF_SUPPORT = False
-    print(f"⚠️ Support HEIF/HEIC non disponible: {e}")
+else:
+    print("⚠️ Support HEIF/HEIC non disponible: pillow_heif non installé")
 
 logger = logging.getLogger(__name__)
 
 class ClaudeVision:
     """Analyseur de factures avec Claude Vision"""
     
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        Args:
+            backend: client compatible `messages.create` (tests, charge); par défaut
+                     selon VISION_BACKEND: anthropic, record (anthropic + fixtures) ou fake
+        """
         try:
-            # Debug: vérifier les variables d'environnement
-            print("🔍 Debug: Vérification des variables d'environnement...")
-            api_key = os.getenv('ANTHROPIC_API_KEY')
-            print(f"🔍 API Key trouvée: {api_key is not None}")
-            if api_key:
-                print(f"🔍 API Key commence par: {api_key[:10]}...")
-            else:
-                print("❌ ANTHROPIC_API_KEY est None ou vide")
-                # Essayer d'autres noms possibles
-                alt_key = os.getenv('ANTHROPIC_KEY')
-                print(f"🔍 ANTHROPIC_KEY alternative: {alt_key is not None}")
-            
-            if not api_key:
-                raise ValueError("ANTHROPIC_API_KEY non trouvée dans les variables d'environnement")
+            mode = backend_mode()
+            if backend is None and mode == 'fake':
+                backend = get_fake_backend()
             
-            print("🔄 Création du client Anthropic...")
-            self.client = anthropic.Anthropic(
-                api_key=api_key
-            )
+            if backend is not None:
+                print(f"🧪 Claude Vision avec backend {type(backend).__name__}")
+                self.client = backend
+            else:
+                self.client = self._create_anthropic_client()
+                if mode == 'record':
+                    self.client = RecordingVisionBackend(self.client, os.getenv('VISION_FIXTURES_DIR', 'data/vision_fixtures'))
             self.model = "claude-3-5-sonnet-20241022"  # Modèle plus puissant pour une meilleure lecture d'image
             
             print(f"✅ Claude Vision initialisé avec succès")
@@ -207,13 +205,38 @@ IMPORTANT: Réponds UNIQUEMENT avec le JSON complet contenant TOUS les produits.
             self.client = None
             self.model = None
     
-    def analyze_invoice_image(self, image_path: str) -> Dict[str, Any]:
+    def _create_anthropic_client(self):
+        """Créer le client Anthropic réel depuis ANTHROPIC_API_KEY"""
+        api_key = os.getenv('ANTHROPIC_API_KEY')
+        print(f"🔍 API Key trouvée: {api_key is not None}")
+        if api_key:
+            print(f"🔍 API Key commence par: {api_key[:10]}...")
+        else:
+            print("❌ ANTHROPIC_API_KEY est None ou vide")
+            # Essayer d'autres noms possibles
+            alt_key = os.getenv('ANTHROPIC_KEY')
+            print(f"🔍 ANTHROPIC_KEY alternative: {alt_key is not None}")
+        
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY non trouvée dans les variables d'environnement")
+        
+        print("🔄 Création du client Anthropic...")
+        return anthropic.Anthropic(
+            api_key=api_key
+        )
+    
+    def analyze_invoice_image(self, image_path: str, metrics: Optional[ScanMetrics] = None) -> Dict[str, Any]:
         """
         Analyser une image de facture avec Claude Vision
+        
+        Les durées par étape et les tokens consommés sont ajoutés à `metrics` si fourni.
         """
+        metrics = current_or_new(metrics)
         try:
             # Test de connexion d'abord
-            if not self.test_api_connection():
+            with metrics.stage('api_check'):
+                api_ok = self.test_api_connection(metrics)
+            if not api_ok:
                 return {
                     'success': False,
                     'error': 'Impossible de se connecter à l\'API Anthropic'
@@ -227,7 +250,8 @@ IMPORTANT: Réponds UNIQUEMENT avec le JSON complet contenant TOUS les produits.
                 }
             
             # Convertir l'image en base64
-            image_base64 = self._image_to_base64(image_path)
+            with metrics.stage('decode_resize'):
+                image_base64 = self._image_to_base64(image_path)
             if not image_base64:
                 return {
                     'success': False,
@@ -235,7 +259,8 @@ IMPORTANT: Réponds UNIQUEMENT avec le JSON complet contenant TOUS les produits.
                 }
             
             # Détecter le fournisseur d'abord avec un prompt simple
-            supplier = self._detect_supplier_from_image(image_base64)
+            with metrics.stage('supplier_detection'):
+                supplier = self._detect_supplier_from_image(image_base64, metrics)
             logger.info(f"🏪 Fournisseur détecté: {supplier}")
             
             # Choisir le prompt approprié
@@ -272,50 +297,51 @@ RÉPONDS UNIQUEMENT avec le JSON dans le format exact demandé."""
             
             # Appel à Claude Vision
             logger.info(f"🤖 Analyse {supplier} avec Claude Vision...")
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4000,
-                system=system_prompt,
-                messages=[message]
-            )
+            with metrics.stage('model'):
+                response = self.client.messages.create(
+                    model=self.model,
+                    max_tokens=4000,
+                    system=system_prompt,
+                    messages=[message]
+                )
+            metrics.add_usage(getattr(response, 'usage', None))
             
             # Extraire le texte de la réponse
             response_text = response.content[0].text.strip()
-            logger.info(f"📝 Réponse Claude BRUTE (premiers 500 chars): {response_text[:500]}")
-            logger.info(f"📝 Réponse Claude COMPLÈTE: {response_text}")
+            logger.info(f"📝 Réponse Claude reçue: {len(response_text)} caractères")
+            logger.debug(f"📝 Réponse Claude COMPLÈTE: {response_text}")
             
             # Parser le JSON
-            try:
-                # Nettoyer la réponse
-                original_text = response_text
-                if response_text.startswith('```json'):
-                    response_text = response_text[7:]
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3]
-                
-                logger.info(f"🧹 Texte nettoyé: {response_text}")
+            with metrics.stage('json_parse'):
+                try:
+                    # Nettoyer la réponse
+                    original_text = response_text
+                    if response_text.startswith('```json'):
+                        response_text = response_text[7:]
+                    if response_text.endswith('```'):
+                        response_text = response_text[:-3]
                 
-                analysis_data = json.loads(response_text.strip())
-                logger.info(f"✅ JSON parsé avec succès: {analysis_data}")
+                    analysis_data = json.loads(response_text.strip())
+                    logger.info(f"✅ JSON parsé avec succès: {len(analysis_data.get('products', []))} produits")
                 
-                # Valider et enrichir les données
-                analysis_data = self._validate_and_enrich_data(analysis_data)
-                logger.info(f"🔍 Données enrichies: {analysis_data}")
+                    # Valider et enrichir les données
+                    analysis_data = self._validate_and_enrich_data(analysis_data)
+                    logger.debug(f"🔍 Données enrichies: {analysis_data}")
                 
-                return {
-                    'success': True,
-                    'data': analysis_data,
-                    'raw_response': original_text
-                }
+                    return {
+                        'success': True,
+                        'data': analysis_data,
+                        'raw_response': original_text
+                    }
                 
-            except json.JSONDecodeError as e:
-                logger.error(f"❌ Erreur parsing JSON: {e}")
-                logger.error(f"📄 Texte qui a causé l'erreur: '{response_text}'")
-                return {
-                    'success': False,
-                    'error': f'Réponse JSON invalide: {str(e)}',
-                    'raw_response': original_text
-                }
+                except json.JSONDecodeError as e:
+                    logger.error(f"❌ Erreur parsing JSON: {e}")
+                    logger.error(f"📄 Texte qui a causé l'erreur: '{response_text}'")
+                    return {
+                        'success': False,
+                        'error': f'Réponse JSON invalide: {str(e)}',
+                        'raw_response': original_text
+                    }
                 
         except Exception as e:
             logger.error(f"Erreur Claude Vision: {e}")
@@ -338,12 +364,27 @@ RÉPONDS UNIQUEMENT avec le JSON dans le format exact demandé."""
             file_ext = os.path.splitext(image_path)[1].lower()
             logger.info(f"📄 Extension détectée: {file_ext}")
             
-            # Pour les fichiers HEIC/HEIF, utiliser une approche spéciale
+            # Décodage/redimensionnement dans le pool CPU (libère le thread de requête)
             if file_ext in ['.heic', '.heif']:
                 logger.info("🔄 Traitement spécial pour fichier HEIC/HEIF")
-                return self._convert_heic_to_base64(image_path)
+                return run_cpu_task(ClaudeVision._convert_heic_to_base64, image_path)
             
-            # Pour les autres formats, utiliser PIL standard
+            return run_cpu_task(ClaudeVision._encode_image_file, image_path)
+                
+        except CPUTaskTimeout as e:
+            logger.error(f"⏱️ Conversion image interrompue: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"❌ Erreur conversion image: {e}")
+            import traceback
+            logger.error(f"📍 Traceback: {traceback.format_exc()}")
+            return None
+    
+    @staticmethod
+    def _encode_image_file(image_path: str, max_size: int = 2048, quality: int = 95) -> Optional[str]:
+        """Ouvrir, redimensionner et encoder une image en base64 (exécuté dans le pool CPU)"""
+        try:
+            # Pour les formats standards, utiliser PIL
             logger.info("🔄 Ouverture de l'image avec PIL...")
             with Image.open(image_path) as img:
                 logger.info(f"📊 Image ouverte: {img.size}, mode: {img.mode}")
@@ -353,8 +394,7 @@ RÉPONDS UNIQUEMENT avec le JSON dans le format exact demandé."""
                     logger.info(f"🔄 Conversion {img.mode} -> RGB")
                     img = img.convert('RGB')
                 
-                # Redimensionner si trop grande (max 2048px pour meilleure qualité)
-                max_size = 2048
+                # Redimensionner si trop grande (max 2048px par défaut pour meilleure qualité)
                 if max(img.size) > max_size:
                     logger.info(f"🔄 Redimensionnement de {img.size} vers max {max_size}px")
                     img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
@@ -365,8 +405,8 @@ RÉPONDS UNIQUEMENT avec le JSON dans le format exact demandé."""
                     temp_path = temp_file.name
                 
                 logger.info(f"💾 Sauvegarde temporaire: {temp_path}")
-                # Sauvegarder en JPEG avec qualité maximale
-                img.save(temp_path, 'JPEG', quality=95, optimize=True)
+                # Sauvegarder en JPEG
+                img.save(temp_path, 'JPEG', quality=quality, optimize=True)
                 
                 # Lire et encoder en base64
                 logger.info("🔢 Encodage en base64...")
@@ -390,172 +430,13 @@ RÉPONDS UNIQUEMENT avec le JSON dans le format exact demandé."""
             logger.error(f"📍 Traceback: {traceback.format_exc()}")
             return None
     
-    def _convert_heic_to_base64(self, image_path: str) -> Optional[str]:
-        """Convertir un fichier HEIC/HEIF en base64 avec méthode alternative"""
+    @staticmethod
+    def _convert_heic_to_base64(image_path: str) -> Optional[str]:
+        """Convertir un fichier HEIC/HEIF en base64 depuis l'image décodée partagée (exécuté dans le pool CPU)"""
         try:
-            logger.info("🔄 Conversion HEIC avec pillow_heif...")
-            
-            # Méthode 1: Utiliser pillow_heif directement
-            try:
-                import pillow_heif
-                
-                # Lire le fichier HEIF
-                heif_file = pillow_heif.read_heif(image_path)
-                
-                # Convertir en image PIL
-                img = Image.frombytes(
-                    heif_file.mode,
-                    heif_file.size,
-                    heif_file.data,
-                    "raw",
-                    heif_file.mode,
-                    heif_file.stride
-                )
-                
-                logger.info(f"📊 Image HEIC convertie: {img.size}, mode: {img.mode}")
-                
-                # Convertir en RGB si nécessaire
-                if img.mode != 'RGB':
-                    logger.info(f"🔄 Conversion {img.mode} -> RGB")
-                    img = img.convert('RGB')
-                
-                # Redimensionner si trop grande
-                max_size = 1600
-                if max(img.size) > max_size:
-                    logger.info(f"🔄 Redimensionnement de {img.size} vers max {max_size}px")
-                    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                
-                # Sauvegarder en JPEG temporaire
-                import tempfile
-                with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                    temp_path = temp_file.name
-                
-                logger.info(f"💾 Sauvegarde HEIC->JPEG: {temp_path}")
-                img.save(temp_path, 'JPEG', quality=85, optimize=True)
-                
-                # Encoder en base64
-                with open(temp_path, 'rb') as f:
-                    image_data = f.read()
-                    base64_data = base64.b64encode(image_data).decode('utf-8')
-                
-                # Supprimer le fichier temporaire
-                try:
-                    os.remove(temp_path)
-                    logger.info("🗑️ Fichier temporaire HEIC supprimé")
-                except:
-                    pass
-                
-                logger.info(f"✅ Conversion HEIC réussie: {len(base64_data)} caractères")
-                return base64_data
-                
-            except Exception as e:
-                logger.error(f"❌ Erreur méthode pillow_heif directe: {e}")
-                
-                # Méthode 2: Fallback avec PIL après enregistrement du plugin
-                try:
-                    import pillow_heif
-                    pillow_heif.register_heif_opener()
-                    
-                    # Forcer le rechargement du plugin
-                    from PIL import ImageFile
-                    ImageFile.LOAD_TRUNCATED_IMAGES = True
-                    
-                    with Image.open(image_path) as img:
-                        logger.info(f"📊 Image HEIC ouverte (fallback): {img.size}, mode: {img.mode}")
-                        
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        
-                        max_size = 1600
-                        if max(img.size) > max_size:
-                            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                        
-                        import tempfile
-                        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                            temp_path = temp_file.name
-                        
-                        img.save(temp_path, 'JPEG', quality=85, optimize=True)
-                        
-                        with open(temp_path, 'rb') as f:
-                            image_data = f.read()
-                            base64_data = base64.b64encode(image_data).decode('utf-8')
-                        
-                        try:
-                            os.remove(temp_path)
-                        except:
-                            pass
-                        
-                        logger.info(f"✅ Conversion HEIC réussie (fallback): {len(base64_data)} caractères")
-                        return base64_data
-                        
-                except Exception as e2:
-                    logger.error(f"❌ Erreur méthode fallback: {e2}")
-                    
-                    # Méthode 3: Conversion brute avec lecture directe des bytes
-                    try:
-                        logger.info("🔄 Tentative méthode 3: conversion brute...")
-                        import pillow_heif
-                        
-                        # Ouvrir le fichier HEIF avec paramètres relaxés
-                        heif_file = pillow_heif.open_heif(image_path, convert_hdr_to_8bit=True)
-                        
-                        # Obtenir la première image (principal)
-                        if hasattr(heif_file, 'primary'):
-                            primary_image = heif_file.primary
-                        else:
-                            primary_image = heif_file[0] if len(heif_file) > 0 else heif_file
-                        
-                        # Convertir en PIL Image avec numpy si nécessaire
-                        import numpy as np
-                        
-                        # Obtenir les données brutes
-                        if hasattr(primary_image, 'to_bytes'):
-                            raw_data = primary_image.to_bytes()
-                            width, height = primary_image.size
-                            mode = primary_image.mode or 'RGB'
-                        else:
-                            # Fallback
-                            raw_data = primary_image.data
-                            width, height = primary_image.size
-                            mode = primary_image.mode or 'RGB'
-                        
-                        # Créer l'image PIL
-                        img = Image.frombytes(mode, (width, height), raw_data)
-                        
-                        logger.info(f"📊 Image HEIC convertie (méthode 3): {img.size}, mode: {img.mode}")
-                        
-                        # Convertir en RGB
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        
-                        # Redimensionner
-                        max_size = 1600
-                        if max(img.size) > max_size:
-                            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                        
-                        # Sauvegarder et encoder
-                        import tempfile
-                        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                            temp_path = temp_file.name
-                        
-                        img.save(temp_path, 'JPEG', quality=85, optimize=True)
-                        
-                        with open(temp_path, 'rb') as f:
-                            image_data = f.read()
-                            base64_data = base64.b64encode(image_data).decode('utf-8')
-                        
-                        try:
-                            os.remove(temp_path)
-                        except:
-                            pass
-                        
-                        logger.info(f"✅ Conversion HEIC réussie (méthode 3): {len(base64_data)} caractères")
-                        return base64_data
-                        
-                    except Exception as e3:
-                        logger.error(f"❌ Erreur méthode 3: {e3}")
-                        return None
-                    
+            # Décodage unique (vignette embarquée si suffisante), partagé avec l'OCR
+            decoded_path = get_decoded_path(image_path)
+            return ClaudeVision._encode_image_file(decoded_path, max_size=1600, quality=85)
         except Exception as e:
             logger.error(f"❌ Erreur critique conversion HEIC: {e}")
             return None
@@ -759,7 +640,7 @@ RÉPONDS UNIQUEMENT avec le JSON dans le format exact demandé."""
         
         return False
     
-    def _detect_supplier_from_image(self, image_base64: str) -> str:
+    def _detect_supplier_from_image(self, image_base64: str, metrics: Optional[ScanMetrics] = None) -> str:
         """Détecter le fournisseur depuis l'image"""
         try:
             # Prompt générique pour détecter n'importe quel fournisseur
@@ -790,6 +671,8 @@ Si tu ne vois pas clairement le nom, réponds "GENERIC"."""
                 max_tokens=20,
                 messages=[detection_message]
             )
+            if metrics is not None:
+                metrics.add_usage(getattr(response, 'usage', None))
             
             supplier = response.content[0].text.strip().upper()
             logger.info(f"🏪 Fournisseur brut détecté: {supplier}")
@@ -814,7 +697,7 @@ Si tu ne vois pas clairement le nom, réponds "GENERIC"."""
             logger.warning(f"Erreur détection fournisseur: {e}")
             return 'GENERIC'
     
-    def test_api_connection(self) -> bool:
+    def test_api_connection(self, metrics: Optional[ScanMetrics] = None) -> bool:
         """Tester la connexion à l'API Claude"""
         try:
             # Test simple avec un message texte
@@ -826,6 +709,8 @@ Si tu ne vois pas clairement le nom, réponds "GENERIC"."""
                     "content": "Bonjour"
                 }]
             )
+            if metrics is not None:
+                metrics.add_usage(getattr(response, 'usage', None))
             return True
         except Exception as e:
             logger.error(f"Erreur test API Claude: {e}")
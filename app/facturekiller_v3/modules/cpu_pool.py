@@ -0,0 +1,165 @@
+"""
+Pool de processus partagé pour le travail CPU (OCR, prétraitement, images)
+Libère les threads de requête Flask pendant Tesseract, OpenCV et les conversions PIL
+"""
+
+import os
+import io
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Délai maximal par tâche (secondes), surchargeable par variable d'environnement
+DEFAULT_TIMEOUT = float(os.getenv('CPU_POOL_TIMEOUT', '60'))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+class CPUTaskTimeout(Exception):
+    """Tâche CPU non terminée dans le délai imparti"""
+
+
+def _pool_size() -> int:
+    """Nombre de workers: CPU_POOL_WORKERS ou nombre de CPU - 1 (minimum 1)"""
+    configured = os.getenv('CPU_POOL_WORKERS')
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            logger.warning(f"⚠️ CPU_POOL_WORKERS invalide: {configured}")
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """Obtenir le pool partagé (création lazy, un pool par processus)"""
+    global _pool, _pool_pid
+
+    # Dans un worker forké, le pool hérité n'est pas utilisable: exécution locale
+    if _pool is not None and _pool_pid != os.getpid():
+        return None
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                try:
+                    workers = _pool_size()
+                    _pool = ProcessPoolExecutor(max_workers=workers)
+                    _pool_pid = os.getpid()
+                    logger.info(f"⚙️ Pool CPU initialisé: {workers} workers")
+                except Exception as e:
+                    logger.error(f"❌ Impossible de créer le pool CPU, exécution locale: {e}")
+                    return None
+    return _pool
+
+
+def _reset_pool():
+    """Abandonner un pool cassé (worker tué, OOM) pour qu'il soit recréé"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None:
+            try:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            except Exception:
+                pass
+        _pool = None
+        _pool_pid = None
+
+
+def run_cpu_task(func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Exécuter une fonction CPU dans le pool et attendre son résultat
+
+    La fonction doit être définie au niveau module (picklable).
+    En cas de dépassement du délai, la tâche est annulée si elle n'a pas démarré,
+    sinon son résultat est abandonné, et CPUTaskTimeout est levée.
+    """
+    pool = get_pool()
+    if pool is None:
+        return func(*args, **kwargs)
+
+    try:
+        future = pool.submit(func, *args, **kwargs)
+    except (BrokenProcessPool, RuntimeError) as e:
+        logger.warning(f"⚠️ Pool CPU indisponible ({e}), exécution locale")
+        _reset_pool()
+        return func(*args, **kwargs)
+
+    timeout = timeout or DEFAULT_TIMEOUT
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        cancelled = future.cancel()
+        logger.error(f"⏱️ Tâche CPU {getattr(func, '__name__', func)} > {timeout}s "
+                     f"({'annulée' if cancelled else 'abandonnée'})")
+        raise CPUTaskTimeout(f"Traitement trop long (> {timeout:g}s)")
+    except BrokenProcessPool:
+        logger.error("❌ Pool CPU cassé, il sera recréé")
+        _reset_pool()
+        raise
+
+
+def map_cpu_tasks(func: Callable, args_list: Iterable[tuple], timeout: Optional[float] = None) -> List[Any]:
+    """
+    Exécuter plusieurs tâches CPU en parallèle, résultats dans l'ordre des arguments
+
+    Le délai est partagé par l'ensemble des tâches; au dépassement, les tâches
+    restantes sont annulées et CPUTaskTimeout est levée.
+    """
+    args_list = list(args_list)
+    pool = get_pool()
+    if pool is None:
+        return [func(*args) for args in args_list]
+
+    timeout = timeout or DEFAULT_TIMEOUT
+    deadline = time.monotonic() + timeout
+    futures = [pool.submit(func, *args) for args in args_list]
+    try:
+        return [future.result(timeout=max(0, deadline - time.monotonic())) for future in futures]
+    except FutureTimeoutError:
+        for future in futures:
+            future.cancel()
+        logger.error(f"⏱️ Lot CPU {getattr(func, '__name__', func)} ({len(futures)} tâches) > {timeout}s")
+        raise CPUTaskTimeout(f"Traitement trop long (> {timeout:g}s)")
+    except BrokenProcessPool:
+        logger.error("❌ Pool CPU cassé, il sera recréé")
+        _reset_pool()
+        raise
+
+
+def shutdown():
+    """Arrêter le pool (appelé à la sortie du processus)"""
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+atexit.register(shutdown)
+
+
+# ===== TÂCHES IMAGES GÉNÉRIQUES =====
+
+def compress_image_bytes(data: bytes, max_width: int, max_height: int, quality: int) -> bytes:
+    """Redimensionner et réencoder une image en JPEG (exécuté dans le pool)"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Redimensionner si nécessaire
+        if image.width > max_width or image.height > max_height:
+            image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+
+        # Convertir en RGB si nécessaire
+        if image.mode in ('RGBA', 'P'):
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True)
+        return output.getvalue()
@@ -0,0 +1,85 @@
+"""
+Cache en mémoire des statistiques du dashboard par restaurant
+TTL + numéro de version incrémenté à chaque écriture de facture / produit en attente,
+et ETag pour répondre 304 aux rafraîchissements périodiques des onglets ouverts
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+# Durée de vie d'une entrée: borne la fraîcheur entre workers (les versions sont locales au processus)
+DEFAULT_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '60'))
+
+# Clé utilisée quand aucun restaurant n'est sélectionné
+NO_RESTAURANT = '_sans_restaurant'
+
+
+class DashboardCache:
+    """Statistiques calculées par restaurant, invalidées par TTL ou changement de version"""
+
+    def __init__(self, ttl: int = DEFAULT_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._global_version = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(restaurant_id: Optional[str]) -> str:
+        return restaurant_id or NO_RESTAURANT
+
+    def version(self, restaurant_id: Optional[str]) -> str:
+        """Version courante des données d'un restaurant (globale.restaurant)"""
+        with self._lock:
+            return f"{self._global_version}.{self._versions.get(self._key(restaurant_id), 0)}"
+
+    def bump(self, restaurant_id: Optional[str] = None):
+        """Invalider un restaurant, ou tous les restaurants si restaurant_id est None"""
+        with self._lock:
+            if restaurant_id is None:
+                self._global_version += 1
+            else:
+                key = self._key(restaurant_id)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def get(self, restaurant_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Entrée {'data', 'etag', 'version'} encore valide, sinon None"""
+        version = self.version(restaurant_id)
+        with self._lock:
+            entry = self._entries.get(self._key(restaurant_id))
+        if not entry:
+            return None
+        if entry['version'] != version or time.monotonic() - entry['cached_at'] > self.ttl:
+            return None
+        return entry
+
+    def set(self, restaurant_id: Optional[str], data: Dict[str, Any], version: str) -> Dict[str, Any]:
+        """
+        Mettre en cache des statistiques calculées sous la version lue avant le calcul
+
+        L'ETag dépend du contenu: deux workers qui calculent les mêmes chiffres
+        renvoient le même ETag, donc le 304 fonctionne quel que soit le worker.
+        """
+        body = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+        entry = {
+            'data': data,
+            'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+            'version': version,
+            'cached_at': time.monotonic()
+        }
+        with self._lock:
+            self._entries[self._key(restaurant_id)] = entry
+        return entry
+
+
+# Cache partagé du processus
+dashboard_cache = DashboardCache()
+
+
+def bump_dashboard_version(restaurant_id: Optional[str] = None):
+    """Signaler une écriture affectant le dashboard (None = tous les restaurants)"""
+    dashboard_cache.bump(restaurant_id)
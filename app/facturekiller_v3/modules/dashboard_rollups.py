@@ -0,0 +1,306 @@
+"""
+Agrégats mensuels matérialisés du dashboard
+Un document par (restaurant, mois) mis à jour à chaque sauvegarde/modification de facture,
+pour que /api/stats/dashboard lise quelques petits documents au lieu de tout l'historique
+"""
+
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+from modules.stats_calculator import (
+    StatsCalculator, ROLLUP_NUMERIC_FIELDS, ROLLUP_RECENT_INVOICES
+)
+
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    FIRESTORE_SDK = False
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'dashboard_rollups'
+# Document marquant la fin de la reconstruction initiale depuis l'historique
+META_DOC_ID = '__meta'
+# Clé des factures sans restaurant_id
+NO_RESTAURANT = '_sans_restaurant'
+# Contributions reçues pendant une reconstruction, rejouées à la fin de celle-ci
+PENDING_COLLECTION = 'dashboard_rollups_pending'
+# Une reconstruction interrompue (worker arrêté) est relancée après ce délai (minutes)
+REBUILD_TIMEOUT_MINUTES = 15
+
+
+def invoice_version(invoice: Dict[str, Any]) -> Optional[str]:
+    """Version d'une facture (dernière modification), pour rapprocher file d'attente et reconstruction"""
+    return invoice.get('updated_at') or invoice.get('created_at')
+
+
+def empty_rollup(restaurant_key: str, month: str) -> Dict[str, Any]:
+    """Document d'agrégat vide pour un restaurant et un mois"""
+    rollup = {key: 0 for key in ROLLUP_NUMERIC_FIELDS}
+    rollup.update({
+        'restaurant_id': restaurant_key,
+        'month': month,
+        'suppliers': {},
+        'recent_invoices': []
+    })
+    return rollup
+
+
+def merge_contribution(rollup: Dict[str, Any], contribution: Dict[str, Any], sign: int = 1) -> Dict[str, Any]:
+    """Ajouter (sign=1) ou retirer (sign=-1) la contribution d'une facture à un agrégat"""
+    for key in ROLLUP_NUMERIC_FIELDS:
+        rollup[key] = (rollup.get(key, 0) or 0) + sign * (contribution.get(key, 0) or 0)
+
+    suppliers = rollup.setdefault('suppliers', {})
+    for supplier, amount in contribution.get('suppliers', {}).items():
+        value = suppliers.get(supplier, 0) + sign * amount
+        if sign < 0 and abs(value) < 0.005:
+            suppliers.pop(supplier, None)
+        else:
+            suppliers[supplier] = value
+
+    entry = contribution['recent_invoice']
+    recent = [r for r in rollup.get('recent_invoices', []) if r.get('id') != entry.get('id')]
+    if sign > 0:
+        recent.append(entry)
+    recent.sort(key=lambda x: x.get('sort_key') or '', reverse=True)
+    rollup['recent_invoices'] = recent[:ROLLUP_RECENT_INVOICES]
+
+    return rollup
+
+
+class DashboardRollupManager:
+    """Maintenance et lecture des agrégats mensuels par restaurant (Firestore)"""
+
+    def __init__(self, fs_client: Any = None):
+        self.stats_calculator = StatsCalculator()
+        self._fs = fs_client
+        if self._fs is None:
+            try:
+                from modules.firestore_db import get_client
+                self._fs = get_client()
+            except Exception as e:
+                logger.error(f"❌ Erreur initialisation Firestore DashboardRollupManager: {e}")
+        self._fs_enabled = self._fs is not None and FIRESTORE_SDK
+        self._built = False
+
+    @staticmethod
+    def _restaurant_key(restaurant_id: Optional[str]) -> str:
+        return restaurant_id or NO_RESTAURANT
+
+    def _doc_id(self, restaurant_id: Optional[str], month: str) -> str:
+        return f"{self._restaurant_key(restaurant_id)}_{month}"
+
+    # ===== MISE À JOUR INCRÉMENTALE =====
+
+    def apply_invoice(self, invoice: Dict[str, Any], sign: int = 1) -> bool:
+        """
+        Ajouter (ou retirer avec sign=-1) une facture de l'agrégat de son mois, en transaction
+
+        Pendant une reconstruction, la contribution est mise en file au lieu d'être
+        appliquée (la reconstruction écrit des valeurs absolues): elle est rejouée ensuite.
+        """
+        if not self._fs_enabled or not invoice:
+            return False
+
+        try:
+            contribution = self.stats_calculator.invoice_rollup_contribution(invoice)
+            restaurant_key = self._restaurant_key(invoice.get('restaurant_id'))
+            self._apply_contribution(restaurant_key, contribution, sign, {
+                'invoice_id': invoice.get('id'),
+                'version': invoice_version(invoice)
+            })
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Erreur mise à jour agrégat dashboard ({invoice.get('id')}): {e}")
+            return False
+
+    def _apply_contribution(self, restaurant_key: str, contribution: Dict[str, Any], sign: int,
+                            pending: Optional[Dict[str, Any]] = None):
+        """
+        Appliquer une contribution à l'agrégat de son mois (transaction)
+
+        pending: identité de la facture; si renseigné et qu'une reconstruction est en
+        cours (lue dans la même transaction), la contribution est mise en file.
+        """
+        collection = self._fs.collection(COLLECTION)
+        month = contribution['month']
+        ref = collection.document(self._doc_id(restaurant_key, month))
+        meta_ref = collection.document(META_DOC_ID)
+
+        @_firestore.transactional
+        def _update(transaction):
+            if pending is not None:
+                meta = meta_ref.get(transaction=transaction)
+                if meta.exists and (meta.to_dict() or {}).get('status') == 'rebuilding':
+                    transaction.set(self._fs.collection(PENDING_COLLECTION).document(), {
+                        **pending,
+                        'restaurant_key': restaurant_key,
+                        'contribution': contribution,
+                        'sign': sign,
+                        'queued_at': time.time_ns()
+                    })
+                    return
+            snapshot = ref.get(transaction=transaction)
+            rollup = snapshot.to_dict() if snapshot.exists else empty_rollup(restaurant_key, month)
+            merge_contribution(rollup, contribution, sign)
+            rollup['updated_at'] = datetime.now().isoformat()
+            transaction.set(ref, rollup)
+
+        _update(self._fs.transaction())
+
+    def replace_invoice(self, old_invoice: Optional[Dict[str, Any]], new_invoice: Optional[Dict[str, Any]]) -> bool:
+        """Répercuter la modification d'une facture (retrait de l'ancienne version, ajout de la nouvelle)"""
+        success = True
+        if old_invoice:
+            success = self.apply_invoice(old_invoice, sign=-1) and success
+        if new_invoice:
+            success = self.apply_invoice(new_invoice, sign=1) and success
+        return success
+
+    # ===== LECTURE =====
+
+    def get_rollups(self, restaurant_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Agrégats mensuels d'un restaurant (ou de tous si restaurant_id est None)
+
+        Retourne None si les agrégats sont indisponibles: l'appelant retombe alors sur
+        le calcul complet depuis les factures.
+        """
+        if not self._fs_enabled:
+            return None
+
+        try:
+            self.ensure_built()
+            query = self._fs.collection(COLLECTION)
+            if restaurant_id is not None:
+                query = query.where('restaurant_id', '==', self._restaurant_key(restaurant_id))
+
+            return [doc.to_dict() for doc in query.stream() if doc.id != META_DOC_ID]
+
+        except Exception as e:
+            logger.error(f"❌ Erreur lecture agrégats dashboard: {e}")
+            return None
+
+    # ===== RECONSTRUCTION =====
+
+    def ensure_built(self):
+        """Reconstruire les agrégats depuis l'historique au premier usage (ou après une reconstruction interrompue)"""
+        if self._built:
+            return
+        meta = self._fs.collection(COLLECTION).document(META_DOC_ID).get()
+        state = meta.to_dict() if meta.exists else None
+        if state is None:
+            self.rebuild()
+        elif state.get('status') == 'rebuilding':
+            stale = (datetime.now() - timedelta(minutes=REBUILD_TIMEOUT_MINUTES)).isoformat()
+            if (state.get('started_at') or '') < stale:
+                self.rebuild()
+            else:
+                # Reconstruction en cours dans un autre worker: revérifier au prochain appel
+                return
+        self._built = True
+
+    def rebuild(self) -> int:
+        """
+        Recalculer tous les agrégats depuis la collection invoices (migration / réparation)
+
+        Un marqueur 'rebuilding' est posé avant la lecture: les modifications de factures
+        reçues pendant la reconstruction sont mises en file par apply_invoice, puis
+        rejouées après l'écriture des valeurs absolues (aucune contribution perdue).
+        """
+        from modules.invoice_manager import DETAIL_SUBCOLLECTION, merge_invoice_detail
+        logger.info("🔄 Reconstruction des agrégats du dashboard...")
+        meta_ref = self._fs.collection(COLLECTION).document(META_DOC_ID)
+        meta_ref.set({'status': 'rebuilding', 'started_at': datetime.now().isoformat()})
+
+        rollups: Dict[str, Dict[str, Any]] = {}
+        versions: Dict[str, Optional[str]] = {}
+        invoice_count = 0
+
+        # Documents de détail (analyse complète) en une requête de groupe de collections
+        details = {
+            doc.reference.parent.parent.id: doc.to_dict()
+            for doc in self._fs.collection_group(DETAIL_SUBCOLLECTION).stream()
+        }
+
+        for doc in self._fs.collection('invoices').stream():
+            invoice = merge_invoice_detail(doc.to_dict(), details.get(doc.id))
+            invoice['id'] = doc.id
+            versions[doc.id] = invoice_version(invoice)
+            contribution = self.stats_calculator.invoice_rollup_contribution(invoice)
+            restaurant_key = self._restaurant_key(invoice.get('restaurant_id'))
+            doc_id = self._doc_id(restaurant_key, contribution['month'])
+            if doc_id not in rollups:
+                rollups[doc_id] = empty_rollup(restaurant_key, contribution['month'])
+            merge_contribution(rollups[doc_id], contribution)
+            invoice_count += 1
+
+        now = datetime.now().isoformat()
+        stale_ids = [doc.id for doc in self._fs.collection(COLLECTION).stream()
+                     if doc.id != META_DOC_ID and doc.id not in rollups]
+
+        # Écritures par lots (limite Firestore: 500 opérations par batch)
+        operations = [('set', doc_id, rollup) for doc_id, rollup in rollups.items()]
+        operations += [('delete', doc_id, None) for doc_id in stale_ids]
+        for start in range(0, len(operations), 400):
+            batch = self._fs.batch()
+            for action, doc_id, rollup in operations[start:start + 400]:
+                ref = self._fs.collection(COLLECTION).document(doc_id)
+                if action == 'set':
+                    rollup['updated_at'] = now
+                    batch.set(ref, rollup)
+                else:
+                    batch.delete(ref)
+            batch.commit()
+
+        # Fin du marqueur: les nouvelles modifications sont appliquées directement,
+        # celles mises en file pendant la lecture sont rejouées (additions commutatives)
+        meta_ref.set({
+            'status': 'built',
+            'built_at': now,
+            'invoices': invoice_count,
+            'rollups': len(rollups)
+        })
+        replayed = self._replay_pending(versions)
+        logger.info(f"✅ Agrégats dashboard reconstruits: {len(rollups)} documents pour {invoice_count} factures "
+                    f"({replayed} modification(s) rejouée(s))")
+        return len(rollups)
+
+    def _replay_pending(self, versions: Dict[str, Optional[str]]) -> int:
+        """
+        Rejouer les contributions mises en file pendant la reconstruction
+
+        versions: version de chaque facture vue par la lecture. Par facture, les entrées
+        sont rejouées dans l'ordre en suivant la version comptée: un ajout de la version
+        déjà comptée est ignoré, un retrait ne s'applique qu'à la version comptée.
+        """
+        docs = list(self._fs.collection(PENDING_COLLECTION).stream())
+        entries = sorted((doc.to_dict() for doc in docs), key=lambda entry: entry.get('queued_at', 0))
+        counted = dict(versions)
+        replayed = 0
+
+        for entry in entries:
+            invoice_id, version, sign = entry.get('invoice_id'), entry.get('version'), entry.get('sign', 1)
+            current = counted.get(invoice_id)
+            if sign > 0:
+                if current == version:
+                    continue
+                counted[invoice_id] = version
+            else:
+                if current != version:
+                    continue
+                counted[invoice_id] = None
+            self._apply_contribution(entry['restaurant_key'], entry['contribution'], sign)
+            replayed += 1
+
+        for start in range(0, len(docs), 400):
+            batch = self._fs.batch()
+            for doc in docs[start:start + 400]:
+                batch.delete(doc.reference)
+            batch.commit()
+        return replayed
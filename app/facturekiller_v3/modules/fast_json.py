@@ -0,0 +1,171 @@
+"""
+Couche de réponse JSON rapide pour l'API
+Sérialisation orjson (repli sur le JSON standard de Flask), compression gzip/brotli
+au-delà d'un seuil de taille et streaming des très grandes listes
+"""
+
+import os
+import gzip
+import zlib
+import logging
+from typing import Dict, List, Any
+
+from flask import Response, current_app, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_SUPPORT = True
+except ImportError:
+    orjson = None
+    ORJSON_SUPPORT = False
+
+try:
+    import brotli
+    BROTLI_SUPPORT = True
+except ImportError:
+    brotli = None
+    BROTLI_SUPPORT = False
+
+logger = logging.getLogger(__name__)
+
+# En dessous de ce seuil, la compression coûte plus qu'elle ne rapporte
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+# Listes streamées par paquets au-delà de ce nombre d'éléments
+STREAM_MIN_ITEMS = int(os.getenv('STREAM_MIN_ITEMS', '1000'))
+STREAM_CHUNK_SIZE = 500
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Fournisseur JSON Flask basé sur orjson
+
+    Sortie identique au fournisseur par défaut (clés triées, dates au format HTTP,
+    Decimal/UUID en chaîne); tout objet qu'orjson refuse repasse par json standard.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # response() passe separators (sortie compacte, déjà le cas d'orjson) ou indent=2 en debug
+        options = dict(kwargs)
+        options.pop('separators', None)
+        indent = options.pop('indent', None)
+        if not ORJSON_SUPPORT or options or indent not in (None, 2):
+            # Autres options explicites: sérialiseur standard
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            # Entiers > 64 bits, clés non triables, types inconnus...
+            return super().dumps(obj, **kwargs)
+
+
+def _negotiate_encoding() -> str:
+    """Encodage accepté par le client: br de préférence, sinon gzip"""
+    accepted = request.accept_encodings
+    if BROTLI_SUPPORT and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _weaken_etag(response: Response):
+    """Un corps compressé n'est plus octet pour octet la représentation d'origine"""
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress_response(response: Response) -> Response:
+    """after_request: compresser les réponses JSON au-delà de COMPRESS_MIN_SIZE"""
+    if (response.status_code < 200 or response.status_code in (204, 304) or
+            response.direct_passthrough or response.is_streamed or
+            'Content-Encoding' in response.headers or
+            response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    encoding = _negotiate_encoding()
+    if not encoding:
+        return response
+
+    if encoding == 'br':
+        body = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        body = gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    _weaken_etag(response)
+    return response
+
+
+def stream_json_list(items: List[Any], envelope: Dict[str, Any], items_key: str = 'data') -> Response:
+    """
+    Réponse JSON streamée: {...envelope, items_key: [items]} émise par paquets
+
+    Le client reçoit les premiers octets sans attendre la sérialisation complète et le
+    serveur ne matérialise jamais tout le document. Compression gzip à la volée si acceptée.
+    """
+    dumps = current_app.json.dumps
+    head = dumps(envelope)
+    prefix = head[:-1] + (',' if envelope else '') + dumps(items_key) + ':['
+    encoding = 'gzip' if request.accept_encodings['gzip'] else None
+
+    def generate_text():
+        yield prefix
+        for start in range(0, len(items), STREAM_CHUNK_SIZE):
+            chunk = dumps(items[start:start + STREAM_CHUNK_SIZE])[1:-1]
+            yield (',' if start else '') + chunk
+        yield ']}'
+
+    def generate():
+        if encoding != 'gzip':
+            for text in generate_text():
+                yield text.encode('utf-8')
+            return
+        # wbits=31: conteneur gzip
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for text in generate_text():
+            data = compressor.compress(text.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def json_list_response(items: List[Any], envelope: Dict[str, Any], items_key: str = 'data') -> Response:
+    """jsonify classique, ou streaming si la liste dépasse STREAM_MIN_ITEMS"""
+    if len(items) >= STREAM_MIN_ITEMS:
+        logger.info(f"📦 Réponse streamée: {len(items)} éléments")
+        return stream_json_list(items, envelope, items_key)
+    payload = dict(envelope)
+    payload[items_key] = items
+    return current_app.json.response(payload)
+
+
+def init_app(app):
+    """Installer le sérialiseur rapide et la compression des réponses"""
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+    logger.info(f"⚡ Réponses JSON: orjson={'oui' if ORJSON_SUPPORT else 'non'}, "
+                f"brotli={'oui' if BROTLI_SUPPORT else 'non'}, compression >= {COMPRESS_MIN_SIZE} octets")
@@ -0,0 +1,112 @@
+"""
+Décodage HEIC/HEIF des photos iPhone
+Un seul décodage par fichier, partagé entre l'OCR et Claude Vision via une image JPEG annexe
+"""
+
+import os
+import logging
+import tempfile
+from PIL import Image
+
+try:
+    import pillow_heif
+    HEIF_SUPPORT = True
+except ImportError:
+    pillow_heif = None
+    HEIF_SUPPORT = False
+
+logger = logging.getLogger(__name__)
+
+# Résolution cible (côté le plus long) couvrant les besoins OCR (2048) et Vision (1600)
+SHARED_TARGET_SIZE = 2048
+DECODED_SUFFIX = '.decoded.jpg'
+
+_opener_registered = False
+
+
+def register_opener() -> bool:
+    """Enregistrer l'ouverture HEIF dans PIL (idempotent)"""
+    global _opener_registered
+    if not HEIF_SUPPORT:
+        return False
+    if not _opener_registered:
+        pillow_heif.register_heif_opener()
+        _opener_registered = True
+    return True
+
+
+def is_heic(image_path: str) -> bool:
+    """Vérifier si un fichier est une image HEIC/HEIF"""
+    return bool(image_path) and image_path.lower().endswith(('.heic', '.heif'))
+
+
+def decode_heic(image_path: str, target_size: int = SHARED_TARGET_SIZE) -> Image.Image:
+    """
+    Décoder un HEIC au plus près de la résolution cible
+
+    Utilise la vignette embarquée quand elle couvre target_size; sinon décode
+    l'image principale puis la réduit d'abord par facteur entier (reduce) avant
+    le LANCZOS final, bien plus rapide qu'un LANCZOS sur la pleine résolution.
+    """
+    if not HEIF_SUPPORT:
+        raise RuntimeError('pillow_heif non installé - HEIC non supporté')
+
+    heif_file = pillow_heif.open_heif(image_path, convert_hdr_to_8bit=True)
+
+    # Vignette embarquée si assez grande (sinon pillow_heif renvoie l'image principale)
+    source = heif_file
+    try:
+        source = pillow_heif.thumbnail(heif_file, min_box=target_size)
+    except Exception as e:
+        logger.debug(f"Vignettes HEIC indisponibles: {e}")
+
+    if hasattr(source, 'to_pillow'):
+        img = source.to_pillow()
+    else:
+        img = Image.frombytes(source.mode, source.size, source.data, 'raw', source.mode, source.stride)
+    logger.info(f"📊 HEIC décodé: {img.size} (original {heif_file.size}), mode: {img.mode}")
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Réduction grossière par facteur entier, puis ajustement fin
+    factor = max(img.size) // target_size
+    if factor >= 2:
+        img = img.reduce(factor)
+    if max(img.size) > target_size:
+        img.thumbnail((target_size, target_size), Image.Resampling.LANCZOS)
+
+    return img
+
+
+def decoded_path_for(image_path: str) -> str:
+    """Chemin de l'image décodée partagée associée à un HEIC"""
+    return image_path + DECODED_SUFFIX
+
+
+def get_decoded_path(image_path: str, target_size: int = SHARED_TARGET_SIZE) -> str:
+    """
+    Retourner le JPEG décodé partagé pour un HEIC, en le créant au premier appel
+
+    Les appels suivants (OCR, Vision, re-scan) réutilisent le fichier sans redécoder.
+    L'écriture passe par un fichier temporaire renommé atomiquement pour les workers concurrents.
+    """
+    decoded_path = decoded_path_for(image_path)
+    if (os.path.exists(decoded_path) and
+            os.path.getmtime(decoded_path) >= os.path.getmtime(image_path)):
+        return decoded_path
+
+    img = decode_heic(image_path, target_size)
+
+    fd, temp_path = tempfile.mkstemp(suffix='.jpg', dir=os.path.dirname(decoded_path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, 'JPEG', quality=95)
+        os.replace(temp_path, decoded_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    logger.info(f"💾 Image HEIC décodée partagée: {decoded_path}")
+    return decoded_path
@@ -9,6 +9,7 @@ import os
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 import logging
+from modules.invoice_history_store import InvoiceHistoryStore
 # from modules.ai_agent import IntelligentAIAgent  # Removed to fix circular import
 
 logger = logging.getLogger(__name__)
@@ -18,7 +19,7 @@ class InvoiceAnalyzer:
     
     def __init__(self):
         self.supplier_templates = self._load_supplier_templates()
-        self.invoices_db = []  # Base de données en mémoire (à remplacer par une vraie DB)
+        self.history = InvoiceHistoryStore()  # Historique append-only (SQLite WAL)
         # self.ai_agent = IntelligentAIAgent()  # Removed to fix circular import
         
     def _load_supplier_templates(self) -> Dict[str, Dict]:
@@ -380,122 +381,45 @@ class InvoiceAnalyzer:
         return data
     
     def save_invoice(self, analysis: Dict, file_path: str, restaurant_id: str = None, restaurant_name: str = None) -> str:
-        """Sauvegarder une facture analysée avec contexte restaurant"""
-        invoice_id = str(len(self.invoices_db) + 1).zfill(6)
-        
-        invoice_record = {
-            'id': invoice_id,
-            'file_path': file_path,
-            'analysis': analysis['data'] if 'data' in analysis else analysis,
-            'created_at': datetime.now().isoformat(),
-            'restaurant_id': restaurant_id,
-            'restaurant_name': restaurant_name
-        }
-        
-        self.invoices_db.append(invoice_record)
-        
-        # Sauvegarder dans un fichier JSON (à remplacer par une vraie DB)
-        os.makedirs('data', exist_ok=True)
-        with open('data/invoices.json', 'w') as f:
-            json.dump(self.invoices_db, f, indent=2, ensure_ascii=False)
-        
-        return invoice_id
+        """Sauvegarder une facture analysée avec contexte restaurant (ajout dans l'historique SQLite)"""
+        return self.history.append(
+            analysis['data'] if 'data' in analysis else analysis,
+            file_path,
+            restaurant_id=restaurant_id,
+            restaurant_name=restaurant_name
+        )
     
     def get_all_invoices(self, page: int = 1, per_page: int = 20,
                         supplier: str = '', date_from: str = '', 
                         date_to: str = '', restaurant_suppliers: List[str] = None) -> Dict[str, Any]:
         """Récupérer toutes les factures avec pagination et filtres INCLUANT RESTAURANT"""
-        # Charger depuis le fichier si nécessaire
-        if not self.invoices_db and os.path.exists('data/invoices.json'):
-            with open('data/invoices.json', 'r') as f:
-                self.invoices_db = json.load(f)
-        
-        # Appliquer les filtres
-        filtered_invoices = []
-        
-        for invoice in self.invoices_db:
-            # NOUVEAU FILTRE: Par fournisseurs du restaurant
-            if restaurant_suppliers:
-                invoice_supplier = invoice.get('analysis', {}).get('supplier', '')
-                if invoice_supplier and invoice_supplier not in restaurant_suppliers:
-                    continue  # Ignorer les factures de fournisseurs non autorisés
-            
-            # Filtre par fournisseur
-            if supplier:
-                invoice_supplier = invoice.get('analysis', {}).get('supplier', '')
-                if invoice_supplier != supplier:
-                    continue
-            
-            # Filtre par date
-            if date_from or date_to:
-                invoice_date = invoice.get('analysis', {}).get('date', '')
-                if not invoice_date:
-                    invoice_date = invoice.get('created_at', '')
-                
-                if invoice_date:
-                    try:
-                        # Convertir en date pour comparaison
-                        inv_date = datetime.fromisoformat(invoice_date.replace('Z', '+00:00')).date()
-                        
-                        if date_from:
-                            from_date = datetime.fromisoformat(date_from).date()
-                            if inv_date < from_date:
-                                continue
-                        
-                        if date_to:
-                            to_date = datetime.fromisoformat(date_to).date()
-                            if inv_date > to_date:
-                                continue
-                    except:
-                        continue
-            
-            filtered_invoices.append(invoice)
-        
-        # Trier par date décroissante
-        filtered_invoices.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        # Calculer la pagination
-        total = len(filtered_invoices)
-        total_pages = (total + per_page - 1) // per_page
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        
-        # Extraire la page
-        page_items = filtered_invoices[start_idx:end_idx]
+        items, total = self.history.query(
+            supplier=supplier,
+            restaurant_suppliers=restaurant_suppliers,
+            date_from=date_from,
+            date_to=date_to,
+            limit=per_page,
+            offset=(page - 1) * per_page
+        )
         
         return {
-            'items': page_items,
+            'items': items,
             'total': total,
             'page': page,
-            'pages': total_pages,
+            'pages': (total + per_page - 1) // per_page,
             'per_page': per_page,
             'restaurant_filter': restaurant_suppliers
         }
     
     def get_invoice(self, invoice_id: str) -> Optional[Dict]:
         """Récupérer une facture par son ID"""
-        for invoice in self.get_all_invoices():
-            if invoice['id'] == invoice_id:
-                return invoice
-        return None
+        return self.history.get(invoice_id)
     
     def get_invoices_by_restaurant(self, restaurant_id: str) -> List[Dict[str, Any]]:
         """Récupérer les factures d'un restaurant spécifique"""
         try:
-            # Charger depuis le fichier si nécessaire
-            if not self.invoices_db and os.path.exists('data/invoices.json'):
-                with open('data/invoices.json', 'r') as f:
-                    self.invoices_db = json.load(f)
-            
-            # Filtrer les factures par restaurant_id
-            restaurant_invoices = [
-                invoice for invoice in self.invoices_db
-                if invoice.get('restaurant_id') == restaurant_id
-            ]
-            
-            # Trier par date de création décroissante
-            restaurant_invoices.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
+            # Index (restaurant_id, created_at): déjà triées par date de création décroissante
+            restaurant_invoices, _ = self.history.query(restaurant_id=restaurant_id)
             return restaurant_invoices
             
         except Exception as e:
@@ -0,0 +1,210 @@
+"""
+Historique brut des analyses de factures (InvoiceAnalyzer)
+Stockage SQLite en mode WAL: ajout en O(1), identifiants alloués atomiquement par la base
+et requêtes indexées par restaurant, fournisseur et date au lieu de relire tout un JSON
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.getenv('INVOICE_HISTORY_DB', 'data/invoice_history.db')
+# Ancien stockage, importé une seule fois à la création de la base
+LEGACY_JSON_PATH = 'data/invoices.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_path TEXT,
+    restaurant_id TEXT,
+    restaurant_name TEXT,
+    supplier TEXT,
+    invoice_date TEXT,
+    filter_date TEXT,
+    created_at TEXT NOT NULL,
+    analysis TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_restaurant ON invoices (restaurant_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_supplier ON invoices (supplier, created_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_filter_date ON invoices (filter_date);
+CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices (created_at);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def format_invoice_id(row_id: int) -> str:
+    """Identifiant public historique (000001, 000002, ...)"""
+    return str(row_id).zfill(6)
+
+
+def _filter_date(invoice_date: Optional[str], created_at: Optional[str]) -> Optional[str]:
+    """Date de filtrage AAAA-MM-JJ (date facture, sinon date de création); None si illisible"""
+    value = invoice_date or created_at
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).date().isoformat()
+    except ValueError:
+        return None
+
+
+class InvoiceHistoryStore:
+    """Stockage append-only des analyses, partagé sans verrou applicatif entre workers"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, legacy_json_path: str = LEGACY_JSON_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+        self._import_legacy_json(legacy_json_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connexion propre au thread (sqlite3 ne partage pas une connexion entre threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # WAL: lectures concurrentes pendant les écritures, commit sans réécriture du fichier
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _import_legacy_json(self, legacy_json_path: str):
+        """Reprendre data/invoices.json une seule fois (identifiants conservés)"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_json_imported'").fetchone():
+            return
+        if not legacy_json_path or not os.path.exists(legacy_json_path):
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO store_meta (key, value) VALUES ('legacy_json_imported', ?)",
+                             (datetime.now().isoformat(),))
+            return
+
+        try:
+            with open(legacy_json_path, 'r') as f:
+                records = json.load(f)
+        except Exception as e:
+            logger.error(f"❌ Lecture {legacy_json_path} impossible, import ignoré: {e}")
+            return
+
+        with conn:
+            # BEGIN IMMEDIATE: un seul worker importe, les autres voient le marqueur ensuite
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_json_imported'").fetchone():
+                return
+            imported = 0
+            for record in records:
+                try:
+                    row_id = int(record.get('id'))
+                except (TypeError, ValueError):
+                    row_id = None
+                conn.execute(
+                    'INSERT OR IGNORE INTO invoices (id, file_path, restaurant_id, restaurant_name, supplier, '
+                    'invoice_date, filter_date, created_at, analysis) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    self._row_values(record.get('analysis') or {}, record.get('file_path'),
+                                     record.get('restaurant_id'), record.get('restaurant_name'),
+                                     record.get('created_at') or '', row_id)
+                )
+                imported += 1
+            conn.execute("INSERT INTO store_meta (key, value) VALUES ('legacy_json_imported', ?)",
+                         (datetime.now().isoformat(),))
+        logger.info(f"📥 Historique InvoiceAnalyzer: {imported} factures importées depuis {legacy_json_path}")
+
+    @staticmethod
+    def _row_values(analysis: Dict, file_path: Optional[str], restaurant_id: Optional[str],
+                    restaurant_name: Optional[str], created_at: str, row_id: Optional[int] = None) -> Tuple:
+        invoice_date = analysis.get('date') or None
+        return (
+            row_id, file_path, restaurant_id, restaurant_name,
+            analysis.get('supplier') or '', invoice_date,
+            _filter_date(invoice_date, created_at), created_at,
+            json.dumps(analysis, ensure_ascii=False, default=str)
+        )
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'id': format_invoice_id(row['id']),
+            'file_path': row['file_path'],
+            'analysis': json.loads(row['analysis']),
+            'created_at': row['created_at'],
+            'restaurant_id': row['restaurant_id'],
+            'restaurant_name': row['restaurant_name']
+        }
+
+    # ===== ÉCRITURE =====
+
+    def append(self, analysis: Dict, file_path: str, restaurant_id: str = None,
+               restaurant_name: str = None) -> str:
+        """Ajouter une analyse; l'identifiant est alloué par SQLite dans la transaction d'insertion"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO invoices (id, file_path, restaurant_id, restaurant_name, supplier, '
+                'invoice_date, filter_date, created_at, analysis) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                self._row_values(analysis, file_path, restaurant_id, restaurant_name, datetime.now().isoformat())
+            )
+        return format_invoice_id(cursor.lastrowid)
+
+    # ===== LECTURE =====
+
+    def get(self, invoice_id: str) -> Optional[Dict[str, Any]]:
+        """Une analyse par identifiant public"""
+        try:
+            row_id = int(invoice_id)
+        except (TypeError, ValueError):
+            return None
+        row = self._connect().execute('SELECT * FROM invoices WHERE id = ?', (row_id,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def query(self, restaurant_id: str = None, supplier: str = '', restaurant_suppliers: List[str] = None,
+              date_from: str = '', date_to: str = '', limit: int = None,
+              offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Analyses filtrées, triées par date de création décroissante: (page, total)"""
+        clauses, params = [], []
+        if restaurant_id is not None:
+            clauses.append('restaurant_id = ?')
+            params.append(restaurant_id)
+        if supplier:
+            clauses.append('supplier = ?')
+            params.append(supplier)
+        if restaurant_suppliers:
+            # Factures sans fournisseur détecté conservées (comportement historique)
+            placeholders = ', '.join('?' for _ in restaurant_suppliers)
+            clauses.append(f"(supplier = '' OR supplier IN ({placeholders}))")
+            params.extend(restaurant_suppliers)
+        if date_from:
+            clauses.append('filter_date >= ?')
+            params.append(date_from[:10])
+        if date_to:
+            clauses.append('filter_date <= ?')
+            params.append(date_to[:10])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM invoices {where}', params).fetchone()[0]
+
+        sql = f'SELECT * FROM invoices {where} ORDER BY created_at DESC, id DESC'
+        page_params = list(params)
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            page_params += [limit, offset]
+        rows = conn.execute(sql, page_params).fetchall()
+        return [self._row_to_record(row) for row in rows], total
@@ -0,0 +1,619 @@
+"""
+Pipeline d'ingestion des factures: détection d'anomalies en flux
+Chaque sauvegarde, modification ou suppression de facture (InvoiceManager) émet un
+événement et rend la main; un consommateur en arrière-plan confronte les lignes des
+nouvelles factures au catalogue et aux statistiques de prix, écrit les anomalies et tient
+les compteurs lus par /api/anomalies/stats
+"""
+
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from modules.price_stats_store import PriceStatsStore, stats_key
+from modules.dashboard_rollups import invoice_version
+
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    from google.api_core.exceptions import AlreadyExists  # type: ignore
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    AlreadyExists = None
+    FIRESTORE_SDK = False
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'ingest_events'
+COUNTERS_COLLECTION = 'anomaly_counters'
+# Contribution déjà comptée pour chaque facture (version, restaurant, compteurs)
+INVOICE_STATES_COLLECTION = 'anomaly_counter_invoices'
+GLOBAL_COUNTERS = 'global'
+# Document marquant la fin de l'initialisation des compteurs depuis l'historique
+META_DOC_ID = '__meta'
+NO_RESTAURANT = '_sans_restaurant'
+
+# Événements traités ensemble par le consommateur (un batch d'écriture par cycle)
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '20'))
+INGEST_MAX_ATTEMPTS = 5
+# Un événement réservé par un worker arrêté est repris après ce délai (secondes)
+CLAIM_TIMEOUT = 300
+# Factures réconciliées par transaction lors de l'initialisation des compteurs
+REBUILD_BATCH_SIZE = 200
+# Écart statistique: historique minimal et z-score à partir desquels un prix est inhabituel
+STATS_MIN_OBSERVATIONS = 5
+STATS_Z_THRESHOLD = 3.0
+STATS_MIN_PERCENT = 10
+
+ANOMALY_TYPES = ('quantity', 'price', 'missing')
+
+
+def invoice_line_events(invoice: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lignes d'une facture à évaluer: produits nommés avec un prix unitaire"""
+    analysis = invoice.get('analysis') or {}
+    supplier = invoice.get('supplier') or analysis.get('supplier') or ''
+    restaurant = invoice.get('restaurant_name') or 'Général'
+    lines = []
+    for product in invoice.get('products') or analysis.get('products') or []:
+        if not isinstance(product, dict):
+            continue
+        name = product.get('name') or product.get('produit')
+        try:
+            unit_price = float(product.get('unit_price', product.get('prix_unitaire', 0)) or 0)
+        except (TypeError, ValueError):
+            continue
+        if not name or unit_price <= 0:
+            continue
+        lines.append({
+            'name': name,
+            'unit_price': unit_price,
+            'quantity': product.get('quantity', 1),
+            'supplier': supplier,
+            'restaurant': restaurant
+        })
+    return lines
+
+
+def invoice_anomaly_counts(invoice: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Contribution d'une facture aux compteurs (mêmes règles que l'ancien recomptage)
+
+    Les anomalies sont soit groupées par produit ({'anomalies': [...]}), soit à plat
+    (sauvegarde depuis le scanner): les deux formes sont acceptées.
+    """
+    anomalies = invoice.get('anomalies') or []
+    types = {anomaly_type: 0 for anomaly_type in ANOMALY_TYPES}
+    critical = 0
+    for product_anomaly in anomalies:
+        if not isinstance(product_anomaly, dict):
+            continue
+        for anomaly in product_anomaly.get('anomalies', [product_anomaly]):
+            anomaly_type = anomaly.get('type', 'unknown')
+            if anomaly_type in types:
+                types[anomaly_type] += 1
+            if anomaly.get('severity') == 'critical':
+                critical += 1
+
+    has_anomalies = bool(invoice.get('has_anomalies', False))
+    counts = {
+        'total_invoices': 1,
+        'invoices_with_anomalies': int(has_anomalies),
+        'anomaly_types': types,
+        'critical_anomalies': critical,
+        'supplier_anomalies': {}
+    }
+    if has_anomalies:
+        counts['supplier_anomalies'][invoice.get('supplier') or 'Inconnu'] = len(anomalies)
+    return counts
+
+
+def add_counts(target: Dict[str, Any], counts: Dict[str, Any]) -> Dict[str, Any]:
+    """Ajouter des compteurs (dictionnaires imbriqués de nombres) à d'autres"""
+    for key, value in counts.items():
+        if isinstance(value, dict):
+            add_counts(target.setdefault(key, {}), value)
+        elif value:
+            target[key] = (target.get(key, 0) or 0) + value
+    return target
+
+
+def _negated(counts: Dict[str, Any]) -> Dict[str, Any]:
+    """Compteurs de signe opposé (retrait d'une contribution)"""
+    return {key: _negated(value) if isinstance(value, dict) else -value for key, value in counts.items()}
+
+
+def _increments(counts: Dict[str, Any]) -> Dict[str, Any]:
+    """Compteurs en transformations Increment (écriture sans lecture, sûre entre workers)"""
+    result = {}
+    for key, value in counts.items():
+        if isinstance(value, dict):
+            nested = _increments(value)
+            if nested:
+                result[key] = nested
+        elif value:
+            result[key] = _firestore.Increment(value)
+    return result
+
+
+class InvoiceIngestPipeline:
+    """File d'événements d'ingestion et consommateur de détection d'anomalies"""
+
+    def __init__(self, anomaly_manager: Any = None, fs_client: Any = None):
+        self._fs = fs_client
+        if self._fs is None:
+            try:
+                from modules.firestore_db import get_client
+                self._fs = get_client()
+            except Exception as e:
+                logger.error(f"❌ Erreur initialisation Firestore InvoiceIngestPipeline: {e}")
+        self._fs_enabled = self._fs is not None and FIRESTORE_SDK
+        self._anomaly_manager = anomaly_manager
+        self.price_stats = PriceStatsStore(self._fs)
+
+        self._queue: 'queue.Queue[Dict[str, Any]]' = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._worker_lock = threading.Lock()
+        self._counters_built = False
+
+    def _get_anomaly_manager(self):
+        if self._anomaly_manager is None:
+            from modules.anomaly_manager import AnomalyManager
+            self._anomaly_manager = AnomalyManager()
+        return self._anomaly_manager
+
+    @staticmethod
+    def _restaurant_key(restaurant_id: Optional[str]) -> str:
+        return restaurant_id or NO_RESTAURANT
+
+    # ===== ÉMISSION (chemin de requête) =====
+
+    def emit_invoice_saved(self, invoice_id: str, invoice: Dict[str, Any]) -> bool:
+        """
+        Publier une facture sauvegardée: ses lignes sont évaluées, ses compteurs ajoutés
+
+        L'identifiant d'événement est celui de la facture: une double émission est
+        ignorée (create), et un événement non traité est repris au redémarrage.
+        """
+        return self._emit(invoice_id, 'saved', invoice_id, invoice, invoice_line_events(invoice))
+
+    def emit_invoice_updated(self, invoice_id: str, invoice: Dict[str, Any]) -> bool:
+        """Publier le nouvel état d'une facture modifiée (compteurs: écart avec l'état déjà compté)"""
+        return self._emit(f"{invoice_id}__u{time.time_ns()}", 'updated', invoice_id, invoice)
+
+    def emit_invoice_deleted(self, invoice_id: str, invoice: Dict[str, Any]) -> bool:
+        """Publier la suppression d'une facture (sa contribution est retirée des compteurs)"""
+        return self._emit(f"{invoice_id}__deleted", 'deleted', invoice_id, invoice)
+
+    def _emit(self, event_id: str, kind: str, invoice_id: str, invoice: Dict[str, Any],
+              lines: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """Une écriture (événement durable) puis mise en file"""
+        if not invoice_id:
+            return False
+
+        now = datetime.now().isoformat()
+        event = {
+            'id': event_id,
+            'kind': kind,
+            'invoice_id': invoice_id,
+            'invoice_code': invoice.get('invoice_code'),
+            'supplier': invoice.get('supplier') or '',
+            'restaurant_id': invoice.get('restaurant_id'),
+            'restaurant_name': invoice.get('restaurant_name'),
+            # Version de la facture après le changement: un état plus ancien n'écrase jamais un plus récent
+            'version': now if kind == 'deleted' else (invoice_version(invoice) or now),
+            'lines': lines or [],
+            'counts': None if kind == 'deleted' else invoice_anomaly_counts(invoice),
+            'status': 'pending',
+            'attempts': 0,
+            'created_at': now
+        }
+
+        if self._fs_enabled:
+            try:
+                self._fs.collection(COLLECTION).document(event_id).create(event)
+            except Exception as e:
+                if AlreadyExists is not None and isinstance(e, AlreadyExists):
+                    logger.info(f"ℹ️ Événement {event_id} déjà publié")
+                    return False
+                # La détection est faite quand même; seul le rejeu après redémarrage est perdu
+                logger.error(f"❌ Erreur enregistrement événement d'ingestion {event_id}: {e}")
+
+        self._ensure_worker()
+        self._queue.put(event)
+        return True
+
+    # ===== CONSOMMATEUR =====
+
+    def _ensure_worker(self):
+        """Démarrer le consommateur (un thread par processus, relancé après un fork)"""
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='invoice-ingest', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+            logger.info("📥 Consommateur d'ingestion des factures démarré")
+
+    def _run(self):
+        try:
+            self.ensure_counters_built()
+        except Exception as e:
+            logger.error(f"❌ Erreur initialisation compteurs d'anomalies: {e}")
+        self._recover_pending()
+
+        while True:
+            events = [self._queue.get()]
+            while len(events) < INGEST_BATCH_SIZE:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.process_events(events)
+            except Exception as e:
+                logger.error(f"❌ Erreur traitement de {len(events)} événement(s) d'ingestion: {e}")
+                self._retry(events, e)
+
+    def _retry(self, events: List[Dict[str, Any]], error: Exception):
+        """Remettre en file avec attente croissante; abandon marqué après trop d'essais"""
+        failed = []
+        attempts = 0
+        for event in events:
+            event['attempts'] = event.get('attempts', 0) + 1
+            attempts = max(attempts, event['attempts'])
+            if event['attempts'] >= INGEST_MAX_ATTEMPTS:
+                failed.append(event)
+            else:
+                self._queue.put(event)
+
+        if failed and self._fs_enabled:
+            try:
+                batch = self._fs.batch()
+                for event in failed:
+                    batch.set(self._fs.collection(COLLECTION).document(event['id']), {
+                        'status': 'failed',
+                        'attempts': event['attempts'],
+                        'error': str(error),
+                        'updated_at': datetime.now().isoformat()
+                    }, merge=True)
+                batch.commit()
+            except Exception as e:
+                logger.error(f"❌ Erreur marquage événements en échec: {e}")
+        if failed:
+            logger.warning(f"⚠️ {len(failed)} événement(s) d'ingestion abandonné(s) après {INGEST_MAX_ATTEMPTS} essais")
+
+        time.sleep(min(2 ** attempts, 60))
+
+    def _recover_pending(self):
+        """Remettre en file les événements non traités (arrêt du processus, autre worker tombé)"""
+        if not self._fs_enabled:
+            return
+        try:
+            stale = (datetime.now() - timedelta(seconds=CLAIM_TIMEOUT)).isoformat()
+            query = self._fs.collection(COLLECTION).where('status', 'in', ['pending', 'processing'])
+            recovered = 0
+            for doc in query.stream():
+                event = doc.to_dict()
+                if event.get('status') == 'processing' and (event.get('claimed_at') or '') > stale:
+                    continue
+                event['id'] = doc.id
+                self._queue.put(event)
+                recovered += 1
+            if recovered:
+                logger.info(f"🔁 {recovered} événement(s) d'ingestion repris")
+        except Exception as e:
+            logger.error(f"❌ Erreur reprise des événements d'ingestion: {e}")
+
+    def _claim(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Réserver les événements encore à traiter, en une transaction
+
+        Plusieurs workers peuvent reprendre le même événement au démarrage: un seul le
+        réserve, les autres l'ignorent (traitement idempotent). Le jeton de réservation
+        permet au même consommateur de reprendre ses propres événements après un échec.
+        """
+        if not self._fs_enabled:
+            return events
+
+        collection = self._fs.collection(COLLECTION)
+        by_id = {event['id']: event for event in events}
+        stale = (datetime.now() - timedelta(seconds=CLAIM_TIMEOUT)).isoformat()
+
+        @_firestore.transactional
+        def _reserve(transaction):
+            refs = [collection.document(event_id) for event_id in by_id]
+            claimed = []
+            now = datetime.now().isoformat()
+            for snapshot in transaction.get_all(refs):
+                if snapshot.exists:
+                    current = snapshot.to_dict()
+                    if current.get('status') == 'done' or current.get('status') == 'failed':
+                        continue
+                    if (current.get('status') == 'processing' and (current.get('claimed_at') or '') > stale
+                            and current.get('claim_token') != by_id[snapshot.id].get('claim_token')):
+                        continue
+                event = by_id[snapshot.id]
+                event['claim_token'] = event.get('claim_token') or uuid.uuid4().hex
+                transaction.set(snapshot.reference, {
+                    'status': 'processing', 'claimed_at': now, 'claim_token': event['claim_token']
+                }, merge=True)
+                claimed.append(event)
+            return claimed
+
+        return _reserve(self._fs.transaction())
+
+    def process_events(self, events: List[Dict[str, Any]]) -> List[str]:
+        """
+        Évaluer un lot d'événements et en écrire les résultats
+
+        Idempotent: le résultat de la détection (anomalies à identifiants déterministes
+        facture + rang) est enregistré sur l'événement avant tout effet; un rejeu (nouvel
+        essai, reprise après CLAIM_TIMEOUT) réécrit les mêmes anomalies, les observations
+        de prix portent un identifiant facture:ligne ignoré s'il est déjà intégré, et les
+        compteurs ne reçoivent que l'écart avec l'état déjà compté pour la facture.
+        Retourne les identifiants des anomalies écrites.
+        """
+        events = self._claim(events)
+        if not events:
+            return []
+
+        to_detect = [event for event in events if event.get('detected') is None]
+        if to_detect:
+            self._detect(to_detect)
+
+        anomalies = [anomaly for event in events for anomaly in event['detected']]
+        # Échec d'écriture propagé: l'événement n'est marqué traité qu'après les deux écritures
+        anomaly_ids = self._get_anomaly_manager().save_anomalies(anomalies, raise_errors=True) if anomalies else []
+
+        observations = []
+        for event in events:
+            date = event.get('created_at') or datetime.now().isoformat()
+            observations.extend({
+                'supplier': line['supplier'],
+                'product_name': line['name'],
+                'price': line['unit_price'],
+                'date': date,
+                'observation_id': f"{event['invoice_id']}:{index}"
+            } for index, line in enumerate(event.get('lines', [])))
+        self.price_stats.observe_many(observations, raise_errors=True)
+
+        self._commit_results(events)
+        logger.info(f"📥 {len(events)} événement(s) de facture ingéré(s): {len(anomaly_ids)} anomalie(s) écrite(s)")
+        return anomaly_ids
+
+    def _detect(self, events: List[Dict[str, Any]]):
+        """
+        Détecter les anomalies des lignes et enregistrer le résultat sur les événements
+
+        Lignes confrontées au catalogue (écarts vectorisés d'AnomalyManager) puis aux
+        statistiques de prix (z-score sur l'historique, lu en un get_all).
+        """
+        anomaly_manager = self._get_anomaly_manager()
+        priors = self.price_stats.get_many(
+            (line['supplier'], line['name']) for event in events for line in event.get('lines', [])
+        )
+        now = datetime.now().isoformat()
+
+        for event in events:
+            lines = event.get('lines', [])
+            detected = anomaly_manager.detect_price_anomalies(lines) if lines else []
+            flagged = {anomaly['produit_nom'] for anomaly in detected}
+            detected += self._statistical_anomalies(lines, priors, flagged)
+            for position, anomaly in enumerate(detected):
+                anomaly.update({
+                    'id': f"ANOM_{event['invoice_id']}_{position:03d}",
+                    'facture_id': event['invoice_id'],
+                    'invoice_code': event.get('invoice_code'),
+                    'restaurant_id': event.get('restaurant_id'),
+                    'source': 'ingest',
+                    'created_at': now,
+                    'updated_at': now
+                })
+            event['detected'] = detected
+
+        if self._fs_enabled:
+            batch = self._fs.batch()
+            for event in events:
+                batch.set(self._fs.collection(COLLECTION).document(event['id']), {
+                    'detected': event['detected'],
+                    'detected_at': now
+                }, merge=True)
+            batch.commit()
+
+    @staticmethod
+    def _statistical_anomalies(lines: List[Dict[str, Any]], priors: Dict, flagged) -> List[Dict[str, Any]]:
+        """Prix éloignés de l'historique du produit (lignes non déjà signalées par le catalogue)"""
+        anomalies = []
+        date_detection = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for line in lines:
+            if line['name'] in flagged:
+                continue
+            state = priors.get(stats_key(line['supplier'], line['name']))
+            if not state or state.get('count', 0) < STATS_MIN_OBSERVATIONS or not state.get('std'):
+                continue
+            mean = state['mean']
+            ecart_euros = line['unit_price'] - mean
+            z_score = ecart_euros / state['std']
+            ecart_pourcent = ecart_euros / mean * 100 if mean else 0.0
+            if abs(z_score) < STATS_Z_THRESHOLD or abs(ecart_pourcent) < STATS_MIN_PERCENT:
+                continue
+            anomalies.append({
+                'produit_nom': line['name'],
+                'fournisseur': line['supplier'],
+                'restaurant': line['restaurant'],
+                'type_anomalie': 'prix_inhabituel',
+                'prix_facture': line['unit_price'],
+                'prix_moyen': round(mean, 4),
+                'ecart_euros': round(ecart_euros, 2),
+                'ecart_pourcent': round(ecart_pourcent, 1),
+                'z_score': round(z_score, 2),
+                'observations': state['count'],
+                'statut': 'detectee',
+                'date_detection': date_detection
+            })
+        return anomalies
+
+    @staticmethod
+    def _detected_counts(anomalies: List[Dict[str, Any]], lines: int) -> Dict[str, Any]:
+        counts = {
+            'lines_processed': lines,
+            'detected_anomalies': len(anomalies),
+            'detected_types': {},
+            'detected_by_supplier': {},
+            'montant_total_ecarts': round(sum(a.get('ecart_euros', 0) for a in anomalies), 2)
+        }
+        for anomaly in anomalies:
+            add_counts(counts['detected_types'], {anomaly['type_anomalie']: 1})
+            add_counts(counts['detected_by_supplier'], {anomaly.get('fournisseur') or 'Inconnu': 1})
+        return counts
+
+    def _commit_results(self, events: List[Dict[str, Any]]):
+        """
+        Compteurs et clôture des événements dans une même transaction (jamais comptés deux fois)
+
+        Compteurs des factures: écart entre le nouvel état et celui déjà compté pour la
+        facture (signé pour une modification ou une suppression). Compteurs de détection:
+        ajoutés une seule fois, avec la clôture de l'événement.
+        """
+        if not self._fs_enabled:
+            return
+
+        now = datetime.now().isoformat()
+        changes = [
+            (event['invoice_id'], event.get('version'), self._restaurant_key(event.get('restaurant_id')),
+             event.get('counts'))
+            for event in events
+        ]
+
+        @_firestore.transactional
+        def _commit(transaction):
+            counters, states = self._reconcile(transaction, changes)
+            for event in events:
+                if event.get('lines'):
+                    detected = self._detected_counts(event['detected'], len(event['lines']))
+                    add_counts(counters.setdefault(GLOBAL_COUNTERS, {}), detected)
+                    add_counts(counters.setdefault(self._restaurant_key(event.get('restaurant_id')), {}), detected)
+            self._write_counters(transaction, counters, states, now)
+            for event in events:
+                transaction.set(self._fs.collection(COLLECTION).document(event['id']), {
+                    'status': 'done',
+                    'anomaly_ids': [a['id'] for a in event['detected']],
+                    'anomalies_count': len(event['detected']),
+                    'processed_at': now
+                }, merge=True)
+
+        _commit(self._fs.transaction())
+
+    def _reconcile(self, transaction, changes: List[tuple]) -> tuple:
+        """
+        Écarts de compteurs pour des états de factures (invoice_id, version, restaurant, compteurs)
+
+        Lit, dans la transaction, l'état déjà compté de chaque facture: un état de version
+        inférieure ou égale à celle déjà comptée est ignoré (rejeu, événement en retard),
+        sinon l'ancienne contribution est retirée et la nouvelle ajoutée (None = supprimée).
+        Retourne (écarts par document de compteurs, états à écrire par référence).
+        """
+        collection = self._fs.collection(INVOICE_STATES_COLLECTION)
+        refs = {invoice_id: collection.document(invoice_id) for invoice_id, _, _, _ in changes}
+        states = {snapshot.id: snapshot.to_dict()
+                  for snapshot in transaction.get_all(list(refs.values())) if snapshot.exists}
+
+        counters: Dict[str, Dict[str, Any]] = {}
+        written: Dict[str, Dict[str, Any]] = {}
+        for invoice_id, version, restaurant_key, counts in sorted(changes, key=lambda change: change[1] or ''):
+            state = states.get(invoice_id)
+            if state and (state.get('version') or '') >= (version or ''):
+                continue
+            if state and state.get('counts'):
+                removed = _negated(state['counts'])
+                add_counts(counters.setdefault(GLOBAL_COUNTERS, {}), removed)
+                add_counts(counters.setdefault(state.get('restaurant_key') or NO_RESTAURANT, {}), removed)
+            if counts:
+                add_counts(counters.setdefault(GLOBAL_COUNTERS, {}), counts)
+                add_counts(counters.setdefault(restaurant_key, {}), counts)
+            states[invoice_id] = written[invoice_id] = {
+                'version': version, 'restaurant_key': restaurant_key, 'counts': counts or {}
+            }
+        return counters, {refs[invoice_id]: state for invoice_id, state in written.items()}
+
+    def _write_counters(self, writer, counters: Dict[str, Dict[str, Any]], states: Dict[Any, Dict[str, Any]],
+                        now: str):
+        """Écrire les écarts (Increment) et les états comptés, en transaction ou en batch"""
+        for doc_id, counts in counters.items():
+            data = _increments(counts)
+            data['updated_at'] = now
+            writer.set(self._fs.collection(COUNTERS_COLLECTION).document(doc_id), data, merge=True)
+        for ref, state in states.items():
+            writer.set(ref, {**state, 'updated_at': now})
+
+    # ===== COMPTEURS =====
+
+    def get_counters(self, restaurant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Compteurs d'anomalies (globaux, ou d'un restaurant)
+
+        Retourne None si les compteurs sont indisponibles: l'appelant retombe alors sur
+        le recomptage depuis les factures.
+        """
+        if not self._fs_enabled:
+            return None
+
+        doc_id = self._restaurant_key(restaurant_id) if restaurant_id else GLOBAL_COUNTERS
+        try:
+            self.ensure_counters_built()
+            snapshot = self._fs.collection(COUNTERS_COLLECTION).document(doc_id).get()
+            return snapshot.to_dict() if snapshot.exists else {}
+        except Exception as e:
+            logger.error(f"❌ Erreur lecture compteurs d'anomalies: {e}")
+            return None
+
+    def ensure_counters_built(self):
+        """Initialiser les compteurs depuis l'historique des factures au premier usage"""
+        if self._counters_built or not self._fs_enabled:
+            return
+        meta = self._fs.collection(COUNTERS_COLLECTION).document(META_DOC_ID).get()
+        if not meta.exists:
+            self.rebuild_counters()
+        self._counters_built = True
+
+    def rebuild_counters(self) -> int:
+        """
+        Initialiser (ou réconcilier) les compteurs des factures depuis la collection invoices
+
+        Aucune valeur absolue n'est écrite: chaque facture passe par la même réconciliation
+        que les événements (écart avec l'état déjà compté, en transaction). Une facture déjà
+        comptée par un événement n'est pas recomptée, et les incréments concurrents ne sont
+        jamais écrasés.
+        """
+        if not self._fs_enabled:
+            return 0
+        logger.info("🔄 Reconstruction des compteurs d'anomalies...")
+        fields = ['supplier', 'has_anomalies', 'anomalies', 'restaurant_id', 'created_at', 'updated_at']
+        changes = []
+        for doc in self._fs.collection('invoices').select(fields).stream():
+            invoice = doc.to_dict()
+            changes.append((doc.id, invoice_version(invoice) or '', self._restaurant_key(invoice.get('restaurant_id')),
+                            invoice_anomaly_counts(invoice)))
+
+        @_firestore.transactional
+        def _apply(transaction, chunk):
+            counters, states = self._reconcile(transaction, chunk)
+            self._write_counters(transaction, counters, states, datetime.now().isoformat())
+
+        for start in range(0, len(changes), REBUILD_BATCH_SIZE):
+            _apply(self._fs.transaction(), changes[start:start + REBUILD_BATCH_SIZE])
+
+        self._fs.collection(COUNTERS_COLLECTION).document(META_DOC_ID).set({
+            'built_at': datetime.now().isoformat(),
+            'invoices': len(changes)
+        })
+        logger.info(f"✅ Compteurs d'anomalies reconstruits pour {len(changes)} factures")
+        return len(changes)
@@ -8,12 +8,59 @@ from datetime import datetime
 from typing import Dict, List, Any
 import logging
 from modules.firestore_db import available as _fs_available, get_client as _fs_client
+from modules.dashboard_cache import bump_dashboard_version
 
 logger = logging.getLogger(__name__)
 
+# Sous-collection contenant le document de détail (analyse complète, produits, corrections)
+DETAIL_SUBCOLLECTION = 'invoice_details'
+DETAIL_DOC_ID = 'content'
+
+# Champs lourds stockés uniquement dans le document de détail
+DETAIL_FIELDS = ['products', 'price_comparison', 'corrections_applied']
+
+# Champs de l'analyse conservés dans le document principal (vue liste)
+ANALYSIS_SUMMARY_FIELDS = [
+    'supplier', 'fournisseur', 'invoice_number', 'numero_facture',
+    'total_amount', 'montant_total', 'total', 'date', 'restaurant_id', 'restaurant_context'
+]
+
+# Projection Firestore des listes: affichage + filtres (fournisseur, date, anomalies, tri)
+INVOICE_LIST_FIELDS = [
+    'invoice_code', 'filename', 'supplier', 'supplier_name', 'invoice_number', 'date',
+    'total_amount', 'scan_date', 'created_at', 'is_multipage', 'total_pages',
+    'has_anomalies', 'anomalies_count', 'anomaly_status', 'workflow_status',
+    'validation_required', 'priority', 'restaurant_id', 'restaurant_name'
+] + [f'analysis.{field}' for field in ANALYSIS_SUMMARY_FIELDS]
+
+
+def split_invoice_document(invoice_data: Dict[str, Any]) -> tuple:
+    """Séparer une facture en (document principal léger, document de détail)"""
+    summary = {k: v for k, v in invoice_data.items() if k not in DETAIL_FIELDS}
+    detail = {k: invoice_data[k] for k in DETAIL_FIELDS if k in invoice_data}
+    
+    analysis = invoice_data.get('analysis')
+    if isinstance(analysis, dict):
+        summary['analysis'] = {k: analysis[k] for k in ANALYSIS_SUMMARY_FIELDS if k in analysis}
+        detail['analysis'] = analysis
+    
+    return summary, detail
+
+
+def merge_invoice_detail(invoice: Dict[str, Any], detail: Dict[str, Any]) -> Dict[str, Any]:
+    """Recomposer la facture complète (les anciennes factures sans détail restent inchangées)"""
+    if detail:
+        invoice.update(detail)
+    return invoice
+
+
 class InvoiceManager:
-    def __init__(self):
-        """Initialiser le gestionnaire de factures (Firestore uniquement)"""
+    def __init__(self, ingest=None):
+        """
+        Initialiser le gestionnaire de factures (Firestore uniquement)
+        
+        ingest: pipeline d'ingestion (InvoiceIngestPipeline) notifié de chaque écriture
+        """
         # 🔥 FIRESTORE UNIQUEMENT - Plus de fichiers locaux
         self._fs_enabled = False
         self._fs = None
@@ -29,12 +76,88 @@ class InvoiceManager:
             print(f"❌ Erreur initialisation Firestore InvoiceManager: {e}")
             self._fs_enabled = False
             self._fs = None
+        
+        # Agrégats mensuels du dashboard (créés à la première écriture)
+        self._rollups = None
+        self._sequences = None
+        self._ingest = ingest
+    
+    def _get_rollups(self):
+        """Gestionnaire des agrégats du dashboard partageant le client Firestore"""
+        if self._rollups is None:
+            from modules.dashboard_rollups import DashboardRollupManager
+            self._rollups = DashboardRollupManager(self._fs)
+        return self._rollups
+    
+    def _get_ingest(self):
+        """Pipeline d'ingestion (détection d'anomalies et compteurs) notifié de chaque écriture"""
+        if self._ingest is None:
+            from modules.invoice_ingest import InvoiceIngestPipeline
+            self._ingest = InvoiceIngestPipeline(fs_client=self._fs)
+        return self._ingest
+    
+    def next_invoice_code(self, now: datetime = None) -> str:
+        """
+        Allouer le prochain code facture FCT-AAAAMM-XXXX
+        
+        Compteur transactionnel par mois (le code ne porte que l'année et le mois,
+        un compteur journalier produirait des doublons d'un jour à l'autre).
+        
+        Lève RuntimeError si le compteur est indisponible: la sauvegarde échoue plutôt
+        que de produire un code hors format (aucun repli ne garantit l'unicité sur 4 chiffres).
+        """
+        now = now or datetime.now()
+        year_month = now.strftime('%Y%m')
+        prefix = f"FCT-{year_month}-"
+        
+        if self._sequences is None:
+            from modules.sequence_service import SequenceService
+            self._sequences = SequenceService(self._fs)
+        
+        sequence = self._sequences.next_value(
+            'invoice_code', scope=year_month,
+            seed=lambda: self._last_invoice_sequence(prefix)
+        )
+        if sequence is None:
+            raise RuntimeError("Compteur des codes facture indisponible, réessayez dans un instant")
+        
+        return f"{prefix}{str(sequence).zfill(4)}"
+    
+    def _last_invoice_sequence(self, prefix: str) -> int:
+        """
+        Plus grand numéro déjà attribué pour un préfixe (reprise à la création du compteur)
+        
+        Seuls les suffixes sur 4 chiffres comptent: les anciens codes horodatés
+        (FCT-AAAAMM-JJHHMMSS) sont triés en tête mais ne doivent pas servir de reprise.
+        """
+        try:
+            from google.cloud.firestore import Query
+            docs = (
+                self._fs.collection('invoices')
+                .where('invoice_code', '>=', prefix)
+                .where('invoice_code', '<', prefix + '\uf8ff')
+                .order_by('invoice_code', direction=Query.DESCENDING)
+                .select(['invoice_code'])
+                .stream()
+            )
+            for doc in docs:
+                suffix = str(doc.to_dict().get('invoice_code', ''))[len(prefix):]
+                if len(suffix) == 4 and suffix.isdigit():
+                    return int(suffix)
+        except Exception as e:
+            print(f"⚠️ Reprise séquence factures {prefix}: {e}")
+        return 0
     
     def get_all_invoices(self, page: int = 1, per_page: int = 50, 
                         supplier: str = '', date_from: str = '', date_to: str = '',
                         restaurant_suppliers: List[str] = None, anomaly_filter: str = '', 
-                        restaurant_id: str = None) -> Dict[str, Any]:
-        """Récupérer toutes les factures depuis Firestore uniquement avec filtres sécurisés"""
+                        restaurant_id: str = None, fields: List[str] = None) -> Dict[str, Any]:
+        """
+        Récupérer toutes les factures depuis Firestore uniquement avec filtres sécurisés
+        
+        Vue résumée (projection INVOICE_LIST_FIELDS) par défaut: le détail complet
+        n'est chargé que par get_invoice_by_id. `fields` permet une autre projection.
+        """
         try:
             if not self._fs_enabled:
                 return {
@@ -54,6 +177,9 @@ class InvoiceManager:
             if restaurant_id:
                 query = query.where('restaurant_id', '==', restaurant_id)
             
+            # Projection: seuls les champs de la vue liste transitent
+            query = query.select(fields or INVOICE_LIST_FIELDS)
+            
             # Récupérer tous les documents
             docs = list(query.stream())
             invoices = []
@@ -149,8 +275,20 @@ class InvoiceManager:
                 if field in invoice_data and field not in invoice_data['analysis']:
                     invoice_data['analysis'][field] = invoice_data[field]
             
-            # Sauvegarder dans Firestore
-            self._fs.collection('invoices').document(invoice_id).set(invoice_data)
+            # Sauvegarder dans Firestore: résumé + détail dans le même batch
+            summary, detail = split_invoice_document(invoice_data)
+            invoice_ref = self._fs.collection('invoices').document(invoice_id)
+            batch = self._fs.batch()
+            batch.set(invoice_ref, summary)
+            batch.set(invoice_ref.collection(DETAIL_SUBCOLLECTION).document(DETAIL_DOC_ID), detail)
+            batch.commit()
+            
+            # Mettre à jour l'agrégat mensuel du dashboard
+            self._get_rollups().apply_invoice(invoice_data)
+            bump_dashboard_version(invoice_data.get('restaurant_id'))
+            
+            # Détection d'anomalies et compteurs en arrière-plan
+            self._get_ingest().emit_invoice_saved(invoice_id, invoice_data)
             
             print(f"✅ Facture sauvegardée avec ID: {invoice_id}")
             return invoice_id
@@ -159,16 +297,82 @@ class InvoiceManager:
             print(f"❌ Erreur save_invoice Firestore: {e}")
             return None
     
+    def update_invoice(self, invoice_id: str, updates: Dict[str, Any]) -> bool:
+        """Modifier une facture et répercuter le changement sur les agrégats du dashboard"""
+        try:
+            if not self._fs_enabled:
+                return False
+            
+            old_invoice = self.get_invoice_by_id(invoice_id)
+            if not old_invoice:
+                print(f"❌ Facture {invoice_id} non trouvée")
+                return False
+            
+            updates['updated_at'] = datetime.now().isoformat()
+            summary_updates, detail_updates = split_invoice_document(updates)
+            invoice_ref = self._fs.collection('invoices').document(invoice_id)
+            batch = self._fs.batch()
+            batch.update(invoice_ref, summary_updates)
+            if detail_updates:
+                batch.set(invoice_ref.collection(DETAIL_SUBCOLLECTION).document(DETAIL_DOC_ID),
+                          detail_updates, merge=True)
+            batch.commit()
+            
+            new_invoice = dict(old_invoice)
+            new_invoice.update(updates)
+            self._get_rollups().replace_invoice(old_invoice, new_invoice)
+            bump_dashboard_version(old_invoice.get('restaurant_id'))
+            if new_invoice.get('restaurant_id') != old_invoice.get('restaurant_id'):
+                bump_dashboard_version(new_invoice.get('restaurant_id'))
+            self._get_ingest().emit_invoice_updated(invoice_id, new_invoice)
+            
+            print(f"✅ Facture {invoice_id} mise à jour")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Erreur update_invoice Firestore: {e}")
+            return False
+    
+    def delete_invoice(self, invoice_id: str) -> bool:
+        """Supprimer une facture et la retirer des agrégats du dashboard"""
+        try:
+            if not self._fs_enabled:
+                return False
+            
+            old_invoice = self.get_invoice_by_id(invoice_id)
+            if not old_invoice:
+                return False
+            
+            invoice_ref = self._fs.collection('invoices').document(invoice_id)
+            batch = self._fs.batch()
+            batch.delete(invoice_ref.collection(DETAIL_SUBCOLLECTION).document(DETAIL_DOC_ID))
+            batch.delete(invoice_ref)
+            batch.commit()
+            self._get_rollups().apply_invoice(old_invoice, sign=-1)
+            bump_dashboard_version(old_invoice.get('restaurant_id'))
+            self._get_ingest().emit_invoice_deleted(invoice_id, old_invoice)
+            
+            print(f"🗑️ Facture {invoice_id} supprimée")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Erreur delete_invoice Firestore: {e}")
+            return False
+    
     def get_invoice_by_id(self, invoice_id: str) -> Dict[str, Any]:
-        """Récupérer une facture par son ID depuis Firestore uniquement"""
+        """Récupérer une facture complète (résumé + détail) par son ID depuis Firestore uniquement"""
         try:
             if not self._fs_enabled:
                 return None
             
-            doc = self._fs.collection('invoices').document(invoice_id).get()
+            invoice_ref = self._fs.collection('invoices').document(invoice_id)
+            doc = invoice_ref.get()
             if doc.exists:
                 data = doc.to_dict()
                 data['id'] = doc.id
+                detail = invoice_ref.collection(DETAIL_SUBCOLLECTION).document(DETAIL_DOC_ID).get()
+                if detail.exists:
+                    merge_invoice_detail(data, detail.to_dict())
                 return data
             return None
             
@@ -176,13 +380,21 @@ class InvoiceManager:
             print(f"❌ Erreur get_invoice_by_id Firestore: {e}")
             return None
     
-    def get_invoices_by_restaurant(self, restaurant_id: str) -> List[Dict[str, Any]]:
-        """Récupérer toutes les factures d'un restaurant depuis Firestore uniquement"""
+    def get_invoices_by_restaurant(self, restaurant_id: str, include_details: bool = False) -> List[Dict[str, Any]]:
+        """
+        Récupérer toutes les factures d'un restaurant depuis Firestore uniquement
+        
+        Vue résumée par défaut; include_details=True recompose les factures complètes
+        (lecture groupée des documents de détail).
+        """
         try:
             if not self._fs_enabled:
                 return []
             
-            docs = list(self._fs.collection('invoices').where('restaurant_id', '==', restaurant_id).stream())
+            query = self._fs.collection('invoices').where('restaurant_id', '==', restaurant_id)
+            if not include_details:
+                query = query.select(INVOICE_LIST_FIELDS)
+            docs = list(query.stream())
             invoices = []
             
             for doc in docs:
@@ -190,9 +402,63 @@ class InvoiceManager:
                 data['id'] = doc.id
                 invoices.append(data)
             
+            if include_details:
+                self._attach_details(invoices)
+            
             print(f"📊 Firestore invoices for restaurant {restaurant_id}: {len(invoices)}")
             return invoices
             
         except Exception as e:
             print(f"❌ Erreur get_invoices_by_restaurant Firestore: {e}")
-            return [] 
\ No newline at end of file
+            return [] 
+    
+    def migrate_to_detail_documents(self) -> Dict[str, Any]:
+        """Déplacer les champs lourds des anciennes factures vers leur document de détail"""
+        try:
+            if not self._fs_enabled:
+                return {'success': False, 'error': 'Firestore non disponible'}
+            
+            migrated = 0
+            batch = self._fs.batch()
+            pending_writes = 0
+            for doc in self._fs.collection('invoices').stream():
+                data = doc.to_dict()
+                summary, detail = split_invoice_document(data)
+                if summary == data:
+                    continue  # Déjà au format résumé
+                
+                # Un détail déjà écrit (modification récente) l'emporte sur les champs inline
+                detail_ref = doc.reference.collection(DETAIL_SUBCOLLECTION).document(DETAIL_DOC_ID)
+                existing = detail_ref.get()
+                if existing.exists:
+                    detail.update(existing.to_dict())
+                batch.set(detail_ref, detail)
+                batch.set(doc.reference, summary)
+                migrated += 1
+                pending_writes += 2
+                if pending_writes >= 400:
+                    batch.commit()
+                    batch = self._fs.batch()
+                    pending_writes = 0
+            if pending_writes:
+                batch.commit()
+            
+            print(f"✅ Migration détails factures: {migrated} factures allégées")
+            return {'success': True, 'migrated': migrated}
+            
+        except Exception as e:
+            print(f"❌ Erreur migration détails factures: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    def _attach_details(self, invoices: List[Dict[str, Any]], chunk_size: int = 300):
+        """Charger les documents de détail par lots (get_all) et les fusionner aux factures"""
+        by_id = {invoice['id']: invoice for invoice in invoices}
+        refs = [
+            self._fs.collection('invoices').document(invoice_id)
+                .collection(DETAIL_SUBCOLLECTION).document(DETAIL_DOC_ID)
+            for invoice_id in by_id
+        ]
+        for start in range(0, len(refs), chunk_size):
+            for snapshot in self._fs.get_all(refs[start:start + chunk_size]):
+                if snapshot.exists:
+                    merge_invoice_detail(by_id[snapshot.reference.parent.parent.id], snapshot.to_dict())
@@ -13,17 +13,18 @@ import cv2
 import numpy as np
 import logging
 from pathlib import Path
+from modules.cpu_pool import run_cpu_task
+
+from modules.heic_decoder import register_opener, is_heic, get_decoded_path
 
 # Support des formats iPhone
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    HEIF_SUPPORT = True
-except ImportError:
-    HEIF_SUPPORT = False
+HEIF_SUPPORT = register_opener()
 
 logger = logging.getLogger(__name__)
 
+# Délai maximal d'un OCR Tesseract (secondes)
+OCR_TIMEOUT = 120
+
 class OCREngine:
     """Moteur OCR unifié utilisant Tesseract"""
     
@@ -52,15 +53,8 @@ class OCREngine:
             }
         
         try:
-            # Prétraiter l'image
-            processed_image = self._preprocess_image(image_path)
-            
-            # OCR avec Tesseract
-            text = pytesseract.image_to_string(
-                processed_image,
-                lang='fra+eng',
-                config='--psm 6'
-            )
+            # Prétraitement + OCR dans le pool CPU (libère le thread de requête)
+            text = run_cpu_task(_ocr_image, image_path, timeout=OCR_TIMEOUT)
             
             return {
                 'success': True,
@@ -77,12 +71,13 @@ class OCREngine:
                 'error': str(e)
             }
     
-    def _preprocess_image(self, image_path: str) -> np.ndarray:
+    @staticmethod
+    def _preprocess_image(image_path: str) -> np.ndarray:
         """Prétraiter l'image pour améliorer l'OCR"""
         # Charger l'image
-        if image_path.lower().endswith(('.heic', '.heif')):
-            pil_image = Image.open(image_path)
-            image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        if is_heic(image_path):
+            # Image décodée partagée avec Claude Vision (un seul décodage HEIC)
+            image = cv2.imread(get_decoded_path(image_path))
         else:
             image = cv2.imread(image_path)
         
@@ -118,4 +113,14 @@ class OCREngine:
     def update_config(self, config: Dict[str, Any]) -> None:
         """Mettre à jour la configuration"""
         # Configuration simple pour Tesseract uniquement
-        pass 
\ No newline at end of file
+        pass 
+
+
+def _ocr_image(image_path: str) -> str:
+    """Prétraiter puis lire une image avec Tesseract (exécuté dans le pool CPU)"""
+    processed_image = OCREngine._preprocess_image(image_path)
+    return pytesseract.image_to_string(
+        processed_image,
+        lang='fra+eng',
+        config='--psm 6'
+    )
@@ -7,15 +7,17 @@ Compare les quantités commandées avec les quantités facturées
 import logging
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
-import difflib
+from modules.product_matcher import ProductMatcher, normalize_product_name
 
 logger = logging.getLogger(__name__)
 
 class OrderInvoiceValidator:
     """Validateur commande vs facture"""
     
-    def __init__(self, order_manager):
+    def __init__(self, order_manager=None, alias_store=None):
         self.order_manager = order_manager
+        # Alias (fournisseur, libellé facture) -> produit catalogue appris des confirmations
+        self.alias_store = alias_store
         
     def compare_order_with_invoice(self, order_id: str, invoice_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -38,6 +40,14 @@ class OrderInvoiceValidator:
                 'error': f'Commande {order_id} non trouvée'
             }
         
+        result = self.validate_invoice_against_order(invoice_data, order)
+        result['order_id'] = order_id
+        return result
+    
+    def validate_invoice_against_order(self, invoice_data: Dict[str, Any], order: Dict[str, Any]) -> Dict[str, Any]:
+        """Comparer une facture scannée avec une commande déjà chargée"""
+        order_id = order.get('id')
+        
         # Données facture
         invoice_products = invoice_data.get('products', [])
         invoice_supplier = invoice_data.get('supplier', '').upper()
@@ -48,7 +58,8 @@ class OrderInvoiceValidator:
             logger.warning(f"⚠️ Fournisseur différent: commande={order_supplier}, facture={invoice_supplier}")
         
         # Comparer produits
-        comparison_results = self._compare_products(order.get('items', []), invoice_products)
+        comparison_results = self._compare_products(order.get('items', []), invoice_products,
+                                                    order.get('supplier', ''))
         
         # Calculer totaux
         order_total = order.get('total_amount', 0)
@@ -74,28 +85,59 @@ class OrderInvoiceValidator:
             'requires_validation': summary['requires_attention']
         }
     
-    def _compare_products(self, order_items: List[Dict], invoice_products: List[Dict]) -> List[Dict]:
+    def _alias_assignment(self, order_items: List[Dict], invoice_products: List[Dict],
+                          supplier: str) -> List[Optional[Tuple[int, float]]]:
+        """Paires commande/facture déjà confirmées (alias connus), confiance 1"""
+        assignment: List[Optional[Tuple[int, float]]] = [None] * len(order_items)
+        if not self.alias_store or not supplier or not invoice_products:
+            return assignment
+        
+        canonical = self.alias_store.canonical_names(supplier, [p.get('name', '') for p in invoice_products])
+        order_index: Dict[str, List[int]] = {}
+        for index, item in enumerate(order_items):
+            order_index.setdefault(normalize_product_name(item.get('product_name', '')), []).append(index)
+        
+        for invoice_index, canonical_name in enumerate(canonical):
+            if not canonical_name:
+                continue
+            candidates = order_index.get(normalize_product_name(canonical_name))
+            if candidates:
+                assignment[candidates.pop(0)] = (invoice_index, 1.0)
+        return assignment
+    
+    def _compare_products(self, order_items: List[Dict], invoice_products: List[Dict],
+                          supplier: str = '') -> List[Dict]:
         """Comparer les produits de la commande avec ceux de la facture"""
         results = []
         
-        # Créer index des produits facture pour matching
-        invoice_index = {self._normalize_product_name(p['name']): p for p in invoice_products}
-        
-        # Produits utilisés (pour détecter les extras)
+        # 1. Alias confirmés: lecture directe, sans rapprochement flou
+        assignment = self._alias_assignment(order_items, invoice_products, supplier)
+        aliased = {match[0] for match in assignment if match}
+        
+        # 2. Lignes restantes: index trigrammes puis affectation globale un-pour-un
+        # (une ligne facture ne peut correspondre qu'à une seule ligne commande)
+        pending_orders = [i for i, match in enumerate(assignment) if match is None]
+        pending_invoice = [i for i in range(len(invoice_products)) if i not in aliased]
+        if pending_orders and pending_invoice:
+            matcher = ProductMatcher([invoice_products[i].get('name', '') for i in pending_invoice])
+            fuzzy = matcher.assign([order_items[i].get('product_name', '') for i in pending_orders])
+            for order_index, match in zip(pending_orders, fuzzy):
+                if match:
+                    assignment[order_index] = (pending_invoice[match[0]], match[1])
+        
+        # Lignes facture utilisées (pour détecter les extras)
         used_invoice_products = set()
         
         # Comparer chaque item de commande
-        for order_item in order_items:
+        for order_item, match in zip(order_items, assignment):
             order_name = order_item.get('product_name', '')
             order_qty = order_item.get('quantity', 0)
             order_price = order_item.get('unit_price', 0)
             
-            # Chercher correspondance dans facture
-            match_result = self._find_best_match(order_name, invoice_index)
-            
-            if match_result['match']:
-                invoice_product = match_result['product']
-                used_invoice_products.add(match_result['normalized_name'])
+            if match:
+                invoice_index, confidence = match
+                invoice_product = invoice_products[invoice_index]
+                used_invoice_products.add(invoice_index)
                 
                 # Comparer quantités
                 invoice_qty = invoice_product.get('quantity', 0)
@@ -110,7 +152,7 @@ class OrderInvoiceValidator:
                 results.append({
                     'order_product': order_name,
                     'invoice_product': invoice_product['name'],
-                    'match_confidence': match_result['confidence'],
+                    'match_confidence': confidence,
                     'order_quantity': order_qty,
                     'invoice_quantity': invoice_qty,
                     'quantity_difference': qty_diff,
@@ -139,8 +181,8 @@ class OrderInvoiceValidator:
                 })
         
         # Ajouter produits facturés mais pas commandés
-        for normalized_name, invoice_product in invoice_index.items():
-            if normalized_name not in used_invoice_products:
+        for invoice_index, invoice_product in enumerate(invoice_products):
+            if invoice_index not in used_invoice_products:
                 results.append({
                     'order_product': None,
                     'invoice_product': invoice_product['name'],
@@ -158,67 +200,6 @@ class OrderInvoiceValidator:
         
         return results
     
-    def _normalize_product_name(self, name: str) -> str:
-        """Normaliser nom de produit pour matching"""
-        import re
-        
-        # Nettoyer et normaliser
-        normalized = name.upper()
-        normalized = re.sub(r'[^\w\s]', ' ', normalized)  # Supprimer ponctuation
-        normalized = re.sub(r'\s+', ' ', normalized).strip()  # Espaces multiples
-        
-        # Supprimer mots courants qui perturbent matching
-        stop_words = ['DE', 'DU', 'LA', 'LE', 'LES', 'ET', 'AVEC', 'SANS', 'POUR']
-        words = [w for w in normalized.split() if w not in stop_words and len(w) > 2]
-        
-        return ' '.join(words)
-    
-    def _find_best_match(self, order_name: str, invoice_index: Dict) -> Dict:
-        """Trouver la meilleure correspondance pour un produit"""
-        normalized_order = self._normalize_product_name(order_name)
-        
-        # Recherche exacte
-        if normalized_order in invoice_index:
-            return {
-                'match': True,
-                'product': invoice_index[normalized_order],
-                'normalized_name': normalized_order,
-                'confidence': 1.0
-            }
-        
-        # Recherche par similarité
-        best_match = None
-        best_confidence = 0
-        best_name = None
-        
-        for invoice_name, product in invoice_index.items():
-            # Calculer similarité
-            similarity = difflib.SequenceMatcher(None, normalized_order, invoice_name).ratio()
-            
-            # Bonus si mots clés communs
-            order_words = set(normalized_order.split())
-            invoice_words = set(invoice_name.split())
-            common_words = order_words.intersection(invoice_words)
-            
-            if common_words:
-                word_bonus = len(common_words) / max(len(order_words), len(invoice_words))
-                similarity = (similarity + word_bonus) / 2
-            
-            if similarity > best_confidence and similarity > 0.6:  # Seuil minimum
-                best_confidence = similarity
-                best_match = product
-                best_name = invoice_name
-        
-        if best_match:
-            return {
-                'match': True,
-                'product': best_match,
-                'normalized_name': best_name,
-                'confidence': best_confidence
-            }
-        
-        return {'match': False, 'confidence': 0}
-    
     def _determine_status(self, qty_diff: float, price_diff: float) -> str:
         """Déterminer le statut de comparaison"""
         if abs(qty_diff) < 0.01 and abs(price_diff) < 0.01:
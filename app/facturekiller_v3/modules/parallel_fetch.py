@@ -0,0 +1,128 @@
+"""
+Lectures Firestore concurrentes pour les endpoints multi-sources
+Les handlers déclarent leurs lectures indépendantes, exécutées en parallèle dans un pool
+de threads avec une échéance commune: la latence suit la lecture la plus lente, pas la somme
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Callable, Any
+
+try:
+    from flask import has_request_context, copy_current_request_context
+    FLASK_CONTEXT = True
+except ImportError:
+    FLASK_CONTEXT = False
+
+logger = logging.getLogger(__name__)
+
+# Les lectures Firestore sont des appels réseau (gRPC): beaucoup de threads pour peu de CPU
+FETCH_WORKERS = int(os.getenv('FIRESTORE_FETCH_WORKERS', '16'))
+DEFAULT_DEADLINE = float(os.getenv('FIRESTORE_FETCH_DEADLINE', '20'))
+
+# Deux niveaux de pool: un handler lance des lectures (niveau 0), qui peuvent elles-mêmes
+# lancer des sous-lectures (niveau 1, pool séparé). Au-delà, exécution en séquence:
+# un worker n'attend jamais une tâche en file dans son propre pool (pas d'interblocage)
+MAX_DEPTH = 2
+
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+_worker_state = threading.local()
+
+# Valeur sentinelle: pas de repli, l'échec ou le dépassement est propagé
+REQUIRED = object()
+
+
+class FetchTimeout(Exception):
+    """Une lecture requise n'a pas abouti avant l'échéance commune"""
+
+
+def _get_executor(depth: int) -> ThreadPoolExecutor:
+    """Pool de threads partagé du processus pour un niveau d'imbrication (créé au premier usage)"""
+    executor = _executors.get(depth)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(depth)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix=f'fs-fetch-{depth}')
+                _executors[depth] = executor
+    return executor
+
+
+def _run_in_worker(func: Callable[[], Any], depth: int) -> Any:
+    """Exécuter une lecture en notant le niveau d'imbrication du thread"""
+    _worker_state.depth = depth + 1
+    try:
+        return func()
+    finally:
+        _worker_state.depth = 0
+
+
+def fetch_parallel(tasks: Dict[str, Callable[[], Any]], timeout: float = DEFAULT_DEADLINE,
+                   defaults: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Exécuter des lectures indépendantes en parallèle et retourner {nom: résultat}
+
+    Args:
+        tasks: lectures sans argument (lambda) indexées par nom
+        timeout: échéance commune en secondes pour l'ensemble des lectures
+        defaults: valeurs de repli par nom si la lecture échoue ou dépasse l'échéance;
+                  sans repli, l'exception (ou FetchTimeout) est propagée
+
+    Le contexte de requête Flask (session, g) est propagé aux threads. Les appels imbriqués
+    utilisent le pool du niveau suivant, puis s'exécutent en séquence au-delà de MAX_DEPTH.
+    """
+    defaults = defaults or {}
+    if not tasks:
+        return {}
+
+    depth = getattr(_worker_state, 'depth', 0)
+    if depth >= MAX_DEPTH or len(tasks) == 1:
+        return {name: _call_with_default(name, func, defaults) for name, func in tasks.items()}
+
+    executor = _get_executor(depth)
+    futures = {}
+    for name, func in tasks.items():
+        if FLASK_CONTEXT and has_request_context():
+            func = copy_current_request_context(func)
+        futures[name] = executor.submit(_run_in_worker, func, depth)
+
+    start = time.perf_counter()
+    done, not_done = wait(futures.values(), timeout=timeout)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    results = {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            if defaults.get(name, REQUIRED) is REQUIRED:
+                raise FetchTimeout(f"Lecture '{name}' non terminée après {timeout:g}s")
+            logger.warning(f"⏱️ Lecture '{name}' abandonnée après {timeout:g}s, valeur de repli utilisée")
+            results[name] = defaults[name]
+            continue
+
+        error = future.exception()
+        if error is not None:
+            if defaults.get(name, REQUIRED) is REQUIRED:
+                raise error
+            logger.warning(f"⚠️ Lecture '{name}' en échec ({error}), valeur de repli utilisée")
+            results[name] = defaults[name]
+        else:
+            results[name] = future.result()
+
+    logger.debug(f"⚡ {len(tasks)} lectures parallèles en {elapsed_ms:.0f}ms")
+    return results
+
+
+def _call_with_default(name: str, func: Callable[[], Any], defaults: Dict[str, Any]) -> Any:
+    """Exécution séquentielle avec la même politique de repli"""
+    try:
+        return func()
+    except Exception as e:
+        if defaults.get(name, REQUIRED) is REQUIRED:
+            raise
+        logger.warning(f"⚠️ Lecture '{name}' en échec ({e}), valeur de repli utilisée")
+        return defaults[name]
@@ -0,0 +1,121 @@
+"""
+Lecture des factures PDF (factures reçues par email)
+Extraction directe de la couche texte, sinon rastérisation des pages en parallèle
+"""
+
+import os
+import logging
+from typing import Dict, List, Any
+from modules.cpu_pool import run_cpu_task, map_cpu_tasks
+
+# Extraction de texte
+try:
+    from PyPDF2 import PdfReader
+    PDF_TEXT_SUPPORT = True
+except ImportError:
+    PDF_TEXT_SUPPORT = False
+
+# Rendu des pages en images
+try:
+    import pypdfium2 as pdfium
+    PDF_RENDER_SUPPORT = True
+except ImportError:
+    PDF_RENDER_SUPPORT = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DPI = 200
+MIN_DPI = 72
+MAX_DPI = 300
+
+# En dessous de ce nombre de caractères par page, on considère le PDF comme scanné
+MIN_TEXT_CHARS_PER_PAGE = 80
+
+
+class PDFReader:
+    """Lecteur de factures PDF: texte embarqué ou pages rastérisées"""
+
+    def is_pdf(self, file_path: str) -> bool:
+        """Vérifier si un fichier est un PDF"""
+        return bool(file_path) and file_path.lower().endswith('.pdf')
+
+    def extract_text(self, pdf_path: str) -> Dict[str, Any]:
+        """Extraire la couche texte du PDF si elle existe"""
+        if not PDF_TEXT_SUPPORT:
+            return {
+                'success': False,
+                'has_text_layer': False,
+                'error': 'PyPDF2 non installé'
+            }
+
+        try:
+            pages_text = run_cpu_task(_extract_pages_text, pdf_path, timeout=30)
+            text = '\n'.join(pages_text)
+            meaningful_chars = len(''.join(text.split()))
+            page_count = max(len(pages_text), 1)
+
+            has_text_layer = meaningful_chars >= MIN_TEXT_CHARS_PER_PAGE * page_count
+            logger.info(f"📄 PDF {os.path.basename(pdf_path)}: {len(pages_text)} pages, "
+                        f"{meaningful_chars} caractères (texte embarqué: {has_text_layer})")
+
+            return {
+                'success': True,
+                'has_text_layer': has_text_layer,
+                'text': text,
+                'page_count': len(pages_text)
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Erreur extraction texte PDF: {e}")
+            return {
+                'success': False,
+                'has_text_layer': False,
+                'error': str(e)
+            }
+
+    def rasterize(self, pdf_path: str, dpi: int = DEFAULT_DPI, output_dir: str = None) -> List[str]:
+        """Rastériser toutes les pages en JPEG, en parallèle dans le pool CPU"""
+        if not PDF_RENDER_SUPPORT:
+            raise RuntimeError('pypdfium2 non installé - rendu PDF indisponible')
+
+        dpi = max(MIN_DPI, min(MAX_DPI, int(dpi)))
+        output_dir = output_dir or os.path.dirname(pdf_path)
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+
+        page_count = run_cpu_task(_count_pages, pdf_path, timeout=30)
+        tasks = [
+            (pdf_path, index, dpi, os.path.join(output_dir, f"{base_name}_page{index + 1}.jpg"))
+            for index in range(page_count)
+        ]
+
+        logger.info(f"🖼️ Rastérisation de {page_count} pages à {dpi} DPI")
+        return map_cpu_tasks(_render_page, tasks, timeout=30 + 15 * page_count)
+
+
+def _extract_pages_text(pdf_path: str) -> List[str]:
+    """Texte de chaque page (exécuté dans le pool CPU)"""
+    reader = PdfReader(pdf_path)
+    return [page.extract_text() or '' for page in reader.pages]
+
+
+def _count_pages(pdf_path: str) -> int:
+    """Nombre de pages du document (exécuté dans le pool CPU)"""
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _render_page(pdf_path: str, page_index: int, dpi: int, output_path: str) -> str:
+    """Rendre une page en JPEG (exécuté dans le pool CPU)"""
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        page = pdf[page_index]
+        image = page.render(scale=dpi / 72).to_pil()
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(output_path, 'JPEG', quality=90, optimize=True)
+        return output_path
+    finally:
+        pdf.close()
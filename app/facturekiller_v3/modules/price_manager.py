@@ -10,9 +10,29 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime
 import logging
 import re
+from modules.dashboard_cache import bump_dashboard_version
+from modules.product_alias_store import ProductAliasStore
+from modules.product_matcher import normalize_product_name
+from modules.catalogue_index import CatalogueIndex, CATALOGUE_MATCH_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    from google.api_core.exceptions import AlreadyExists
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    FIRESTORE_SDK = False
+
+    class AlreadyExists(Exception):
+        """Remplaçant sans SDK Firestore"""
+
+# Produits en attente: document id = str(id numérique) pour un accès direct
+PENDING_COLLECTION = 'pending_products'
+# Produits par transaction de validation/rejet en masse (2 écritures par produit, limite 500)
+PENDING_BATCH_SIZE = 200
+
 # === Firestore ===
 try:
     from modules.firestore_db import available as _fs_available, get_client as _fs_client
@@ -43,6 +63,11 @@ class PriceManager:
             print(f"❌ Erreur initialisation Firestore PriceManager: {e}")
             self._fs_enabled = False
             self._fs = None
+        
+        # Alias (fournisseur, libellé facture) -> produit du catalogue
+        self.aliases = ProductAliasStore(self._fs)
+        # Index flou du catalogue par fournisseur (tenu à jour par les écritures de prix)
+        self.catalogue = CatalogueIndex(self._fs if self._fs_enabled else None)
     
     def is_connected(self) -> bool:
         """Vérifier si Firestore est accessible"""
@@ -294,10 +319,12 @@ class PriceManager:
             if existing_docs:
                 # Mettre à jour le produit existant
                 existing_docs[0].reference.update(price_data)
+                self.catalogue.upsert(existing_docs[0].id, price_data)
                 stats['updated_products'] += 1
             else:
                 # Ajouter nouveau produit
-                self._fs.collection('prices').add(price_data)
+                _, price_ref = self._fs.collection('prices').add(price_data)
+                self.catalogue.upsert(price_ref.id, price_data)
                 stats['new_products'] += 1
                 
         except Exception as e:
@@ -328,14 +355,14 @@ class PriceManager:
                 'missing_products': []
             }
             
-            for product in products:
+            # Références résolues par lot (alias + index du catalogue, par fournisseur)
+            ref_prices = self.find_product_prices(products, restaurant_name)
+            
+            for product, ref_price in zip(products, ref_prices):
                 product_name = product.get('produit', product.get('name', ''))
                 supplier = product.get('fournisseur', product.get('supplier', ''))
                 invoice_price = float(product.get('prix', product.get('price', 0)))
                 
-                # Chercher le prix de référence
-                ref_price = self.find_product_price(product_name, supplier, restaurant_name)
-                
                 if ref_price:
                     ref_price_value = float(ref_price.get('prix', ref_price.get('prix_unitaire', 0)))
                     price_diff = invoice_price - ref_price_value
@@ -349,7 +376,9 @@ class PriceManager:
                         'reference_price': ref_price_value,
                         'difference': price_diff,
                         'difference_percent': price_diff_percent,
-                        'status': 'match'
+                        'status': 'match',
+                        'reference_product': ref_price.get('produit', product_name),
+                        'match_score': ref_price.get('match_score', 1.0)
                     })
                 else:
                     results['unmatched_products'] += 1
@@ -373,6 +402,60 @@ class PriceManager:
                 'error': str(e)
             }
     
+    def _match_catalogue(self, products: List[Dict], restaurant_name: str = None,
+                         exact: bool = False) -> List[tuple]:
+        """
+        Prix de référence de chaque produit via l'index du catalogue: [(indexé, prix ou None)]
+        
+        Produits groupés par fournisseur: alias lus en un get_all, puis une seule matrice
+        de scores par fournisseur. exact=True: libellé brut identique (sans casse) ou alias,
+        sans rapprochement par nom normalisé (HUILE 1L ≠ HUILE 5L). indexé=False si le
+        fournisseur est inconnu ou son catalogue indisponible.
+        """
+        matches = [(False, None)] * len(products)
+        groups: Dict[str, List[int]] = {}
+        for index, product in enumerate(products):
+            supplier = product.get('fournisseur', product.get('supplier', ''))
+            if supplier:
+                groups.setdefault(supplier, []).append(index)
+        
+        for supplier, indexes in groups.items():
+            if not self.catalogue.is_loaded(supplier):
+                continue
+            names = [products[i].get('produit', products[i].get('name', '')) for i in indexes]
+            canonical = self.aliases.canonical_names(supplier, names)
+            queries = [alias or name for name, alias in zip(names, canonical)]
+            if exact:
+                best = self.catalogue.exact_many(supplier, queries, restaurant_name)
+            else:
+                best = self.catalogue.best_many(supplier, queries, restaurant_name, CATALOGUE_MATCH_THRESHOLD)
+            for index, name, match in zip(indexes, names, best):
+                if match:
+                    data, score = match
+                    ref_price = {**data, 'match_score': round(score, 3)}
+                    if normalize_product_name(data.get('produit', '')) != normalize_product_name(name):
+                        ref_price['matched_from'] = name
+                    matches[index] = (True, ref_price)
+                else:
+                    matches[index] = (True, None)
+        return matches
+    
+    def find_product_prices(self, products: List[Dict], restaurant_name: str = None,
+                            exact_only: bool = False) -> List[Optional[Dict]]:
+        """
+        Prix de référence d'un lot de produits (index du catalogue, requête unitaire en repli)
+        
+        exact_only: libellé exact ou alias confirmé uniquement (pas de rapprochement flou)
+        """
+        ref_prices = []
+        for product, (indexed, ref_price) in zip(products, self._match_catalogue(products, restaurant_name, exact_only)):
+            if not indexed:
+                ref_price = self.find_product_price(product.get('produit', product.get('name', '')),
+                                                    product.get('fournisseur', product.get('supplier', '')),
+                                                    restaurant_name, fuzzy=not exact_only)
+            ref_prices.append(ref_price)
+        return ref_prices
+    
     def add_pending_product_OLD(self, code: str, name: str, price: float, 
                            unit: str = 'unité', supplier: str = 'UNKNOWN', 
                            category: str = 'Non classé') -> int:
@@ -381,16 +464,21 @@ class PriceManager:
         return 0
     
     def get_pending_products(self) -> List[Dict]:
-        """Récupérer tous les produits en attente depuis Firestore uniquement"""
+        """
+        Récupérer tous les produits en attente depuis Firestore uniquement (lecture seule)
+        
+        Les anciens documents (id auto Firestore) restent lisibles via leur champ 'id';
+        leur réindexation passe par migrate_pending_doc_ids (route admin).
+        """
         try:
             if not self._fs_enabled:
                 return []
             
-            docs = list(self._fs.collection('pending_products').stream())
             products = []
-            for doc in docs:
+            for doc in self._fs.collection(PENDING_COLLECTION).stream():
                 data = doc.to_dict()
-                data['id'] = doc.id
+                if not isinstance(data.get('id'), int):
+                    data['id'] = doc.id
                 products.append(data)
             
             print(f"📊 Firestore pending products: {len(products)}")
@@ -400,69 +488,172 @@ class PriceManager:
             print(f"❌ Erreur get_pending_products Firestore: {e}")
             return []
     
-    def validate_pending_product(self, pending_id: int) -> bool:
-        """Valider un produit en attente (le déplacer vers les prix validés)"""
+    def migrate_pending_doc_ids(self) -> Dict[str, Any]:
+        """Réenregistrer les anciens produits en attente (id auto Firestore) sous leur id numérique"""
         try:
             if not self._fs_enabled:
-                return False
-            
-            # Récupérer le produit en attente
-            pending_docs = list(self._fs.collection('pending_products').where('id', '==', pending_id).stream())
-            if not pending_docs:
-                print(f"❌ Produit en attente {pending_id} non trouvé")
-                return False
+                return {'success': False, 'error': 'Firestore non disponible'}
             
-            pending_doc = pending_docs[0]
-            pending_data = pending_doc.to_dict()
-            
-            # Préparer les données pour les prix validés
-            validated_data = {
-                'code': pending_data.get('code', ''),
-                'produit': pending_data.get('produit', ''),
-                'fournisseur': pending_data.get('fournisseur', ''),
-                'prix': pending_data.get('prix', 0),
-                'prix_unitaire': pending_data.get('prix', 0),
-                'unite': pending_data.get('unite', 'unité'),
-                'categorie': pending_data.get('categorie', 'Non classé'),
-                'date_maj': datetime.now().isoformat(),
-                'actif': True,
-                'restaurant': pending_data.get('restaurant', 'Général')
-            }
-            
-            # Ajouter aux prix validés
-            self._fs.collection('prices').add(validated_data)
-            
-            # Supprimer des produits en attente
-            pending_doc.reference.delete()
+            docs = list(self._fs.collection(PENDING_COLLECTION).stream())
+            used_ids = {doc.id for doc in docs}
+            legacy_docs = []
+            for doc in docs:
+                data = doc.to_dict()
+                if isinstance(data.get('id'), int) and doc.id != str(data['id']):
+                    legacy_docs.append((doc, data))
+            
+            batch = self._fs.batch()
+            for count, (doc, data) in enumerate(legacy_docs, start=1):
+                # Deux ajouts dans la même milliseconde partageaient le même id numérique
+                while str(data['id']) in used_ids:
+                    data['id'] += 1
+                used_ids.add(str(data['id']))
+                batch.set(self._pending_ref(data['id']), data)
+                batch.delete(doc.reference)
+                if count % PENDING_BATCH_SIZE == 0:
+                    batch.commit()
+                    batch = self._fs.batch()
+            batch.commit()
+            print(f"🔄 {len(legacy_docs)} produits en attente réindexés par id")
+            return {'success': True, 'migrated': len(legacy_docs)}
+        except Exception as e:
+            print(f"❌ Erreur réindexation produits en attente: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    def _pending_ref(self, pending_id):
+        return self._fs.collection(PENDING_COLLECTION).document(str(pending_id))
+    
+    def _resolve_pending_refs(self, pending_ids: List) -> List:
+        """Références des produits en attente: lecture directe par id, requête seulement pour les anciens documents"""
+        refs = {str(pid): self._pending_ref(pid) for pid in pending_ids}
+        found = {snapshot.id: snapshot.reference
+                 for snapshot in self._fs.get_all(list(refs.values())) if snapshot.exists}
+        
+        missing = [int(pid) for pid in refs if pid not in found and pid.lstrip('-').isdigit()]
+        for start in range(0, len(missing), 10):
+            query = self._fs.collection(PENDING_COLLECTION).where('id', 'in', missing[start:start + 10])
+            for doc in query.stream():
+                found[str(doc.to_dict().get('id'))] = doc.reference
+        
+        return [found[pid] for pid in refs if pid in found]
+    
+    @staticmethod
+    def _validated_price_from_pending(pending_data: Dict) -> Dict:
+        """Données du prix de référence créé à la validation d'un produit en attente"""
+        return {
+            'code': pending_data.get('code', ''),
+            'produit': pending_data.get('produit', ''),
+            'fournisseur': pending_data.get('fournisseur', ''),
+            'prix': pending_data.get('prix', 0),
+            'prix_unitaire': pending_data.get('prix', 0),
+            'unite': pending_data.get('unite', 'unité'),
+            'categorie': pending_data.get('categorie', 'Non classé'),
+            'date_maj': datetime.now().isoformat(),
+            'actif': True,
+            'restaurant': pending_data.get('restaurant', 'Général')
+        }
+    
+    def get_pending_product(self, pending_id) -> Optional[Dict]:
+        """Récupérer un produit en attente par son id (lecture directe)"""
+        try:
+            if not self._fs_enabled:
+                return None
             
-            print(f"✅ Produit {pending_id} validé et déplacé vers les prix")
-            return True
+            refs = self._resolve_pending_refs([pending_id])
+            if not refs:
+                return None
+            snapshot = refs[0].get()
+            return snapshot.to_dict() if snapshot.exists else None
             
         except Exception as e:
-            print(f"❌ Erreur validation produit Firestore: {e}")
-            return False
+            print(f"❌ Erreur get_pending_product Firestore: {e}")
+            return None
     
-    def reject_pending_product(self, pending_id: int) -> bool:
-        """Rejeter un produit en attente (le supprimer)"""
+    def _process_pending_products(self, pending_ids: List, validate: bool) -> Dict[str, Any]:
+        """
+        Valider (déplacer vers prices) ou rejeter des produits en attente par lots transactionnels
+        
+        Chaque lot relit ses produits dans la transaction: un produit déjà traité par
+        une requête concurrente n'est ni validé deux fois ni compté.
+        """
+        processed = []
+        created_prices = []
+        refs = self._resolve_pending_refs(pending_ids)
+        
+        @_firestore.transactional
+        def _apply(transaction, chunk):
+            # Tentative rejouée en cas de conflit: seuls les prix de la dernière comptent
+            created_prices.clear()
+            snapshots = [snapshot for snapshot in transaction.get_all(chunk) if snapshot.exists]
+            for snapshot in snapshots:
+                if validate:
+                    price_ref = self._fs.collection('prices').document()
+                    price_data = self._validated_price_from_pending(snapshot.to_dict())
+                    transaction.set(price_ref, price_data)
+                    created_prices.append((price_ref.id, price_data))
+                transaction.delete(snapshot.reference)
+            return [(snapshot.id, snapshot.to_dict()) for snapshot in snapshots]
+        
+        processed_ids = set()
+        for start in range(0, len(refs), PENDING_BATCH_SIZE):
+            for doc_id, product in _apply(self._fs.transaction(), refs[start:start + PENDING_BATCH_SIZE]):
+                processed_ids.update({doc_id, str(product.get('id', doc_id))})
+                processed.append(product)
+            for price_id, price_data in created_prices:
+                self.catalogue.upsert(price_id, price_data)
+        
+        if processed:
+            bump_dashboard_version()
+        
+        return {
+            'processed': len(processed),
+            'products': processed,
+            'not_found': [pid for pid in pending_ids if str(pid) not in processed_ids]
+        }
+    
+    def validate_pending_products(self, pending_ids: List) -> Dict[str, Any]:
+        """Valider plusieurs produits en attente (transactions par lots)"""
         try:
             if not self._fs_enabled:
-                return False
+                return {'success': False, 'processed': 0, 'products': [], 'not_found': list(pending_ids),
+                        'error': 'Firestore non disponible'}
             
-            # Récupérer le produit en attente
-            pending_docs = list(self._fs.collection('pending_products').where('id', '==', pending_id).stream())
-            if not pending_docs:
-                print(f"❌ Produit en attente {pending_id} non trouvé")
-                return False
+            result = self._process_pending_products(pending_ids, validate=True)
+            print(f"✅ {result['processed']} produits validés et déplacés vers les prix")
+            return {'success': True, **result}
             
-            # Supprimer le produit
-            pending_docs[0].reference.delete()
+        except Exception as e:
+            print(f"❌ Erreur validation produits Firestore: {e}")
+            return {'success': False, 'processed': 0, 'products': [], 'not_found': list(pending_ids), 'error': str(e)}
+    
+    def reject_pending_products(self, pending_ids: List) -> Dict[str, Any]:
+        """Rejeter plusieurs produits en attente (transactions par lots)"""
+        try:
+            if not self._fs_enabled:
+                return {'success': False, 'processed': 0, 'products': [], 'not_found': list(pending_ids),
+                        'error': 'Firestore non disponible'}
             
-            print(f"✅ Produit {pending_id} rejeté et supprimé")
-            return True
+            result = self._process_pending_products(pending_ids, validate=False)
+            print(f"✅ {result['processed']} produits rejetés et supprimés")
+            return {'success': True, **result}
             
         except Exception as e:
-            print(f"❌ Erreur rejet produit Firestore: {e}")
-            return False
+            print(f"❌ Erreur rejet produits Firestore: {e}")
+            return {'success': False, 'processed': 0, 'products': [], 'not_found': list(pending_ids), 'error': str(e)}
+    
+    def validate_pending_product(self, pending_id: int) -> bool:
+        """Valider un produit en attente (le déplacer vers les prix validés)"""
+        result = self.validate_pending_products([pending_id])
+        if not result['processed']:
+            print(f"❌ Produit en attente {pending_id} non trouvé")
+        return result['processed'] > 0
+    
+    def reject_pending_product(self, pending_id: int) -> bool:
+        """Rejeter un produit en attente (le supprimer)"""
+        result = self.reject_pending_products([pending_id])
+        if not result['processed']:
+            print(f"❌ Produit en attente {pending_id} non trouvé")
+        return result['processed'] > 0
     
     def update_pending_product(self, pending_id: int, updates: Dict) -> bool:
         """Mettre à jour un produit en attente"""
@@ -470,15 +661,16 @@ class PriceManager:
             if not self._fs_enabled:
                 return False
             
-            # Récupérer le produit en attente
-            pending_docs = list(self._fs.collection('pending_products').where('id', '==', pending_id).stream())
-            if not pending_docs:
+            # Lecture directe par id (requête uniquement pour un ancien document)
+            refs = self._resolve_pending_refs([pending_id])
+            if not refs:
                 print(f"❌ Produit en attente {pending_id} non trouvé")
                 return False
             
             # Mettre à jour le produit
             updates['date_maj'] = datetime.now().isoformat()
-            pending_docs[0].reference.update(updates)
+            refs[0].update(updates)
+            bump_dashboard_version()
             
             print(f"✅ Produit {pending_id} mis à jour")
             return True
@@ -493,13 +685,19 @@ class PriceManager:
             if not self._fs_enabled:
                 return False
             
-            # Générer un ID unique
+            # Générer un ID unique (document id = id numérique)
             product_data['id'] = int(datetime.now().timestamp() * 1000)
             product_data['date_ajout'] = datetime.now().isoformat()
             product_data['status'] = 'pending'
             
-            # Ajouter à Firestore
-            self._fs.collection('pending_products').add(product_data)
+            # create() échoue si l'id existe déjà (deux ajouts dans la même milliseconde)
+            while True:
+                try:
+                    self._pending_ref(product_data['id']).create(product_data)
+                    break
+                except AlreadyExists:
+                    product_data['id'] += 1
+            bump_dashboard_version()
             
             print(f"✅ Produit en attente ajouté: {product_data.get('produit', '')}")
             return True
@@ -550,7 +748,8 @@ class PriceManager:
             price_data['actif'] = True
             
             # Ajouter à Firestore
-            self._fs.collection('prices').add(price_data)
+            _, price_ref = self._fs.collection('prices').add(price_data)
+            self.catalogue.upsert(price_ref.id, price_data)
             
             print(f"✅ Prix ajouté: {price_data.get('produit', '')}")
             return True
@@ -559,6 +758,41 @@ class PriceManager:
             print(f"❌ Erreur ajout prix Firestore: {e}")
             return False
     
+    def add_prices(self, prices: List[Dict], doc_ids: List[str] = None) -> List[Optional[str]]:
+        """
+        Ajouter plusieurs prix validés en écritures groupées; identifiant de chaque prix (None si échec)
+        
+        doc_ids: identifiants imposés (déterministes): réécrire le même lot remplace les
+        mêmes documents au lieu de créer des doublons
+        """
+        ids: List[Optional[str]] = []
+        try:
+            if not self._fs_enabled:
+                return [None] * len(prices)
+            
+            collection = self._fs.collection('prices')
+            for start in range(0, len(prices), PENDING_BATCH_SIZE):
+                batch = self._fs.batch()
+                written = []
+                for offset, price_data in enumerate(prices[start:start + PENDING_BATCH_SIZE], start):
+                    price_data['date_maj'] = datetime.now().isoformat()
+                    price_data['actif'] = True
+                    price_ref = collection.document(doc_ids[offset]) if doc_ids else collection.document()
+                    batch.set(price_ref, price_data)
+                    written.append((price_ref.id, price_data))
+                batch.commit()
+                for price_id, price_data in written:
+                    self.catalogue.upsert(price_id, price_data)
+                    ids.append(price_id)
+            
+            print(f"✅ {len(ids)} prix ajoutés")
+            return ids + [None] * (len(prices) - len(ids))
+            
+        except Exception as e:
+            print(f"❌ Erreur ajout prix groupé Firestore: {e}")
+            # Lots déjà validés conservés
+            return ids + [None] * (len(prices) - len(ids))
+    
     def update_price(self, code: str, updates: Dict) -> bool:
         """Mettre à jour un prix dans Firestore uniquement"""
         try:
@@ -574,6 +808,8 @@ class PriceManager:
             # Mettre à jour
             updates['date_maj'] = datetime.now().isoformat()
             docs[0].reference.update(updates)
+            previous = docs[0].to_dict()
+            self.catalogue.upsert(docs[0].id, {**previous, **updates}, previous.get('fournisseur'))
             
             print(f"✅ Prix {code} mis à jour")
             return True
@@ -597,6 +833,8 @@ class PriceManager:
             # Mettre à jour
             updates['date_maj'] = datetime.now().isoformat()
             docs[0].reference.update(updates)
+            previous = docs[0].to_dict()
+            self.catalogue.upsert(docs[0].id, {**previous, **updates}, previous.get('fournisseur'))
             
             print(f"✅ Prix {price_id} mis à jour")
             return True
@@ -619,6 +857,7 @@ class PriceManager:
             
             # Supprimer
             docs[0].reference.delete()
+            self.catalogue.remove(docs[0].id, docs[0].to_dict().get('fournisseur', ''))
             
             print(f"✅ Prix {code} supprimé")
             return True
@@ -641,6 +880,7 @@ class PriceManager:
             
             # Supprimer
             docs[0].reference.delete()
+            self.catalogue.remove(docs[0].id, docs[0].to_dict().get('fournisseur', ''))
             
             print(f"✅ Prix {price_id} supprimé")
             return True
@@ -675,6 +915,7 @@ class PriceManager:
             
             # Supprimer le prix
             price_doc.reference.delete()
+            self.catalogue.remove(price_doc.id, price_data.get('fournisseur', ''))
             
             # Supprimer les produits en attente associés
             pending_docs = list(self._fs.collection('pending_products').where('produit', '==', price_data.get('produit', '')).stream())
@@ -747,21 +988,39 @@ class PriceManager:
             print(f"❌ Erreur get_prices_by_suppliers Firestore: {e}")
             return []
     
-    def find_product_price(self, product_name: str, supplier: str = '', restaurant: str = 'Général') -> Optional[Dict]:
-        """Trouver un prix de produit dans Firestore uniquement"""
+    def find_product_price(self, product_name: str, supplier: str = '', restaurant: str = 'Général',
+                           fuzzy: bool = True) -> Optional[Dict]:
+        """
+        Trouver un prix de produit dans Firestore uniquement
+        
+        Libellé exact (ou alias confirmé) d'abord; à défaut, et si le fournisseur est connu,
+        meilleur candidat de l'index flou du catalogue (champ match_score ajouté).
+        """
         try:
             if not self._fs_enabled:
                 return None
             
-            # Construire la requête
-            query = self._fs.collection('prices').where('produit', '==', product_name)
-            
-            if supplier:
-                query = query.where('fournisseur', '==', supplier)
-            
-            docs = list(query.stream())
+            # Alias confirmé: le libellé facture désigne un produit connu du catalogue
+            names = [product_name]
+            alias = self.aliases.resolve(supplier, product_name) if supplier else None
+            if alias and alias['canonical_product'] != product_name:
+                names.insert(0, alias['canonical_product'])
+            
+            docs = []
+            for name in names:
+                query = self._fs.collection('prices').where('produit', '==', name)
+                if supplier:
+                    query = query.where('fournisseur', '==', supplier)
+                docs = list(query.stream())
+                if docs:
+                    break
             
             if not docs:
+                if fuzzy and supplier:
+                    best = self.catalogue.best_many(supplier, names[:1], restaurant)[0]
+                    if best:
+                        data, score = best
+                        return {**data, 'match_score': round(score, 3), 'matched_from': product_name}
                 return None
             
             # Si plusieurs résultats, filtrer par restaurant
@@ -0,0 +1,207 @@
+"""
+Statistiques de prix glissantes par (fournisseur, produit)
+Un document par produit tenu à jour à chaque scan: effectif, moyenne/variance (Welford),
+moyenne mobile exponentielle et dernières observations. Une observation coûte O(1),
+sans relire l'historique
+"""
+
+import os
+import math
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from modules.catalogue_index import extract_sizes
+from modules.product_matcher import normalize_product_name
+from modules.product_alias_store import supplier_key
+
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    FIRESTORE_SDK = False
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'price_stats'
+# Population distincte: prix signalés en anomalie par l'analyse de batch du scanner
+# (price_stats reçoit toutes les lignes des factures sauvegardées)
+ANOMALY_COLLECTION = 'price_anomaly_stats'
+# Poids de la dernière observation dans la moyenne mobile exponentielle
+EWMA_ALPHA = float(os.getenv('PRICE_STATS_EWMA_ALPHA', '0.3'))
+# Observations conservées telles quelles (preuves affichées, tendance récente)
+RECENT_OBSERVATIONS = 10
+# Documents par transaction (une lecture + une écriture chacun)
+STATS_BATCH_SIZE = 200
+# Identifiants d'observations déjà intégrées, conservés par produit (rejeu d'un même lot)
+OBSERVED_IDS_LIMIT = 500
+
+
+def stats_key(supplier: str, product_name: str) -> Optional[Tuple[str, str]]:
+    """
+    (fournisseur, produit normalisé + tailles), None si l'un des deux est vide
+
+    La normalisation retire les petits mots (1L, 35%): les tailles et conditionnements
+    extraits sont ajoutés pour ne pas mélanger HUILE 1L et HUILE 5L dans une même moyenne.
+    """
+    s_key = supplier_key(supplier)
+    p_key = normalize_product_name(product_name or '')
+    if not s_key or not p_key:
+        return None
+    sizes = sorted(extract_sizes(product_name))
+    return s_key, ' '.join([p_key] + sizes)
+
+
+def stats_doc_id(key: Tuple[str, str]) -> str:
+    digest = hashlib.sha1(key[1].encode('utf-8')).hexdigest()[:20]
+    return f"{key[0]}__{digest}"
+
+
+def update_running_stats(state: Optional[Dict[str, Any]], observations: List[Dict[str, Any]],
+                         alpha: float = EWMA_ALPHA) -> Dict[str, Any]:
+    """
+    Intégrer des observations {'price', 'date', 'reference_price', 'observation_id'} à un état existant
+
+    Welford: la variance est mise à jour sans conserver les valeurs passées, de façon
+    numériquement stable. Une observation dont l'identifiant est déjà connu de l'état
+    (les OBSERVED_IDS_LIMIT derniers) est ignorée: rejouer un lot ne compte rien deux fois.
+    """
+    state = dict(state or {})
+    count = state.get('count', 0)
+    mean = state.get('mean', 0.0)
+    m2 = state.get('m2', 0.0)
+    ewma = state.get('ewma')
+    recent = list(state.get('recent', []))
+    observed_ids = list(state.get('observed_ids', []))
+    seen = set(observed_ids)
+
+    for observation in sorted(observations, key=lambda o: o.get('date') or ''):
+        observation_id = observation.get('observation_id')
+        if observation_id is not None:
+            if observation_id in seen:
+                continue
+            seen.add(observation_id)
+            observed_ids.append(observation_id)
+        price = float(observation['price'])
+        count += 1
+        delta = price - mean
+        mean += delta / count
+        m2 += delta * (price - mean)
+        ewma = price if ewma is None else alpha * price + (1 - alpha) * ewma
+        recent.append({'price': price, 'date': observation.get('date')})
+        if observation.get('reference_price') is not None:
+            state['reference_price'] = observation['reference_price']
+        state.setdefault('first_seen', observation.get('date'))
+        state['last_seen'] = observation.get('date')
+
+    variance = m2 / count if count else 0.0
+    state.update({
+        'count': count,
+        'mean': mean,
+        'm2': m2,
+        'variance': variance,
+        'std': math.sqrt(max(variance, 0.0)),
+        'ewma': ewma,
+        'recent': recent[-RECENT_OBSERVATIONS:],
+        'observed_ids': observed_ids[-OBSERVED_IDS_LIMIT:],
+        'updated_at': datetime.now().isoformat()
+    })
+    return state
+
+
+class PriceStatsStore:
+    """Statistiques persistantes par produit, partagées entre workers (transactions Firestore)"""
+
+    def __init__(self, fs_client: Any = None, collection: str = COLLECTION):
+        self._fs = fs_client
+        self._collection = collection
+        if self._fs is None:
+            try:
+                from modules.firestore_db import get_client
+                self._fs = get_client()
+            except Exception as e:
+                logger.error(f"❌ Erreur initialisation Firestore PriceStatsStore: {e}")
+        self._fs_enabled = self._fs is not None and FIRESTORE_SDK
+        # Sans Firestore: statistiques tenues en mémoire pour la durée du processus
+        self._memory: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe_many(self, observations: Iterable[Dict[str, Any]],
+                     raise_errors: bool = False) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Intégrer des observations {'supplier', 'product_name', 'price', 'date', 'reference_price'}
+
+        Retourne l'état à jour de chaque (fournisseur, produit) touché. Chaque lot de
+        produits est relu et réécrit dans une transaction: deux scans concurrents du même
+        produit ne perdent pas d'observation. 'observation_id' (ex: facture:ligne) rend
+        l'intégration idempotente. raise_errors: propager l'échec d'un lot au lieu de
+        retourner un résultat partiel (l'appelant retente, les identifiants évitent le double compte).
+        """
+        grouped: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        labels: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        for observation in observations:
+            key = stats_key(observation.get('supplier', ''), observation.get('product_name', ''))
+            if key is None or observation.get('price') is None:
+                continue
+            grouped.setdefault(key, []).append(observation)
+            labels.setdefault(key, (observation.get('supplier', ''), observation.get('product_name', '')))
+
+        if not grouped:
+            return {}
+
+        if not self._fs_enabled:
+            with self._lock:
+                for key, items in grouped.items():
+                    self._memory[key] = self._with_labels(update_running_stats(self._memory.get(key), items),
+                                                          key, labels[key])
+                return {key: self._memory[key] for key in grouped}
+
+        updated: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        collection = self._fs.collection(self._collection)
+
+        @_firestore.transactional
+        def _apply(transaction, keys):
+            refs = [collection.document(stats_doc_id(key)) for key in keys]
+            current = {snapshot.id: snapshot.to_dict() for snapshot in transaction.get_all(refs) if snapshot.exists}
+            states = {}
+            for key, ref in zip(keys, refs):
+                state = self._with_labels(update_running_stats(current.get(ref.id), grouped[key]), key, labels[key])
+                transaction.set(ref, state)
+                states[key] = state
+            return states
+
+        try:
+            keys = list(grouped)
+            for start in range(0, len(keys), STATS_BATCH_SIZE):
+                updated.update(_apply(self._fs.transaction(), keys[start:start + STATS_BATCH_SIZE]))
+        except Exception as e:
+            logger.error(f"❌ Erreur mise à jour statistiques de prix: {e}")
+            if raise_errors:
+                raise
+        return updated
+
+    def get_many(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """État des (fournisseur, produit) demandés (lecture directe par identifiant)"""
+        keys = [key for key in (stats_key(supplier, product) for supplier, product in pairs) if key]
+        if not keys:
+            return {}
+        if not self._fs_enabled:
+            with self._lock:
+                return {key: self._memory[key] for key in keys if key in self._memory}
+        try:
+            collection = self._fs.collection(self._collection)
+            by_id = {stats_doc_id(key): key for key in keys}
+            snapshots = self._fs.get_all([collection.document(doc_id) for doc_id in by_id])
+            return {by_id[s.id]: s.to_dict() for s in snapshots if s.exists}
+        except Exception as e:
+            logger.error(f"❌ Erreur lecture statistiques de prix: {e}")
+            return {}
+
+    @staticmethod
+    def _with_labels(state: Dict[str, Any], key: Tuple[str, str], labels: Tuple[str, str]) -> Dict[str, Any]:
+        state['supplier'], state['product_name'] = labels
+        state['supplier_key'], state['product_key'] = key
+        return state
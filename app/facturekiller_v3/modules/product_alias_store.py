@@ -0,0 +1,208 @@
+"""
+Alias produits appris des rapprochements confirmés
+Clé (fournisseur, libellé facture normalisé) -> produit du catalogue: une ligne déjà
+confirmée une fois est retrouvée par lecture directe du document, sans rapprochement flou
+"""
+
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from modules.product_matcher import normalize_product_name
+
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    FIRESTORE_SDK = False
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'product_aliases'
+# Limite Firestore: 500 écritures par batch
+ALIAS_BATCH_SIZE = 400
+# Un libellé inconnu n'est pas relu en base avant ce délai (secondes)
+NEGATIVE_CACHE_TTL = 60
+
+_SUPPLIER_RE = re.compile(r'[^A-Z0-9]+')
+
+
+def supplier_key(supplier: str) -> str:
+    """Fournisseur en clé stable (majuscules sans accents, séparateurs unifiés)"""
+    text = unicodedata.normalize('NFKD', (supplier or '').upper())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _SUPPLIER_RE.sub('_', text).strip('_')
+
+
+def alias_key(supplier: str, label: str) -> Optional[Tuple[str, str]]:
+    """(fournisseur, libellé normalisé), None si l'un des deux est vide"""
+    s_key = supplier_key(supplier)
+    l_key = normalize_product_name(label or '')
+    if not s_key or not l_key:
+        return None
+    return s_key, l_key
+
+
+def alias_doc_id(key: Tuple[str, str]) -> str:
+    """Identifiant de document déterministe: lecture et écriture sans requête"""
+    digest = hashlib.sha1(key[1].encode('utf-8')).hexdigest()[:20]
+    return f"{key[0]}__{digest}"
+
+
+class ProductAliasStore:
+    """Table d'alias (fournisseur, libellé facture) -> produit canonique, avec cache mémoire"""
+
+    def __init__(self, fs_client: Any = None):
+        self._fs = fs_client
+        if self._fs is None:
+            try:
+                from modules.firestore_db import get_client
+                self._fs = get_client()
+            except Exception as e:
+                logger.error(f"❌ Erreur initialisation Firestore ProductAliasStore: {e}")
+        self._fs_enabled = self._fs is not None
+        self._cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._misses: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    # ===== LECTURE =====
+
+    def _cached(self, key: Tuple[str, str], now: float) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(connu, alias): connu=False si la base doit être consultée"""
+        alias = self._cache.get(key)
+        if alias is not None:
+            return True, alias
+        missed_at = self._misses.get(key)
+        if missed_at is not None and now - missed_at < NEGATIVE_CACHE_TTL:
+            return True, None
+        return False, None
+
+    def resolve(self, supplier: str, label: str) -> Optional[Dict[str, Any]]:
+        """Alias du libellé chez ce fournisseur (dict avec canonical_product), ou None"""
+        key = alias_key(supplier, label)
+        if key is None:
+            return None
+        return self.resolve_many(supplier, [label]).get(key[1])
+
+    def resolve_many(self, supplier: str, labels: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Alias de plusieurs libellés d'un même fournisseur
+
+        Retourne {libellé normalisé: alias}; les libellés absents du cache sont lus en
+        un seul get_all sur leurs identifiants de document.
+        """
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: Dict[str, Tuple[str, str]] = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for label in labels:
+                key = alias_key(supplier, label)
+                if key is None or key[1] in found or key[1] in missing:
+                    continue
+                known, alias = self._cached(key, now)
+                if alias is not None:
+                    found[key[1]] = alias
+                elif not known:
+                    missing[key[1]] = key
+
+        if not missing or not self._fs_enabled:
+            return found
+
+        try:
+            collection = self._fs.collection(COLLECTION)
+            refs = [collection.document(alias_doc_id(key)) for key in missing.values()]
+            loaded = {}
+            for snapshot in self._fs.get_all(refs):
+                if snapshot.exists:
+                    loaded[snapshot.id] = snapshot.to_dict()
+        except Exception as e:
+            logger.error(f"❌ Erreur lecture alias produits: {e}")
+            return found
+
+        with self._lock:
+            for label_key, key in missing.items():
+                alias = loaded.get(alias_doc_id(key))
+                if alias and alias.get('canonical_product'):
+                    self._cache[key] = alias
+                    self._misses.pop(key, None)
+                    found[label_key] = alias
+                else:
+                    self._misses[key] = now
+        return found
+
+    # ===== ÉCRITURE =====
+
+    def record(self, supplier: str, invoice_label: str, canonical_product: str,
+               source: str = 'confirmation') -> bool:
+        """Mémoriser qu'un libellé facture désigne ce produit du catalogue"""
+        return self.record_many(supplier, [(invoice_label, canonical_product)], source) > 0
+
+    def record_many(self, supplier: str, pairs: Iterable[Tuple[str, str]],
+                    source: str = 'confirmation') -> int:
+        """
+        Mémoriser des paires (libellé facture, produit canonique) d'un même fournisseur
+
+        Écritures groupées en batch; un libellé identique au produit canonique n'apprend
+        rien et est ignoré. Retourne le nombre d'alias écrits.
+        """
+        now = datetime.now().isoformat()
+        aliases: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for invoice_label, canonical_product in pairs:
+            key = alias_key(supplier, invoice_label)
+            canonical_product = (canonical_product or '').strip()
+            if key is None or not canonical_product:
+                continue
+            if normalize_product_name(canonical_product) == key[1]:
+                continue
+            aliases[key] = {
+                'supplier': supplier,
+                'supplier_key': key[0],
+                'label_key': key[1],
+                'invoice_label': invoice_label,
+                'canonical_product': canonical_product,
+                'source': source,
+                'updated_at': now
+            }
+
+        if not aliases:
+            return 0
+
+        if self._fs_enabled:
+            try:
+                collection = self._fs.collection(COLLECTION)
+                items = list(aliases.items())
+                for start in range(0, len(items), ALIAS_BATCH_SIZE):
+                    batch = self._fs.batch()
+                    for key, alias in items[start:start + ALIAS_BATCH_SIZE]:
+                        data = dict(alias)
+                        if FIRESTORE_SDK:
+                            data['confirmations'] = _firestore.Increment(1)
+                        batch.set(collection.document(alias_doc_id(key)), data, merge=True)
+                    batch.commit()
+            except Exception as e:
+                logger.error(f"❌ Erreur enregistrement alias produits: {e}")
+                return 0
+
+        with self._lock:
+            for key, alias in aliases.items():
+                self._cache[key] = alias
+                self._misses.pop(key, None)
+
+        logger.info(f"🔗 {len(aliases)} alias produit(s) mémorisé(s) pour {supplier}")
+        return len(aliases)
+
+    def canonical_names(self, supplier: str, labels: List[str]) -> List[Optional[str]]:
+        """Produit canonique de chaque libellé (None si aucun alias), dans l'ordre des libellés"""
+        aliases = self.resolve_many(supplier, labels)
+        result = []
+        for label in labels:
+            alias = aliases.get(normalize_product_name(label or ''))
+            result.append(alias['canonical_product'] if alias else None)
+        return result
@@ -0,0 +1,225 @@
+"""
+Rapprochement flou de libellés produits (commande vs facture, catalogue)
+Noms normalisés une fois, vecteurs de trigrammes indexés (index inversé) pour ne scorer
+que les candidats partageant des trigrammes, puis affectation globale un-pour-un
+(méthode hongroise)
+"""
+
+import re
+import math
+import unicodedata
+import logging
+from functools import lru_cache
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, FrozenSet
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Score minimum pour considérer deux libellés comme le même produit
+MATCH_THRESHOLD = 0.6
+
+# Mots courants qui perturbent le rapprochement
+STOP_WORDS = frozenset(['DE', 'DU', 'LA', 'LE', 'LES', 'ET', 'AVEC', 'SANS', 'POUR'])
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def _singular(word: str) -> str:
+    """Pluriel simple retiré (TOMATES -> TOMATE)"""
+    if len(word) > 3 and word[-1] == 'S' and word[-2].isalpha():
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=8192)
+def normalize_product_name(name: str) -> str:
+    """Majuscules sans accents ni ponctuation, mots vides retirés (mots de plus de 2 lettres), au singulier"""
+    text = unicodedata.normalize('NFKD', (name or '').upper())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    normalized = _SPACES_RE.sub(' ', _PUNCTUATION_RE.sub(' ', text)).strip()
+    return ' '.join(_singular(w) for w in normalized.split() if w not in STOP_WORDS and len(w) > 2)
+
+
+@lru_cache(maxsize=8192)
+def name_features(normalized: str) -> Tuple[FrozenSet[str], Tuple[Tuple[str, float], ...]]:
+    """Mots et vecteur de trigrammes normalisé (norme L2 = 1) d'un nom déjà normalisé"""
+    padded = f" {normalized} "
+    counts: Dict[str, int] = defaultdict(int)
+    for i in range(len(padded) - 2):
+        counts[padded[i:i + 3]] += 1
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    vector = tuple((gram, count / norm) for gram, count in counts.items())
+    return frozenset(normalized.split()), vector
+
+
+def max_weight_assignment(weights: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Affectation un-pour-un de poids total maximal (méthode hongroise, O(n² m))
+
+    Variante à chemins augmentants avec potentiels: une ligne est insérée à la fois,
+    la boucle interne sur les colonnes est vectorisée. Retourne les paires (ligne, colonne);
+    toutes les lignes sont affectées si n <= m (sinon toutes les colonnes).
+    """
+    transposed = weights.shape[0] > weights.shape[1]
+    cost = -(weights.T if transposed else weights).astype(np.float64)
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # ligne (1..n) affectée à chaque colonne, 0 = libre
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for row in range(1, n + 1):
+        owner[0] = row
+        column = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = owner[column]
+            free = ~used[1:]
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (reduced < min_reduced[1:])
+            min_reduced[1:][improved] = reduced[improved]
+            way[1:][improved] = column
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            used_columns = np.nonzero(used)[0]
+            u[owner[used_columns]] += delta
+            v[used_columns] -= delta
+            min_reduced[1:][free] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        # Remonter le chemin augmentant
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+
+    pairs = [(int(owner[j]) - 1, j - 1) for j in range(1, m + 1) if owner[j]]
+    if transposed:
+        pairs = [(col, row) for row, col in pairs]
+    return sorted(pairs)
+
+
+class ProductMatcher:
+    """Index de libellés candidats interrogeable par similarité"""
+
+    def __init__(self, names: List[str]):
+        self.names = list(names)
+        self.normalized = [normalize_product_name(name) for name in self.names]
+        self._exact: Dict[str, List[int]] = defaultdict(list)
+        gram_postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        word_postings: Dict[str, List[int]] = defaultdict(list)
+        word_counts = []
+
+        for index, normalized in enumerate(self.normalized):
+            words, vector = name_features(normalized)
+            word_counts.append(len(words))
+            if normalized:
+                self._exact[normalized].append(index)
+            for gram, weight in vector:
+                gram_postings[gram].append((index, weight))
+            for word in words:
+                word_postings[word].append(index)
+
+        # Index inversés figés en tableaux numpy: trigramme -> (candidats, poids), mot -> candidats
+        self._grams = {
+            gram: (np.array([i for i, _ in postings], dtype=np.int64),
+                   np.array([w for _, w in postings], dtype=np.float64))
+            for gram, postings in gram_postings.items()
+        }
+        self._words = {word: np.array(indexes, dtype=np.int64) for word, indexes in word_postings.items()}
+        self._word_counts = np.array(word_counts, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def score_matrix(self, queries: List[str]) -> np.ndarray:
+        """
+        Scores requêtes x candidats (0 pour les paires sans trigramme commun)
+
+        Produits scalaires creux accumulés depuis les index inversés (bincount), part de
+        mots communs calculée de la même façon; correspondance exacte = 1.
+        """
+        n, m = len(queries), len(self.names)
+        if not n or not m:
+            return np.zeros((n, m))
+
+        gram_cells, gram_values, word_cells = [], [], []
+        query_word_counts = np.zeros(n)
+        exact = []
+        for row, query in enumerate(queries):
+            normalized = normalize_product_name(query)
+            if not normalized:
+                continue
+            words, vector = name_features(normalized)
+            query_word_counts[row] = len(words)
+            offset = row * m
+            for gram, weight in vector:
+                postings = self._grams.get(gram)
+                if postings is not None:
+                    gram_cells.append(postings[0] + offset)
+                    gram_values.append(postings[1] * weight)
+            for word in words:
+                postings = self._words.get(word)
+                if postings is not None:
+                    word_cells.append(postings + offset)
+            exact.extend((row, index) for index in self._exact.get(normalized, ()))
+
+        size = n * m
+        if gram_cells:
+            cosine = np.bincount(np.concatenate(gram_cells), weights=np.concatenate(gram_values), minlength=size)
+        else:
+            cosine = np.zeros(size)
+        cosine = np.minimum(cosine.reshape(n, m), 1.0)
+
+        if word_cells:
+            common = np.bincount(np.concatenate(word_cells), minlength=size).reshape(n, m)
+            longest = np.maximum.outer(query_word_counts, self._word_counts)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                word_share = np.where(common > 0, common / np.maximum(longest, 1), 0.0)
+            scores = np.where(common > 0, (cosine + word_share) / 2, cosine)
+        else:
+            scores = cosine
+
+        for row, index in exact:
+            scores[row, index] = 1.0
+        return scores
+
+    def scores(self, name: str, threshold: float = 0.0) -> Dict[int, float]:
+        """Score de chaque candidat au-dessus du seuil (et non nul)"""
+        row = self.score_matrix([name])[0]
+        indexes = np.nonzero((row >= threshold) & (row > 0))[0]
+        return {int(i): float(row[i]) for i in indexes}
+
+    def best(self, name: str, threshold: float = MATCH_THRESHOLD, limit: int = 1) -> List[Tuple[int, float]]:
+        """Meilleurs candidats (index, score) au-dessus du seuil, ordre déterministe"""
+        ranked = sorted(self.scores(name, threshold).items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    def assign(self, queries: List[str], threshold: float = MATCH_THRESHOLD) -> List[Optional[Tuple[int, float]]]:
+        """
+        Affectation globale un-pour-un requêtes -> candidats
+
+        Retourne pour chaque requête (index candidat, score) ou None. Optimum global
+        (somme des scores, méthode hongroise); un candidat n'est attribué qu'une fois.
+        """
+        assignment: List[Optional[Tuple[int, float]]] = [None] * len(queries)
+        matrix = self.score_matrix(queries)
+        matrix[matrix < threshold] = 0.0
+        rows, cols = np.nonzero(matrix)
+        if not len(rows):
+            return assignment
+
+        # Sous-matrice des lignes/colonnes ayant au moins un candidat
+        row_ids, col_ids = np.unique(rows), np.unique(cols)
+        sub = matrix[np.ix_(row_ids, col_ids)]
+        for i, j in max_weight_assignment(sub):
+            if sub[i, j] > 0:
+                assignment[int(row_ids[i])] = (int(col_ids[j]), float(sub[i, j]))
+        return assignment
@@ -0,0 +1,162 @@
+"""
+Instrumentation des scans de factures
+Durée par étape, tokens consommés et agrégats p50/p95 par restaurant
+"""
+
+import time
+import threading
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+# Tarifs Claude 3.5 Sonnet (USD par million de tokens) pour l'estimation des coûts
+TOKEN_PRICES_PER_MTOK = {
+    'input_tokens': 3.00,
+    'output_tokens': 15.00,
+    'cache_read_tokens': 0.30,
+    'cache_creation_tokens': 3.75
+}
+
+# Nombre de scans conservés en mémoire pour les percentiles
+HISTORY_SIZE = 500
+
+
+class ScanMetrics:
+    """Mesures d'un scan: durées par étape (ms), tokens et taille de l'upload"""
+
+    def __init__(self, upload_bytes: int = 0, restaurant_id: str = None):
+        self.started_at = datetime.now().isoformat()
+        self.upload_bytes = upload_bytes
+        self.restaurant_id = restaurant_id
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {key: 0 for key in TOKEN_PRICES_PER_MTOK}
+        self.model_calls = 0
+        # success, error ou timeout: renseigné à la fin du scan (finish)
+        self.status = 'pending'
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Chronométrer une étape (les durées d'une même étape s'additionnent)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stages[name] = round(self.stages.get(name, 0.0) + elapsed_ms, 2)
+
+    def add_usage(self, usage: Any):
+        """Ajouter l'usage tokens d'une réponse Anthropic (response.usage)"""
+        if usage is None:
+            return
+        self.model_calls += 1
+        self.tokens['input_tokens'] += getattr(usage, 'input_tokens', 0) or 0
+        self.tokens['output_tokens'] += getattr(usage, 'output_tokens', 0) or 0
+        self.tokens['cache_read_tokens'] += getattr(usage, 'cache_read_input_tokens', 0) or 0
+        self.tokens['cache_creation_tokens'] += getattr(usage, 'cache_creation_input_tokens', 0) or 0
+
+    def finish(self, status: str, error: str = None):
+        """Marquer l'issue du scan avant son enregistrement"""
+        self.status = status
+        self.error = error
+
+    def estimated_cost(self) -> float:
+        """Coût estimé du scan en USD"""
+        return round(sum(
+            self.tokens[key] * price / 1_000_000
+            for key, price in TOKEN_PRICES_PER_MTOK.items()
+        ), 6)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Représentation sérialisable (réponse API et document Firestore)"""
+        return {
+            'started_at': self.started_at,
+            'restaurant_id': self.restaurant_id,
+            'status': self.status,
+            'error': self.error,
+            'upload_bytes': self.upload_bytes,
+            'stages_ms': dict(self.stages),
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 2),
+            'tokens': dict(self.tokens),
+            'model_calls': self.model_calls,
+            'estimated_cost_usd': self.estimated_cost()
+        }
+
+
+class ScanMetricsRegistry:
+    """Historique borné des scans du processus et agrégats pour l'endpoint de métriques"""
+
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        self._history = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def record(self, metrics: ScanMetrics):
+        """Enregistrer un scan terminé"""
+        with self._lock:
+            self._history.append(metrics.to_dict())
+
+    def summary(self, restaurant_id: str = None) -> Dict[str, Any]:
+        """Percentiles par étape et consommation par restaurant"""
+        with self._lock:
+            scans = [s for s in self._history
+                     if not restaurant_id or s.get('restaurant_id') == restaurant_id]
+
+        # Percentiles sur tous les scans (échecs et dépassements compris), issues comptées à part
+        statuses: Dict[str, int] = defaultdict(int)
+        stage_values: Dict[str, List[float]] = defaultdict(list)
+        for scan in scans:
+            statuses[scan.get('status', 'success')] += 1
+            for name, value in scan['stages_ms'].items():
+                stage_values[name].append(value)
+            stage_values['total'].append(scan['total_ms'])
+
+        per_restaurant: Dict[str, Dict[str, Any]] = {}
+        for scan in scans:
+            key = scan.get('restaurant_id') or 'unknown'
+            entry = per_restaurant.setdefault(key, {
+                'scans': 0,
+                'upload_bytes': 0,
+                'tokens': {k: 0 for k in TOKEN_PRICES_PER_MTOK},
+                'estimated_cost_usd': 0.0
+            })
+            entry['scans'] += 1
+            entry['upload_bytes'] += scan['upload_bytes']
+            for k, v in scan['tokens'].items():
+                entry['tokens'][k] += v
+            entry['estimated_cost_usd'] = round(entry['estimated_cost_usd'] + scan['estimated_cost_usd'], 6)
+
+        return {
+            'scans': len(scans),
+            'statuses': dict(statuses),
+            'stages': {name: _percentiles(values) for name, values in stage_values.items()},
+            'restaurants': per_restaurant,
+            'recent': scans[-20:]
+        }
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/max/moyenne d'une série de durées"""
+    ordered = sorted(values)
+    count = len(ordered)
+
+    def pick(q: float) -> float:
+        return ordered[min(count - 1, int(round(q * (count - 1))))]
+
+    return {
+        'count': count,
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'max': ordered[-1],
+        'avg': round(sum(ordered) / count, 2)
+    }
+
+
+# Registre partagé du processus
+registry = ScanMetricsRegistry()
+
+
+def current_or_new(metrics: Optional[ScanMetrics]) -> ScanMetrics:
+    """Retourner les métriques fournies ou un collecteur jetable"""
+    return metrics if metrics is not None else ScanMetrics()
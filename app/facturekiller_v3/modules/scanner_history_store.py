@@ -0,0 +1,209 @@
+"""
+Historique des scans mobiles par restaurant
+Stockage SQLite (WAL) indexé sur (restaurant_id, timestamp): ajout atomique, rétention
+plafonnée par restaurant et compteurs journaliers tenus à jour à l'écriture
+"""
+
+import os
+import glob
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.getenv('SCANNER_HISTORY_DB', 'data/scanner_history.db')
+# Nombre d'entrées détaillées conservées par restaurant (les compteurs ne sont pas purgés)
+DEFAULT_RETENTION = int(os.getenv('SCANNER_HISTORY_RETENTION', '100'))
+# Anciens fichiers par restaurant, importés une seule fois
+LEGACY_FILES_PATTERN = 'data/scanner_history_*.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scanner_history (
+    id TEXT PRIMARY KEY,
+    restaurant_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    supplier TEXT,
+    total_amount REAL,
+    products_count INTEGER,
+    savings REAL,
+    user_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scanner_history_restaurant_ts ON scanner_history (restaurant_id, timestamp);
+CREATE TABLE IF NOT EXISTS scanner_daily (
+    restaurant_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    scans INTEGER NOT NULL DEFAULT 0,
+    savings REAL NOT NULL DEFAULT 0,
+    products INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (restaurant_id, day)
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+ENTRY_FIELDS = ['id', 'timestamp', 'supplier', 'total_amount', 'products_count', 'savings', 'user_id', 'restaurant_id']
+
+
+class ScannerHistoryStore:
+    """Historique des scans et statistiques par restaurant"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, retention: int = DEFAULT_RETENTION,
+                 legacy_pattern: str = LEGACY_FILES_PATTERN):
+        self.db_path = db_path
+        self.retention = retention
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._import_legacy_files(legacy_pattern)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connexion propre au thread, en mode WAL"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    # ===== ÉCRITURE =====
+
+    def _insert(self, conn: sqlite3.Connection, entry: Dict[str, Any]) -> bool:
+        """Insérer une entrée et incrémenter le compteur de son jour (dans la transaction courante)"""
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO scanner_history (id, restaurant_id, timestamp, supplier, total_amount, '
+            'products_count, savings, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (entry['id'], entry['restaurant_id'], entry['timestamp'], entry.get('supplier'),
+             entry.get('total_amount') or 0, entry.get('products_count') or 0,
+             entry.get('savings') or 0, entry.get('user_id'))
+        )
+        if cursor.rowcount == 0:
+            return False
+        conn.execute(
+            'INSERT INTO scanner_daily (restaurant_id, day, scans, savings, products) VALUES (?, ?, 1, ?, ?) '
+            'ON CONFLICT (restaurant_id, day) DO UPDATE SET scans = scans + 1, '
+            'savings = savings + excluded.savings, products = products + excluded.products',
+            (entry['restaurant_id'], entry['timestamp'][:10], entry.get('savings') or 0,
+             entry.get('products_count') or 0)
+        )
+        return True
+
+    def _prune(self, conn: sqlite3.Connection, restaurant_id: str):
+        """Ne garder que les `retention` entrées les plus récentes du restaurant"""
+        conn.execute(
+            'DELETE FROM scanner_history WHERE restaurant_id = ? AND timestamp < ('
+            'SELECT timestamp FROM scanner_history WHERE restaurant_id = ? '
+            'ORDER BY timestamp DESC LIMIT 1 OFFSET ?)',
+            (restaurant_id, restaurant_id, self.retention - 1)
+        )
+
+    def append(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Ajouter une entrée: insertion, compteur journalier et rétention dans une seule transaction"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._insert(conn, entry)
+            self._prune(conn, entry['restaurant_id'])
+        return entry
+
+    def delete(self, restaurant_id: str, entry_id: str) -> bool:
+        """Supprimer une entrée du restaurant et la retirer du compteur de son jour"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT * FROM scanner_history WHERE id = ? AND restaurant_id = ?', (entry_id, restaurant_id)
+            ).fetchone()
+            if not row:
+                return False
+            conn.execute('DELETE FROM scanner_history WHERE id = ?', (entry_id,))
+            conn.execute(
+                'UPDATE scanner_daily SET scans = MAX(scans - 1, 0), savings = savings - ?, '
+                'products = MAX(products - ?, 0) WHERE restaurant_id = ? AND day = ?',
+                (row['savings'] or 0, row['products_count'] or 0, restaurant_id, row['timestamp'][:10])
+            )
+        return True
+
+    # ===== LECTURE =====
+
+    def recent(self, restaurant_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Dernières entrées du restaurant (parcours d'index, taille de page)"""
+        rows = self._connect().execute(
+            'SELECT * FROM scanner_history WHERE restaurant_id = ? ORDER BY timestamp DESC LIMIT ?',
+            (restaurant_id, limit)
+        ).fetchall()
+        return [{field: row[field] for field in ENTRY_FIELDS} for row in rows]
+
+    def stats(self, restaurant_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Statistiques du scanner depuis les compteurs journaliers"""
+        now = now or datetime.now()
+        today = now.date().isoformat()
+        week_start = (now.date() - timedelta(days=7)).isoformat()
+        conn = self._connect()
+
+        totals = conn.execute(
+            'SELECT COALESCE(SUM(scans), 0) AS scans, COALESCE(SUM(savings), 0) AS savings, '
+            'COALESCE(SUM(products), 0) AS products, '
+            'COALESCE(SUM(CASE WHEN day = ? THEN scans ELSE 0 END), 0) AS today_scans, '
+            'COALESCE(SUM(CASE WHEN day >= ? THEN scans ELSE 0 END), 0) AS week_scans '
+            'FROM scanner_daily WHERE restaurant_id = ?',
+            (today, week_start, restaurant_id)
+        ).fetchone()
+        last_scan = conn.execute(
+            'SELECT MAX(timestamp) FROM scanner_history WHERE restaurant_id = ?', (restaurant_id,)
+        ).fetchone()[0]
+
+        total_scans = totals['scans']
+        total_savings = totals['savings']
+        return {
+            'total_scans': total_scans,
+            'total_savings': round(total_savings, 2),
+            'total_products': totals['products'],
+            'today_scans': totals['today_scans'],
+            'this_week_scans': totals['week_scans'],
+            'average_savings_per_scan': round(total_savings / max(total_scans, 1), 2),
+            'last_scan': last_scan
+        }
+
+    # ===== MIGRATION =====
+
+    def _import_legacy_files(self, pattern: str):
+        """Importer une seule fois les anciens fichiers data/scanner_history_<restaurant>.json"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_files_imported'").fetchone():
+            return
+
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_files_imported'").fetchone():
+                return
+            imported = 0
+            for path in glob.glob(pattern) if pattern else []:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        entries = json.load(f)
+                except Exception as e:
+                    logger.error(f"❌ Lecture {path} impossible, ignoré: {e}")
+                    continue
+                restaurant_id = os.path.basename(path)[len('scanner_history_'):-len('.json')]
+                for entry in entries:
+                    if not entry.get('id') or not entry.get('timestamp'):
+                        continue
+                    entry.setdefault('restaurant_id', restaurant_id)
+                    imported += self._insert(conn, entry)
+                self._prune(conn, restaurant_id)
+            conn.execute("INSERT INTO store_meta (key, value) VALUES ('legacy_files_imported', ?)",
+                         (datetime.now().isoformat(),))
+        if imported:
+            logger.info(f"📥 Historique scanner: {imported} entrées importées depuis les fichiers JSON")
@@ -0,0 +1,87 @@
+"""
+Séquences numérotées atomiques (codes factures FCT, numéros d'anomalies)
+Un document compteur par (séquence, portée) incrémenté en transaction Firestore:
+une allocation = une transaction, quelle que soit la taille de l'historique
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    FIRESTORE_SDK = False
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'sequences'
+
+
+class SequenceService:
+    """Compteurs transactionnels partagés entre workers"""
+
+    def __init__(self, fs_client: Any = None):
+        self._fs = fs_client
+        if self._fs is None:
+            try:
+                from modules.firestore_db import get_client
+                self._fs = get_client()
+            except Exception as e:
+                logger.error(f"❌ Erreur initialisation Firestore SequenceService: {e}")
+        self._fs_enabled = self._fs is not None and FIRESTORE_SDK
+
+    @staticmethod
+    def _doc_id(name: str, scope: Optional[str]) -> str:
+        return f"{name}_{scope}" if scope else name
+
+    def next_value(self, name: str, scope: Optional[str] = None,
+                   seed: Optional[Callable[[], int]] = None, count: int = 1,
+                   write: Optional[Callable[[Any, int], None]] = None) -> Optional[int]:
+        """
+        Allouer la prochaine valeur d'une séquence
+
+        Args:
+            name: nom de la séquence (ex: 'invoice_code')
+            scope: portée du compteur (jour, mois, restaurant...): un document par portée,
+                   ce qui répartit la contention et remet la numérotation à zéro
+            seed: valeur déjà utilisée à la création du compteur (reprise de l'existant),
+                  appelée une seule fois par portée
+            count: taille du bloc réservé en une transaction (valeurs retour-count+1 .. retour)
+            write: écritures de l'appelant faites dans la même transaction (transaction, valeur):
+                   le document numéroté devient visible en même temps que le compteur
+
+        Retourne la dernière valeur allouée, None si Firestore est indisponible
+        (l'appelant choisit son repli).
+        """
+        if not self._fs_enabled:
+            return None
+
+        try:
+            ref = self._fs.collection(COLLECTION).document(self._doc_id(name, scope))
+
+            @_firestore.transactional
+            def _allocate(transaction):
+                snapshot = ref.get(transaction=transaction)
+                if snapshot.exists:
+                    current = snapshot.get('value') or 0
+                else:
+                    current = seed() if seed else 0
+                value = current + count
+                transaction.set(ref, {
+                    'name': name,
+                    'scope': scope,
+                    'value': value,
+                    'updated_at': datetime.now().isoformat()
+                })
+                if write:
+                    write(transaction, value)
+                return value
+
+            return _allocate(self._fs.transaction())
+
+        except Exception as e:
+            logger.error(f"❌ Erreur allocation séquence {self._doc_id(name, scope)}: {e}")
+            return None
@@ -9,9 +9,18 @@ import pandas as pd
 import logging
 import json
 import os
+import re
 
 logger = logging.getLogger(__name__)
 
+# Agrégats mensuels du dashboard (voir modules/dashboard_rollups.py)
+NO_DATE_MONTH = 'sans-date'
+ROLLUP_NUMERIC_FIELDS = ('invoices_count', 'spending', 'savings_amount', 'overpayment_amount',
+                         'compared_products', 'alerts_count', 'critical_alerts')
+ROLLUP_RECENT_INVOICES = 10
+# Décalage horaire final d'une date ISO (Z, +02:00, -0500)
+_UTC_OFFSET_RE = re.compile(r'(?:Z|[+-]\d{2}:?\d{2})$')
+
 class StatsCalculator:
     """Calculateur de statistiques pour le tableau de bord"""
     
@@ -356,263 +365,277 @@ class StatsCalculator:
         }
 
     def calculate_dashboard_stats(self, prices: List[Dict], invoices: List[Dict], pending_products: List[Dict]) -> Dict[str, Any]:
-        """Calculer toutes les statistiques pour le dashboard"""
+        """
+        Calculer toutes les statistiques pour le dashboard
+        
+        Pipeline colonnaire: les factures, lignes produits et détails de comparaison sont
+        aplatis une seule fois en colonnes typées (dates et montants convertis en bloc),
+        puis chaque widget est un groupby/une réduction pandas sur ces colonnes.
+        """
         try:
-            stats = {
-                'invoices_count': len(invoices),
-                'invoices_growth': 0,
-                'savings_amount': 0,
-                'compared_products': 0,
-                'alerts_count': 0,
-                'critical_alerts': 0,
-                'pending_count': len(pending_products),
-                'recent_alerts': [],
-                'recent_activity': [],
-                'spending_chart_data': self._get_spending_chart_data(invoices),
-                'supplier_chart_data': self._get_supplier_chart_data(invoices)
+            frame, lines, details = self._build_invoice_frames(invoices)
+            
+            # Économies, surcoûts et alertes (format price_comparison + format par produit)
+            expensive = lines['status'] == 'expensive'
+            totals = {
+                'invoices_count': len(frame),
+                'savings_amount': frame['pc_savings'].sum() + lines.loc[lines['status'] == 'cheaper', 'savings'].sum(),
+                'overpayment_amount': frame['pc_overpayment'].sum() + lines.loc[expensive, 'overpayment'].sum(),
+                'compared_products': frame['pc_compared'].sum() + len(lines),
+                'alerts_count': frame['pc_higher'].sum() + expensive.sum(),
+                'critical_alerts': (
+                    ((details['status'] == 'higher') & (details['difference_percent'].abs() > 20)).sum() +
+                    (expensive & (lines['difference_percent'].abs() > 20)).sum()
+                )
             }
             
-            # Calculer les économies et alertes à partir des factures
-            if invoices:
-                savings_data = self._calculate_savings_and_alerts(invoices)
-                stats.update(savings_data)
-            
-            # Calculer la croissance des factures
-            stats['invoices_growth'] = self._calculate_invoices_growth(invoices)
-            
-            # Récupérer les alertes récentes
-            stats['recent_alerts'] = self._get_recent_alerts(invoices)
-            
-            # Récupérer l'activité récente
-            stats['recent_activity'] = self._get_recent_activity(invoices, pending_products)
+            amounts = frame[frame['total'] != 0]
+            dated = frame[frame['month'] != NO_DATE_MONTH]
+            counts_by_month = dated['month'].value_counts().to_dict()
+            spending_by_month = amounts[amounts['month'] != NO_DATE_MONTH].groupby('month')['total'].sum().to_dict()
+            supplier_totals = amounts.groupby('supplier')['total'].sum().to_dict()
+            
+            recent = frame.sort_values('sort_key', ascending=False, kind='mergesort').head(ROLLUP_RECENT_INVOICES)
+            recent_invoices = [
+                {
+                    'id': row.id,
+                    'sort_key': row.sort_key,
+                    'supplier': row.analysis_supplier,
+                    'date': row.analysis_date,
+                    'total': row.analysis_total,
+                    'alert_count': row.pc_higher,
+                    'overpayment': row.pc_overpayment
+                }
+                for row in recent.itertuples(index=False)
+            ]
             
-            return stats
+            return self._assemble_dashboard_stats(
+                totals, counts_by_month, spending_by_month, supplier_totals, recent_invoices, pending_products
+            )
             
         except Exception as e:
             logger.error(f"Erreur calcul statistiques dashboard: {e}")
             return self._get_default_stats()
     
-    def _calculate_savings_and_alerts(self, invoices: List[Dict]) -> Dict[str, Any]:
-        """Calculer les économies et alertes à partir des factures"""
+    def _build_invoice_frames(self, invoices: List[Dict]):
+        """Aplatir les factures en trois tables colonnaires (factures, lignes produits, détails)"""
+        analyses = [invoice.get('analysis') or {} for invoice in invoices]
+        comparisons = [analysis.get('price_comparison') or {} for analysis in analyses]
+        
+        # Un seul passage Python par table: tuples de champs bruts, conversions en bloc ensuite
+        frame = pd.DataFrame([
+            (
+                invoice.get('id', ''),
+                invoice.get('date') or analysis.get('date'),
+                invoice.get('total') or analysis.get('total', 0),
+                invoice.get('supplier') or analysis.get('supplier') or 'Inconnu',
+                analysis.get('supplier', 'Inconnu'),
+                analysis.get('date', ''),
+                analysis.get('total', 0)
+            )
+            for invoice, analysis in zip(invoices, analyses)
+        ], columns=['id', 'date_raw', 'total_raw', 'supplier', 'analysis_supplier', 'analysis_date',
+                    'analysis_total'])
+        pc = self._record_frame(comparisons, [], ['total_savings', 'total_overpayment', 'compared_count',
+                                                  'higher_prices'])
+        frame['pc_savings'] = pc['total_savings'].to_numpy()
+        frame['pc_overpayment'] = pc['total_overpayment'].to_numpy()
+        frame['pc_compared'] = pc['compared_count'].to_numpy().astype(int)
+        frame['pc_higher'] = pc['higher_prices'].to_numpy().astype(int)
+        
+        # Format par produit: une ligne par produit comparé
+        product_comparisons = [
+            product['price_comparison']
+            for analysis in analyses
+            for product in analysis.get('products') or []
+            if isinstance(product, dict) and isinstance(product.get('price_comparison'), dict)
+        ]
+        lines = self._record_frame(product_comparisons, ['status'], ['savings', 'overpayment', 'difference_percent'])
+        
+        # Format price_comparison: détails de comparaison par facture
+        comparison_details = [
+            detail
+            for comparison in comparisons
+            for detail in comparison.get('comparison_details') or []
+        ]
+        details = self._record_frame(comparison_details, ['status'], ['price_difference_percent'])
+        details = details.rename(columns={'price_difference_percent': 'difference_percent'})
+        
+        # Conversions vectorielles: montants et dates
+        frame['total'] = self._normalize_amounts(frame['total_raw'])
+        
+        # Mois YYYY-MM: un entier par facture, formaté une seule fois par mois distinct.
+        # Heure locale telle qu'écrite, comme _month_key (agrégats mensuels): le décalage
+        # horaire est retiré avant l'analyse, sans conversion UTC (23h30-05:00 reste dans son mois)
+        raw_dates = frame['date_raw'].where(frame['date_raw'].astype(bool))
+        local_dates = raw_dates.dropna().astype(str).str.replace(_UTC_OFFSET_RE, '', regex=True)
+        dates = pd.to_datetime(local_dates, format='ISO8601', errors='coerce').reindex(frame.index)
+        year_month = dates.dt.year * 100 + dates.dt.month
+        labels = {value: f"{int(value) // 100:04d}-{int(value) % 100:02d}" for value in year_month.dropna().unique()}
+        frame['month'] = year_month.map(labels).fillna(NO_DATE_MONTH)
+        frame['sort_key'] = frame['date_raw'].fillna('').astype(str)
+        
+        return frame, lines, details
+    
+    @staticmethod
+    def _record_frame(records: List[Dict], text_keys: List[str], numeric_keys: List[str]) -> pd.DataFrame:
+        """Table des champs demandés (construction pandas en un passage); numériques absents ou illisibles -> 0"""
+        table = pd.DataFrame(records, columns=text_keys + numeric_keys)
+        for key in numeric_keys:
+            table[key] = pd.to_numeric(table[key], errors='coerce').fillna(0.0).astype(float)
+        return table
+    
+    @staticmethod
+    def _normalize_amounts(values: pd.Series) -> pd.Series:
+        """Montants numériques à partir de nombres ou de chaînes '12,50 €' (0 si illisible)"""
+        numeric = pd.to_numeric(values, errors='coerce')
+        text = values[numeric.isna() & values.notna()].astype(str)
+        if not text.empty:
+            cleaned = text.str.replace('€', '', regex=False).str.replace(',', '.', regex=False).str.strip()
+            numeric = numeric.fillna(pd.to_numeric(cleaned, errors='coerce'))
+        return numeric.fillna(0.0).astype(float)
+    
+    def _assemble_dashboard_stats(self, totals: Dict[str, Any], counts_by_month: Dict[str, int],
+                                  spending_by_month: Dict[str, float], supplier_totals: Dict[str, float],
+                                  recent_invoices: List[Dict], pending_products: List[Dict]) -> Dict[str, Any]:
+        """Construire la réponse du dashboard à partir d'agrégats (calcul complet ou documents mensuels)"""
+        now = datetime.now()
+        current_month = now.strftime('%Y-%m')
+        last_month = (now.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+        
+        recent_invoices = sorted(recent_invoices, key=lambda x: str(x.get('sort_key') or ''), reverse=True)
+        recent_invoices = recent_invoices[:ROLLUP_RECENT_INVOICES]
+        
+        # Croissance vs mois dernier
+        current_count = counts_by_month.get(current_month, 0)
+        last_count = counts_by_month.get(last_month, 0)
+        if last_count == 0:
+            growth = 100 if current_count > 0 else 0
+        else:
+            growth = round(((current_count - last_count) / last_count) * 100, 1)
+        
+        # Dépenses des 6 derniers mois (format Chart.js)
+        months = {}
+        for i in range(6):
+            month_date = now - timedelta(days=30*i)
+            months[month_date.strftime('%Y-%m')] = month_date.strftime('%b %Y')
+        sorted_months = sorted(months.keys())
+        
+        # Top 5 fournisseurs
+        sorted_suppliers = sorted(supplier_totals.items(), key=lambda x: x[1], reverse=True)[:5]
+        
+        # Alertes sur les 10 dernières factures
+        recent_alerts = [
+            {
+                'id': invoice.get('id', ''),
+                'supplier': invoice.get('supplier', 'Inconnu'),
+                'date': invoice.get('date', ''),
+                'alert_count': int(invoice.get('alert_count', 0) or 0),
+                'overpayment': float(invoice.get('overpayment', 0) or 0)
+            }
+            for invoice in recent_invoices
+            if (invoice.get('alert_count', 0) or 0) > 0
+        ][:5]
+        
+        # Activité récente: 3 dernières factures + 2 derniers produits en attente
+        activity = [
+            {
+                'type': 'invoice',
+                'title': f"Facture {invoice.get('supplier', 'Inconnu')}",
+                'description': f"Montant: {invoice.get('total', 0)}€",
+                'date': invoice.get('date', ''),
+                'icon': 'file-text'
+            }
+            for invoice in recent_invoices[:3]
+        ]
+        activity.extend(self._get_recent_activity(pending_products))
+        activity.sort(key=lambda x: str(x.get('date') or ''), reverse=True)
+        
+        return {
+            'invoices_count': int(totals['invoices_count']),
+            'invoices_growth': growth,
+            'savings_amount': round(float(totals['savings_amount']), 2),
+            'overpayment_amount': round(float(totals['overpayment_amount']), 2),
+            'compared_products': int(totals['compared_products']),
+            'alerts_count': int(totals['alerts_count']),
+            'critical_alerts': int(totals['critical_alerts']),
+            'pending_count': len(pending_products),
+            'recent_alerts': recent_alerts,
+            'recent_activity': activity[:5],
+            'spending_chart_data': {
+                'labels': [months[month] for month in sorted_months],
+                'data': [round(float(spending_by_month.get(month, 0)), 2) for month in sorted_months]
+            },
+            'supplier_chart_data': {
+                'labels': [supplier for supplier, _ in sorted_suppliers],
+                'data': [round(float(total), 2) for _, total in sorted_suppliers]
+            }
+        }
+    
+    @staticmethod
+    def _invoice_savings_and_alerts(invoice: Dict) -> Dict[str, Any]:
+        """Économies, surcoûts et alertes d'une seule facture (non arrondis)"""
         total_savings = 0
         total_overpayment = 0
         compared_products = 0
         alerts_count = 0
         critical_alerts = 0
         
-        for invoice in invoices:
-            # Vérifier les différents formats de données
-            analysis = invoice.get('analysis', {})
-            price_comparison = analysis.get('price_comparison', {})
-            
-            if price_comparison:
-                # Nouveau format avec price_comparison
-                total_savings += price_comparison.get('total_savings', 0)
-                total_overpayment += price_comparison.get('total_overpayment', 0)
-                compared_products += price_comparison.get('compared_count', 0)
-                
-                # Compter les alertes (prix plus élevés)
-                higher_prices = price_comparison.get('higher_prices', 0)
-                alerts_count += higher_prices
-                
-                # Alertes critiques (différence > 20%)
-                for product in price_comparison.get('comparison_details', []):
-                    if product.get('status') == 'higher':
-                        price_diff_percent = abs(product.get('price_difference_percent', 0))
-                        if price_diff_percent > 20:
-                            critical_alerts += 1
-            
-            # Format alternatif dans products
-            products = analysis.get('products', [])
-            for product in products:
-                if 'price_comparison' in product:
-                    compared_products += 1
-                    status = product['price_comparison'].get('status')
-                    if status == 'cheaper':
-                        savings = product['price_comparison'].get('savings', 0)
-                        total_savings += savings
-                    elif status == 'expensive':
-                        overpay = product['price_comparison'].get('overpayment', 0)
-                        total_overpayment += overpay
-                        alerts_count += 1
-                        
-                        # Alerte critique si différence > 20%
-                        diff_percent = product['price_comparison'].get('difference_percent', 0)
-                        if abs(diff_percent) > 20:
-                            critical_alerts += 1
+        # Vérifier les différents formats de données
+        analysis = invoice.get('analysis', {})
+        price_comparison = analysis.get('price_comparison', {})
+        
+        if price_comparison:
+            # Nouveau format avec price_comparison
+            total_savings += price_comparison.get('total_savings', 0)
+            total_overpayment += price_comparison.get('total_overpayment', 0)
+            compared_products += price_comparison.get('compared_count', 0)
+            
+            # Compter les alertes (prix plus élevés)
+            higher_prices = price_comparison.get('higher_prices', 0)
+            alerts_count += higher_prices
+            
+            # Alertes critiques (différence > 20%)
+            for product in price_comparison.get('comparison_details', []):
+                if product.get('status') == 'higher':
+                    price_diff_percent = abs(product.get('price_difference_percent', 0))
+                    if price_diff_percent > 20:
+                        critical_alerts += 1
+        
+        # Format alternatif dans products
+        products = analysis.get('products', [])
+        for product in products:
+            if 'price_comparison' in product:
+                compared_products += 1
+                status = product['price_comparison'].get('status')
+                if status == 'cheaper':
+                    savings = product['price_comparison'].get('savings', 0)
+                    total_savings += savings
+                elif status == 'expensive':
+                    overpay = product['price_comparison'].get('overpayment', 0)
+                    total_overpayment += overpay
+                    alerts_count += 1
+                    
+                    # Alerte critique si différence > 20%
+                    diff_percent = product['price_comparison'].get('difference_percent', 0)
+                    if abs(diff_percent) > 20:
+                        critical_alerts += 1
         
         return {
-            'savings_amount': round(total_savings, 2),
-            'overpayment_amount': round(total_overpayment, 2),
+            'savings_amount': total_savings,
+            'overpayment_amount': total_overpayment,
             'compared_products': compared_products,
             'alerts_count': alerts_count,
             'critical_alerts': critical_alerts
         }
     
-    def _calculate_invoices_growth(self, invoices: List[Dict]) -> float:
-        """Calculer la croissance du nombre de factures vs mois dernier"""
-        try:
-            now = datetime.now()
-            current_month = now.replace(day=1)
-            last_month = (current_month - timedelta(days=1)).replace(day=1)
-            
-            current_month_count = 0
-            last_month_count = 0
-            
-            for invoice in invoices:
-                date_str = invoice.get('date') or invoice.get('analysis', {}).get('date')
-                if date_str:
-                    try:
-                        invoice_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                        if invoice_date >= current_month:
-                            current_month_count += 1
-                        elif invoice_date >= last_month and invoice_date < current_month:
-                            last_month_count += 1
-                    except:
-                        continue
-            
-            if last_month_count == 0:
-                return 100 if current_month_count > 0 else 0
-            
-            growth = ((current_month_count - last_month_count) / last_month_count) * 100
-            return round(growth, 1)
-            
-        except Exception as e:
-            logger.error(f"Erreur calcul croissance: {e}")
-            return 0
-    
-    def _get_spending_chart_data(self, invoices: List[Dict]) -> Dict[str, Any]:
-        """Données pour le graphique d'évolution des dépenses"""
-        try:
-            # Données des 6 derniers mois
-            spending_by_month = {}
-            now = datetime.now()
-            
-            for i in range(6):
-                month_date = now - timedelta(days=30*i)
-                month_key = month_date.strftime('%Y-%m')
-                month_label = month_date.strftime('%b %Y')
-                spending_by_month[month_key] = {'label': month_label, 'amount': 0}
-            
-            for invoice in invoices:
-                total = invoice.get('total') or invoice.get('analysis', {}).get('total', 0)
-                date_str = invoice.get('date') or invoice.get('analysis', {}).get('date')
-                
-                if date_str and total:
-                    try:
-                        # Nettoyer le montant total
-                        if isinstance(total, str):
-                            total = float(total.replace('€', '').replace(',', '.').strip())
-                        
-                        invoice_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                        month_key = invoice_date.strftime('%Y-%m')
-                        
-                        if month_key in spending_by_month:
-                            spending_by_month[month_key]['amount'] += total
-                    except:
-                        continue
-            
-            # Convertir en format Chart.js
-            sorted_months = sorted(spending_by_month.keys(), reverse=True)[:6]
-            sorted_months.reverse()  # Ordre chronologique
-            
-            return {
-                'labels': [spending_by_month[month]['label'] for month in sorted_months],
-                'data': [round(spending_by_month[month]['amount'], 2) for month in sorted_months]
-            }
-            
-        except Exception as e:
-            logger.error(f"Erreur données graphique dépenses: {e}")
-            return {'labels': [], 'data': []}
-    
-    def _get_supplier_chart_data(self, invoices: List[Dict]) -> Dict[str, Any]:
-        """Données pour le graphique répartition par fournisseur"""
-        try:
-            supplier_totals = {}
-            
-            for invoice in invoices:
-                supplier = invoice.get('supplier') or invoice.get('analysis', {}).get('supplier', 'Inconnu')
-                total = invoice.get('total') or invoice.get('analysis', {}).get('total', 0)
-                
-                if total:
-                    try:
-                        # Nettoyer le montant total
-                        if isinstance(total, str):
-                            total = float(total.replace('€', '').replace(',', '.').strip())
-                        
-                        if supplier not in supplier_totals:
-                            supplier_totals[supplier] = 0
-                        supplier_totals[supplier] += total
-                    except:
-                        continue
-            
-            # Trier par montant décroissant et prendre les 5 premiers
-            sorted_suppliers = sorted(supplier_totals.items(), key=lambda x: x[1], reverse=True)[:5]
-            
-            return {
-                'labels': [supplier for supplier, _ in sorted_suppliers],
-                'data': [round(total, 2) for _, total in sorted_suppliers]
-            }
-            
-        except Exception as e:
-            logger.error(f"Erreur données graphique fournisseurs: {e}")
-            return {'labels': [], 'data': []}
-    
-    def _get_recent_alerts(self, invoices: List[Dict]) -> List[Dict]:
-        """Récupérer les alertes récentes"""
-        alerts = []
-        
-        try:
-            # Trier les factures par date décroissante
-            sorted_invoices = sorted(invoices, 
-                key=lambda x: x.get('date') or x.get('analysis', {}).get('date', ''), 
-                reverse=True)
-            
-            for invoice in sorted_invoices[:10]:  # 10 dernières factures
-                analysis = invoice.get('analysis', {})
-                price_comparison = analysis.get('price_comparison', {})
-                
-                # Vérifier s'il y a des alertes
-                if price_comparison.get('higher_prices', 0) > 0:
-                    alerts.append({
-                        'id': invoice.get('id', ''),
-                        'supplier': analysis.get('supplier', 'Inconnu'),
-                        'date': analysis.get('date', ''),
-                        'alert_count': price_comparison.get('higher_prices', 0),
-                        'overpayment': price_comparison.get('total_overpayment', 0)
-                    })
-                
-                if len(alerts) >= 5:  # Limiter à 5 alertes
-                    break
-            
-        except Exception as e:
-            logger.error(f"Erreur récupération alertes: {e}")
-        
-        return alerts
-    
-    def _get_recent_activity(self, invoices: List[Dict], pending_products: List[Dict]) -> List[Dict]:
-        """Récupérer l'activité récente"""
+    def _get_recent_activity(self, pending_products: List[Dict]) -> List[Dict]:
+        """Activité récente des produits en attente (2 derniers)"""
         activity = []
         
         try:
-            # Activité des factures récentes
-            sorted_invoices = sorted(invoices, 
-                key=lambda x: x.get('date') or x.get('analysis', {}).get('date', ''), 
-                reverse=True)
-            
-            for invoice in sorted_invoices[:3]:
-                analysis = invoice.get('analysis', {})
-                activity.append({
-                    'type': 'invoice',
-                    'title': f"Facture {analysis.get('supplier', 'Inconnu')}",
-                    'description': f"Montant: {analysis.get('total', 0)}€",
-                    'date': analysis.get('date', ''),
-                    'icon': 'file-text'
-                })
-            
-            # Activité des produits en attente récents
             sorted_pending = sorted(pending_products, 
-                key=lambda x: x.get('date_ajout', ''), 
+                key=lambda x: str(x.get('date_ajout') or ''), 
                 reverse=True)
             
             for product in sorted_pending[:2]:
@@ -624,13 +647,10 @@ class StatsCalculator:
                     'icon': 'clock-history'
                 })
             
-            # Trier par date
-            activity.sort(key=lambda x: x.get('date', ''), reverse=True)
-            
         except Exception as e:
             logger.error(f"Erreur récupération activité: {e}")
         
-        return activity[:5]  # Limiter à 5 éléments
+        return activity
     
     def _get_default_stats(self) -> Dict[str, Any]:
         """Statistiques par défaut en cas d'erreur"""
@@ -647,4 +667,95 @@ class StatsCalculator:
             'recent_activity': [],
             'spending_chart_data': {'labels': [], 'data': []},
             'supplier_chart_data': {'labels': [], 'data': []}
-        } 
\ No newline at end of file
+        }
+    
+    # ===== AGRÉGATS MENSUELS MATÉRIALISÉS =====
+    
+    @staticmethod
+    def _month_key(date_str: Any) -> str:
+        """Mois (YYYY-MM) d'une date ISO, ou NO_DATE_MONTH si absente/illisible"""
+        if not date_str:
+            return NO_DATE_MONTH
+        try:
+            parsed = datetime.fromisoformat(str(date_str).replace('Z', '+00:00'))
+            return f"{parsed.year:04d}-{parsed.month:02d}"
+        except ValueError:
+            return NO_DATE_MONTH
+    
+    @staticmethod
+    def _parse_total(total: Any) -> float:
+        """Montant numérique d'un total (nombre ou chaîne '12,50 €')"""
+        if not total:
+            return 0.0
+        try:
+            if isinstance(total, str):
+                return float(total.replace('€', '').replace(',', '.').strip())
+            return float(total)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    def invoice_rollup_contribution(self, invoice: Dict) -> Dict[str, Any]:
+        """
+        Contribution d'une facture à l'agrégat mensuel de son restaurant
+        
+        Reprend exactement les règles de calculate_dashboard_stats (montant, fournisseur,
+        date, économies et alertes) pour qu'un dashboard lu depuis les agrégats soit
+        identique à un recalcul complet sur l'historique.
+        """
+        analysis = invoice.get('analysis', {}) or {}
+        date_str = invoice.get('date') or analysis.get('date')
+        month = self._month_key(date_str)
+        total = self._parse_total(invoice.get('total') or analysis.get('total', 0))
+        supplier = invoice.get('supplier') or analysis.get('supplier') or 'Inconnu'
+        
+        contribution = {
+            'month': month,
+            'invoices_count': 1,
+            'spending': total if month != NO_DATE_MONTH else 0.0,
+            'suppliers': {supplier: total} if total else {},
+            'recent_invoice': self._recent_invoice_entry(invoice)
+        }
+        contribution.update(self._invoice_savings_and_alerts(invoice))
+        return contribution
+    
+    @staticmethod
+    def _recent_invoice_entry(invoice: Dict) -> Dict[str, Any]:
+        """Entrée 'facture récente' (alertes et activité du dashboard)"""
+        analysis = invoice.get('analysis', {}) or {}
+        price_comparison = analysis.get('price_comparison', {}) or {}
+        return {
+            'id': invoice.get('id', ''),
+            'sort_key': invoice.get('date') or analysis.get('date') or '',
+            'supplier': analysis.get('supplier', 'Inconnu'),
+            'date': analysis.get('date', ''),
+            'total': analysis.get('total', 0),
+            'alert_count': price_comparison.get('higher_prices', 0),
+            'overpayment': price_comparison.get('total_overpayment', 0)
+        }
+    
+    def calculate_dashboard_stats_from_rollups(self, rollups: List[Dict], pending_products: List[Dict]) -> Dict[str, Any]:
+        """Statistiques du dashboard à partir des agrégats mensuels (sans relire les factures)"""
+        try:
+            totals = {key: 0 for key in ROLLUP_NUMERIC_FIELDS}
+            counts_by_month = {}
+            spending_by_month = {}
+            supplier_totals = {}
+            recent_invoices = []
+            
+            for rollup in rollups:
+                month = rollup.get('month', NO_DATE_MONTH)
+                for key in ROLLUP_NUMERIC_FIELDS:
+                    totals[key] += rollup.get(key, 0) or 0
+                counts_by_month[month] = counts_by_month.get(month, 0) + (rollup.get('invoices_count', 0) or 0)
+                spending_by_month[month] = spending_by_month.get(month, 0) + (rollup.get('spending', 0) or 0)
+                for supplier, amount in (rollup.get('suppliers') or {}).items():
+                    supplier_totals[supplier] = supplier_totals.get(supplier, 0) + amount
+                recent_invoices.extend(rollup.get('recent_invoices') or [])
+            
+            return self._assemble_dashboard_stats(
+                totals, counts_by_month, spending_by_month, supplier_totals, recent_invoices, pending_products
+            )
+            
+        except Exception as e:
+            logger.error(f"Erreur calcul statistiques dashboard (agrégats): {e}")
+            return self._get_default_stats()
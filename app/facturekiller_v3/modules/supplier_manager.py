@@ -10,6 +10,7 @@ import os
 from datetime import datetime
 from typing import List, Dict, Optional
 from modules.firestore_db import available as _fs_available, get_client as _fs_client
+from modules.parallel_fetch import fetch_parallel
 
 class SupplierManager:
     def __init__(self):
@@ -87,12 +88,15 @@ class SupplierManager:
         if getattr(self, '_fs_enabled', False) and getattr(self, '_fs', None):
             try:
                 docs = list(self._fs.collection('suppliers').stream())
-                for doc in docs:
-                    data = doc.to_dict()
-                    # Ajouter les statistiques calculées depuis Firestore
-                    stats = self._get_supplier_stats_firestore(data['name'])
-                    data.update(stats)
-                    suppliers.append(data)
+                suppliers = [doc.to_dict() for doc in docs]
+                
+                # Statistiques de chaque fournisseur (2 requêtes chacun) lues en parallèle
+                stats_by_index = fetch_parallel({
+                    str(index): (lambda name=data['name']: self._get_supplier_stats_firestore(name))
+                    for index, data in enumerate(suppliers)
+                })
+                for index, data in enumerate(suppliers):
+                    data.update(stats_by_index[str(index)])
                 print(f"📊 Firestore: {len(suppliers)} fournisseurs récupérés")
             except Exception as e:
                 print(f"❌ Firestore get_all_suppliers KO: {e}")
@@ -107,8 +111,12 @@ class SupplierManager:
     
     def _get_supplier_stats_firestore(self, supplier_name: str) -> Dict:
         """Calculer les statistiques d'un fournisseur depuis Firestore uniquement"""
-        validated_products = self._get_validated_products_firestore(supplier_name)
-        pending_products = self._get_pending_products_firestore(supplier_name)
+        products = fetch_parallel({
+            'validated': lambda: self._get_validated_products_firestore(supplier_name),
+            'pending': lambda: self._get_pending_products_firestore(supplier_name)
+        })
+        validated_products = products['validated']
+        pending_products = products['pending']
         
         return {
             'products_count': len(validated_products),
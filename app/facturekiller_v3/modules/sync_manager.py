@@ -5,20 +5,48 @@ Synchronisation automatique des fournisseurs et prix entre restaurants d'un mêm
 """
 
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+import hashlib
 import logging
 
+from modules.catalogue_index import exact_label
+from modules.product_alias_store import supplier_key
+
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    FIRESTORE_SDK = False
+
 logger = logging.getLogger(__name__)
 
+# Limite Firestore: 500 écritures par batch
+SYNC_BATCH_SIZE = 400
+# Opérations de synchronisation déjà appliquées (clé d'idempotence -> résultat)
+OPERATIONS_COLLECTION = 'sync_operations'
+
+
+def sync_price_doc_id(restaurant_name: str, supplier: str, product_name: str) -> str:
+    """
+    Identifiant déterministe du prix synchronisé d'un produit pour un restaurant
+
+    Libellé brut (sans casse): les variantes de taille (HUILE 1L / 5L, CREME 35% / 15%)
+    gardent chacune leur copie.
+    """
+    digest = hashlib.sha1(f"{supplier_key(supplier)}|{exact_label(product_name)}".encode('utf-8'))
+    return f"sync_{supplier_key(restaurant_name)}_{digest.hexdigest()[:20]}"
+
+
 class SyncManager:
     """Gestionnaire de synchronisation entre restaurants"""
     
-    def __init__(self):
+    def __init__(self, price_manager: Any = None):
         # Initialiser Firestore
         try:
             from modules.firestore_db import get_client
             self._fs = get_client()
-            self._fs_enabled = self._fs is not None
+            self._fs_enabled = self._fs is not None and FIRESTORE_SDK
             if self._fs_enabled:
                 print("✅ Firestore initialisé pour SyncManager")
             else:
@@ -27,6 +55,14 @@ class SyncManager:
             print(f"❌ Erreur initialisation Firestore SyncManager: {e}")
             self._fs_enabled = False
             self._fs = None
+        self._price_manager = price_manager
+    
+    def _get_price_manager(self):
+        """PriceManager partagé (index du catalogue tenu à jour par les prix synchronisés)"""
+        if self._price_manager is None:
+            from modules.price_manager import PriceManager
+            self._price_manager = PriceManager()
+        return self._price_manager
     
     def get_restaurants(self) -> List[Dict]:
         """Récupérer tous les restaurants depuis Firestore"""
@@ -93,11 +129,12 @@ class SyncManager:
             if 'sync_settings' not in restaurant:
                 restaurant['sync_settings'] = {}
             
-            restaurant['sync_settings'].update(sync_settings)
-            restaurant['sync_settings']['last_updated'] = datetime.now().isoformat()
+            changes = dict(sync_settings)
+            changes['last_updated'] = datetime.now().isoformat()
+            restaurant['sync_settings'].update(changes)
             
-            # Sauvegarder dans Firestore
-            doc_ref.set(restaurant)
+            # Fusion au niveau des champs: les autres données du restaurant ne sont pas réécrites
+            doc_ref.set({'sync_settings': changes}, merge=True)
             
             return {
                 'success': True,
@@ -115,7 +152,9 @@ class SyncManager:
             if not self._fs_enabled or not self._fs:
                 return {}
             
-            restaurants = self.get_restaurants()
+            # Restaurants synchronisés seulement (index du champ sync_settings.sync_enabled)
+            query = self._fs.collection('restaurants').where('sync_settings.sync_enabled', '==', True)
+            restaurants = [doc.to_dict() for doc in query.stream()]
             sync_groups = {}
             
             for restaurant in restaurants:
@@ -132,132 +171,210 @@ class SyncManager:
             return {}
     
     def get_restaurants_in_sync_group(self, sync_group: str) -> List[Dict]:
-        """Récupérer tous les restaurants d'un groupe de synchronisation depuis Firestore"""
+        """
+        Récupérer tous les restaurants d'un groupe de synchronisation depuis Firestore
+        
+        Membres lus par requête d'égalité sur sync_settings (index de champ Firestore),
+        sans parcourir toute la collection restaurants.
+        """
         try:
             if not self._fs_enabled or not self._fs:
                 return []
             
-            restaurants = self.get_restaurants()
-            return [
-                r for r in restaurants 
-                if r.get('sync_settings', {}).get('sync_enabled') 
-                and r.get('sync_settings', {}).get('sync_group') == sync_group
-            ]
+            query = (self._fs.collection('restaurants')
+                     .where('sync_settings.sync_group', '==', sync_group)
+                     .where('sync_settings.sync_enabled', '==', True))
+            members = []
+            for doc in query.stream():
+                restaurant = doc.to_dict()
+                restaurant.setdefault('id', doc.id)
+                members.append(restaurant)
+            return members
         except Exception as e:
             logger.error(f"Erreur récupération restaurants groupe: {e}")
             return []
     
-    def sync_suppliers_to_group(self, source_restaurant_id: str, new_supplier: str) -> Dict[str, Any]:
-        """Synchroniser un nouveau fournisseur vers tous les restaurants du groupe via Firestore"""
+    def get_restaurant_by_name(self, name: str) -> Optional[Dict]:
+        """Récupérer un restaurant par son nom (requête indexée)"""
+        try:
+            if not self._fs_enabled or not self._fs:
+                return None
+            
+            for doc in self._fs.collection('restaurants').where('name', '==', name).limit(1).stream():
+                restaurant = doc.to_dict()
+                restaurant.setdefault('id', doc.id)
+                return restaurant
+            return None
+        except Exception as e:
+            logger.error(f"Erreur récupération restaurant par nom: {e}")
+            return None
+    
+    # ===== ÉCRITURES GROUPÉES ET IDEMPOTENCE =====
+    
+    def _get_operation(self, idempotency_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Résultat d'une opération déjà appliquée avec cette clé (None si nouvelle)"""
+        if not idempotency_key:
+            return None
+        doc = self._fs.collection(OPERATIONS_COLLECTION).document(idempotency_key).get()
+        return doc.to_dict().get('result') if doc.exists else None
+    
+    def _commit_writes(self, writes: List[Tuple[Any, Dict[str, Any]]], idempotency_key: Optional[str] = None,
+                       result: Optional[Dict[str, Any]] = None):
+        """
+        Appliquer des mises à jour de champs (référence, champs) en batch
+        
+        La clé d'idempotence est enregistrée dans le dernier batch: une opération rejouée
+        après succès retrouve son résultat sans rien réécrire.
+        """
+        operations = [('update', ref, data) for ref, data in writes]
+        if idempotency_key:
+            operations.append(('set', self._fs.collection(OPERATIONS_COLLECTION).document(idempotency_key), {
+                'result': result or {},
+                'applied_at': datetime.now().isoformat()
+            }))
+        for start in range(0, len(operations), SYNC_BATCH_SIZE):
+            batch = self._fs.batch()
+            for action, ref, data in operations[start:start + SYNC_BATCH_SIZE]:
+                if action == 'update':
+                    batch.update(ref, data)
+                else:
+                    batch.set(ref, data)
+            batch.commit()
+    
+    def _group_targets(self, source_restaurant: Dict, setting: str) -> Tuple[Optional[str], List[Dict], Optional[Dict]]:
+        """(groupe, autres membres du groupe, réponse si la synchronisation est désactivée)"""
+        sync_settings = source_restaurant.get('sync_settings', {})
+        if not sync_settings.get('sync_enabled') or not sync_settings.get(setting):
+            label = 'fournisseurs' if setting == 'sync_suppliers' else 'prix'
+            return None, [], {'success': True, 'message': f'Synchronisation {label} désactivée', 'synced_count': 0}
+        
+        sync_group = sync_settings.get('sync_group')
+        if not sync_group:
+            return None, [], {'success': True, 'message': 'Aucun groupe de synchronisation', 'synced_count': 0}
+        
+        members = self.get_restaurants_in_sync_group(sync_group)
+        source_id = source_restaurant.get('id')
+        return sync_group, [r for r in members if r.get('id') != source_id], None
+    
+    def sync_suppliers_to_group(self, source_restaurant_id: str, new_supplier: str,
+                                idempotency_key: str = None) -> Dict[str, Any]:
+        """
+        Synchroniser un nouveau fournisseur vers tous les restaurants du groupe via Firestore
+        
+        ArrayUnion sur le seul champ suppliers, en batch: pas de réécriture des documents,
+        une écriture concurrente n'est pas perdue et un nouvel essai est sans effet.
+        """
         try:
             if not self._fs_enabled or not self._fs:
                 return {'success': False, 'error': 'Firestore non disponible'}
             
+            applied = self._get_operation(idempotency_key)
+            if applied is not None:
+                return applied
+            
             source_restaurant = self.get_restaurant_by_id(source_restaurant_id)
             if not source_restaurant:
                 return {'success': False, 'error': 'Restaurant source non trouvé'}
-            
-            sync_settings = source_restaurant.get('sync_settings', {})
-            if not sync_settings.get('sync_enabled') or not sync_settings.get('sync_suppliers'):
-                return {'success': True, 'message': 'Synchronisation fournisseurs désactivée', 'synced_count': 0}
-            
-            sync_group = sync_settings.get('sync_group')
-            if not sync_group:
-                return {'success': True, 'message': 'Aucun groupe de synchronisation', 'synced_count': 0}
-            
-            # Récupérer tous les restaurants du groupe
-            group_restaurants = self.get_restaurants_in_sync_group(sync_group)
-            synced_count = 0
-            synced_restaurants = []
-            
-            for restaurant in group_restaurants:
-                if restaurant['id'] != source_restaurant_id:  # Ne pas se synchroniser soi-même
-                    # Ajouter le fournisseur s'il n'existe pas déjà
-                    if 'suppliers' not in restaurant:
-                        restaurant['suppliers'] = []
-                    
-                    if new_supplier not in restaurant['suppliers']:
-                        restaurant['suppliers'].append(new_supplier)
-                        synced_count += 1
-                        synced_restaurants.append(restaurant['name'])
-                        
-                        # Mettre à jour dans Firestore
-                        self._fs.collection('restaurants').document(restaurant['id']).set(restaurant)
-            
-            if synced_count > 0:
-                return {
+            source_restaurant.setdefault('id', source_restaurant_id)
+            
+            sync_group, targets, disabled = self._group_targets(source_restaurant, 'sync_suppliers')
+            if disabled:
+                return disabled
+            
+            # Seuls les restaurants sans ce fournisseur sont écrits
+            targets = [r for r in targets if new_supplier not in r.get('suppliers', [])]
+            synced_restaurants = [r.get('name') for r in targets]
+            now = datetime.now().isoformat()
+            writes = [(self._fs.collection('restaurants').document(r['id']), {
+                'suppliers': _firestore.ArrayUnion([new_supplier]),
+                'sync_settings.last_sync': now
+            }) for r in targets]
+            
+            if synced_restaurants:
+                result = {
                     'success': True,
-                    'message': f'Fournisseur {new_supplier} synchronisé vers {synced_count} restaurant(s)',
-                    'synced_count': synced_count,
+                    'message': f'Fournisseur {new_supplier} synchronisé vers {len(synced_restaurants)} restaurant(s)',
+                    'synced_count': len(synced_restaurants),
                     'synced_restaurants': synced_restaurants,
                     'sync_group': sync_group
                 }
             else:
-                return {
+                result = {
                     'success': True,
                     'message': 'Fournisseur déjà présent dans tous les restaurants du groupe',
                     'synced_count': 0
                 }
+            self._commit_writes(writes, idempotency_key, result)
+            return result
                 
         except Exception as e:
             logger.error(f"Erreur synchronisation fournisseurs: {e}")
             return {'success': False, 'error': str(e)}
     
-    def sync_prices_to_group(self, source_restaurant_name: str, product_data: Dict) -> Dict[str, Any]:
-        """Synchroniser un nouveau prix vers tous les restaurants du groupe via Firestore"""
+    def sync_prices_to_group(self, source_restaurant_name: str, product_data: Dict,
+                             idempotency_key: str = None) -> Dict[str, Any]:
+        """
+        Synchroniser un nouveau prix vers tous les restaurants du groupe via Firestore
+        
+        Un seul batch pour tout le groupe; chaque copie a un identifiant déterministe
+        (restaurant, fournisseur, produit): un nouvel essai remplace au lieu de dupliquer.
+        """
         try:
             if not self._fs_enabled or not self._fs:
                 return {'success': False, 'error': 'Firestore non disponible'}
             
-            # Trouver le restaurant source par nom
-            restaurants = self.get_restaurants()
-            source_restaurant = next((r for r in restaurants if r['name'] == source_restaurant_name), None)
+            applied = self._get_operation(idempotency_key)
+            if applied is not None:
+                return applied
             
+            # Trouver le restaurant source par nom
+            source_restaurant = self.get_restaurant_by_name(source_restaurant_name)
             if not source_restaurant:
                 return {'success': False, 'error': 'Restaurant source non trouvé'}
             
-            sync_settings = source_restaurant.get('sync_settings', {})
-            if not sync_settings.get('sync_enabled') or not sync_settings.get('sync_prices'):
-                return {'success': True, 'message': 'Synchronisation prix désactivée', 'synced_count': 0}
-            
-            sync_group = sync_settings.get('sync_group')
-            if not sync_group:
-                return {'success': True, 'message': 'Aucun groupe de synchronisation', 'synced_count': 0}
-            
-            # Récupérer tous les restaurants du groupe
-            group_restaurants = self.get_restaurants_in_sync_group(sync_group)
-            synced_count = 0
-            synced_restaurants = []
-            
-            # Importer le PriceManager pour ajouter les prix
-            from modules.price_manager import PriceManager
-            price_manager = PriceManager()
-            
-            for restaurant in group_restaurants:
-                if restaurant['name'] != source_restaurant_name:  # Ne pas se synchroniser soi-même
-                    # Créer une copie du produit avec le restaurant cible
-                    sync_product_data = product_data.copy()
-                    sync_product_data['restaurant'] = restaurant['name']
-                    
-                    # Ajouter le prix pour ce restaurant
-                    if price_manager.add_price(sync_product_data):
-                        synced_count += 1
-                        synced_restaurants.append(restaurant['name'])
-            
-            if synced_count > 0:
+            sync_group, targets, disabled = self._group_targets(source_restaurant, 'sync_prices')
+            if disabled:
+                return disabled
+            
+            targets = [r for r in targets if r.get('name') != source_restaurant_name]
+            prices, doc_ids = [], []
+            for restaurant in targets:
+                # Copie du produit avec le restaurant cible
+                sync_product_data = product_data.copy()
+                sync_product_data['restaurant'] = restaurant['name']
+                prices.append(sync_product_data)
+                doc_ids.append(sync_price_doc_id(restaurant['name'], product_data.get('fournisseur', ''),
+                                                 product_data.get('produit', '')))
+            
+            price_ids = self._get_price_manager().add_prices(prices, doc_ids) if prices else []
+            synced_restaurants = [r['name'] for r, price_id in zip(targets, price_ids) if price_id]
+            
+            if len(synced_restaurants) < len(targets):
+                # Échec partiel: l'outbox retente, les copies déjà écrites sont remplacées à l'identique
+                missing = [r['name'] for r in targets if r['name'] not in synced_restaurants]
                 return {
+                    'success': False,
+                    'error': f"Prix non synchronisé vers {len(missing)} restaurant(s): {', '.join(missing)}",
+                    'synced_count': len(synced_restaurants),
+                    'synced_restaurants': synced_restaurants
+                }
+            
+            if synced_restaurants:
+                result = {
                     'success': True,
-                    'message': f'Prix synchronisé vers {synced_count} restaurant(s)',
-                    'synced_count': synced_count,
+                    'message': f'Prix synchronisé vers {len(synced_restaurants)} restaurant(s)',
+                    'synced_count': len(synced_restaurants),
                     'synced_restaurants': synced_restaurants,
                     'sync_group': sync_group
                 }
             else:
-                return {
+                result = {
                     'success': True,
                     'message': 'Aucune synchronisation nécessaire',
                     'synced_count': 0
                 }
+            self._commit_writes([], idempotency_key, result)
+            return result
                 
         except Exception as e:
             logger.error(f"Erreur synchronisation prix: {e}")
@@ -269,27 +386,22 @@ class SyncManager:
             if not self._fs_enabled or not self._fs:
                 return {'success': False, 'error': 'Firestore non disponible'}
             
-            restaurants = self.get_restaurants()
-            updated_count = 0
-            
-            for restaurant_id in restaurant_ids:
-                restaurant = next((r for r in restaurants if r['id'] == restaurant_id), None)
-                if restaurant:
-                    if 'sync_settings' not in restaurant:
-                        restaurant['sync_settings'] = {}
-                    
-                    restaurant['sync_settings'].update({
-                        'sync_enabled': True,
-                        'sync_suppliers': True,
-                        'sync_prices': True,
-                        'sync_group': group_name,
-                        'sync_master': restaurant_id == master_restaurant_id,
-                        'last_sync': datetime.now().isoformat()
-                    })
-                    
-                    # Mettre à jour dans Firestore
-                    self._fs.collection('restaurants').document(restaurant_id).set(restaurant)
-                    updated_count += 1
+            # Lecture des seuls restaurants concernés, par identifiant
+            collection = self._fs.collection('restaurants')
+            snapshots = self._fs.get_all([collection.document(restaurant_id) for restaurant_id in restaurant_ids])
+            existing = [snapshot.id for snapshot in snapshots if snapshot.exists]
+            now = datetime.now().isoformat()
+            
+            writes = [(collection.document(restaurant_id), {
+                'sync_settings.sync_enabled': True,
+                'sync_settings.sync_suppliers': True,
+                'sync_settings.sync_prices': True,
+                'sync_settings.sync_group': group_name,
+                'sync_settings.sync_master': restaurant_id == master_restaurant_id,
+                'sync_settings.last_sync': now
+            }) for restaurant_id in existing]
+            self._commit_writes(writes)
+            updated_count = len(writes)
             
             if updated_count > 0:
                 return {
@@ -342,123 +454,112 @@ class SyncManager:
             if not doc.exists:
                 return {'success': False, 'error': 'Restaurant non trouvé'}
             
-            restaurant = doc.to_dict()
-            if 'sync_settings' not in restaurant:
-                restaurant['sync_settings'] = {}
-            
-            restaurant['sync_settings']['sync_enabled'] = False
-            restaurant['sync_settings']['last_updated'] = datetime.now().isoformat()
-            
-            doc_ref.set(restaurant)
+            doc_ref.update({
+                'sync_settings.sync_enabled': False,
+                'sync_settings.last_updated': datetime.now().isoformat()
+            })
             
             return {'success': True, 'message': 'Synchronisation désactivée'}
         except Exception as e:
             logger.error(f"Erreur désactivation sync: {e}")
             return {'success': False, 'error': str(e)}
     
-    def sync_supplier_removal_to_group(self, source_restaurant_id: str, removed_supplier: str) -> Dict[str, Any]:
-        """Synchroniser la suppression d'un fournisseur vers tous les restaurants du groupe via Firestore"""
+    def sync_supplier_removal_to_group(self, source_restaurant_id: str, removed_supplier: str,
+                                       idempotency_key: str = None) -> Dict[str, Any]:
+        """Synchroniser la suppression d'un fournisseur vers tous les restaurants du groupe (ArrayRemove en batch)"""
         try:
             if not self._fs_enabled or not self._fs:
                 return {'success': False, 'error': 'Firestore non disponible'}
             
+            applied = self._get_operation(idempotency_key)
+            if applied is not None:
+                return applied
+            
             source_restaurant = self.get_restaurant_by_id(source_restaurant_id)
             if not source_restaurant:
                 return {'success': False, 'error': 'Restaurant source non trouvé'}
-            
-            sync_settings = source_restaurant.get('sync_settings', {})
-            if not sync_settings.get('sync_enabled') or not sync_settings.get('sync_suppliers'):
-                return {'success': True, 'message': 'Synchronisation fournisseurs désactivée', 'synced_count': 0}
-            
-            sync_group = sync_settings.get('sync_group')
-            if not sync_group:
-                return {'success': True, 'message': 'Aucun groupe de synchronisation', 'synced_count': 0}
-            
-            # Récupérer tous les restaurants du groupe
-            group_restaurants = self.get_restaurants_in_sync_group(sync_group)
-            synced_count = 0
-            synced_restaurants = []
-            
-            for restaurant in group_restaurants:
-                if restaurant['id'] != source_restaurant_id:  # Ne pas se synchroniser soi-même
-                    # Retirer le fournisseur s'il existe
-                    if 'suppliers' in restaurant and removed_supplier in restaurant['suppliers']:
-                        restaurant['suppliers'].remove(removed_supplier)
-                        synced_count += 1
-                        synced_restaurants.append(restaurant['name'])
-                        
-                        # Mettre à jour dans Firestore
-                        self._fs.collection('restaurants').document(restaurant['id']).set(restaurant)
-            
-            if synced_count > 0:
-                return {
+            source_restaurant.setdefault('id', source_restaurant_id)
+            
+            sync_group, targets, disabled = self._group_targets(source_restaurant, 'sync_suppliers')
+            if disabled:
+                return disabled
+            
+            # Seuls les restaurants ayant ce fournisseur sont écrits
+            targets = [r for r in targets if removed_supplier in r.get('suppliers', [])]
+            synced_restaurants = [r.get('name') for r in targets]
+            now = datetime.now().isoformat()
+            writes = [(self._fs.collection('restaurants').document(r['id']), {
+                'suppliers': _firestore.ArrayRemove([removed_supplier]),
+                'sync_settings.last_sync': now
+            }) for r in targets]
+            
+            if synced_restaurants:
+                result = {
                     'success': True,
-                    'message': f'Fournisseur {removed_supplier} retiré de {synced_count} restaurant(s)',
-                    'synced_count': synced_count,
+                    'message': f'Fournisseur {removed_supplier} retiré de {len(synced_restaurants)} restaurant(s)',
+                    'synced_count': len(synced_restaurants),
                     'synced_restaurants': synced_restaurants,
                     'sync_group': sync_group
                 }
             else:
-                return {
+                result = {
                     'success': True,
                     'message': 'Fournisseur non présent dans les autres restaurants du groupe',
                     'synced_count': 0
                 }
+            self._commit_writes(writes, idempotency_key, result)
+            return result
                 
         except Exception as e:
             logger.error(f"Erreur synchronisation suppression fournisseur: {e}")
             return {'success': False, 'error': str(e)}
     
-    def sync_full_suppliers_list_to_group(self, source_restaurant_id: str) -> Dict[str, Any]:
-        """Synchroniser la liste complète des fournisseurs vers tous les restaurants du groupe via Firestore"""
+    def sync_full_suppliers_list_to_group(self, source_restaurant_id: str,
+                                          idempotency_key: str = None) -> Dict[str, Any]:
+        """Synchroniser la liste complète des fournisseurs vers tous les restaurants du groupe (champ suppliers seul, en batch)"""
         try:
             if not self._fs_enabled or not self._fs:
                 return {'success': False, 'error': 'Firestore non disponible'}
             
+            applied = self._get_operation(idempotency_key)
+            if applied is not None:
+                return applied
+            
             source_restaurant = self.get_restaurant_by_id(source_restaurant_id)
             if not source_restaurant:
                 return {'success': False, 'error': 'Restaurant source non trouvé'}
+            source_restaurant.setdefault('id', source_restaurant_id)
             
-            sync_settings = source_restaurant.get('sync_settings', {})
-            if not sync_settings.get('sync_enabled') or not sync_settings.get('sync_suppliers'):
-                return {'success': True, 'message': 'Synchronisation fournisseurs désactivée', 'synced_count': 0}
-            
-            sync_group = sync_settings.get('sync_group')
-            if not sync_group:
-                return {'success': True, 'message': 'Aucun groupe de synchronisation', 'synced_count': 0}
-            
-            # Récupérer tous les restaurants du groupe
-            group_restaurants = self.get_restaurants_in_sync_group(sync_group)
-            synced_count = 0
-            synced_restaurants = []
+            sync_group, targets, disabled = self._group_targets(source_restaurant, 'sync_suppliers')
+            if disabled:
+                return disabled
             
             source_suppliers = source_restaurant.get('suppliers', [])
-            
-            for restaurant in group_restaurants:
-                if restaurant['id'] != source_restaurant_id:  # Ne pas se synchroniser soi-même
-                    # Remplacer complètement la liste des fournisseurs
-                    restaurant['suppliers'] = source_suppliers.copy()
-                    synced_count += 1
-                    synced_restaurants.append(restaurant['name'])
-                    
-                    # Mettre à jour dans Firestore
-                    self._fs.collection('restaurants').document(restaurant['id']).set(restaurant)
-            
-            if synced_count > 0:
-                return {
+            now = datetime.now().isoformat()
+            # Remplacer complètement la liste des fournisseurs (valeur absolue: rejouable)
+            writes = [(self._fs.collection('restaurants').document(r['id']), {
+                'suppliers': list(source_suppliers),
+                'sync_settings.last_sync': now
+            }) for r in targets]
+            synced_restaurants = [r.get('name') for r in targets]
+            
+            if synced_restaurants:
+                result = {
                     'success': True,
-                    'message': f'Liste complète des fournisseurs synchronisée vers {synced_count} restaurant(s)',
-                    'synced_count': synced_count,
+                    'message': f'Liste complète des fournisseurs synchronisée vers {len(synced_restaurants)} restaurant(s)',
+                    'synced_count': len(synced_restaurants),
                     'synced_restaurants': synced_restaurants,
                     'sync_group': sync_group,
                     'suppliers_count': len(source_suppliers)
                 }
             else:
-                return {
+                result = {
                     'success': True,
                     'message': 'Aucune synchronisation nécessaire',
                     'synced_count': 0
                 }
+            self._commit_writes(writes, idempotency_key, result)
+            return result
                 
         except Exception as e:
             logger.error(f"Erreur synchronisation liste complète fournisseurs: {e}")
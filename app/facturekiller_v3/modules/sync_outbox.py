@@ -0,0 +1,424 @@
+"""
+File d'attente durable (outbox) des synchronisations entre restaurants
+La requête enregistre une intention de synchronisation et rend la main; un worker en
+arrière-plan l'applique aux membres du groupe avec nouvelles tentatives, dans l'ordre
+d'émission de chaque restaurant source
+"""
+
+import os
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+try:
+    from google.cloud import firestore as _firestore  # type: ignore
+    FIRESTORE_SDK = True
+except ImportError:
+    _firestore = None
+    FIRESTORE_SDK = False
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'sync_outbox'
+# Dernière application réussie par groupe (lue par l'endpoint de statut)
+GROUPS_COLLECTION = 'sync_outbox_groups'
+
+OUTBOX_POLL_INTERVAL = float(os.getenv('SYNC_OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('SYNC_OUTBOX_MAX_ATTEMPTS', '8'))
+# Intentions lues par restaurant et par cycle du worker (les plus anciennes d'abord)
+OUTBOX_SCAN_LIMIT = 500
+# Une intention réservée par un worker arrêté est reprise après ce délai (secondes)
+CLAIM_TIMEOUT = 300
+MAX_BACKOFF = 600
+
+# Opération -> réglage du restaurant source qui l'autorise
+OPERATION_SETTINGS = {
+    'add_supplier': 'sync_suppliers',
+    'remove_supplier': 'sync_suppliers',
+    'full_suppliers': 'sync_suppliers',
+    'price': 'sync_prices'
+}
+OPEN_STATUSES = ['pending', 'processing']
+
+
+def retry_delay(attempts: int) -> int:
+    """Attente avant la tentative suivante (exponentielle, plafonnée)"""
+    return min(2 ** attempts * 5, MAX_BACKOFF)
+
+
+class SyncOutbox:
+    """Intentions de synchronisation persistées et worker qui les applique"""
+
+    def __init__(self, sync_manager: Any = None, fs_client: Any = None):
+        self._fs = fs_client
+        if self._fs is None:
+            try:
+                from modules.firestore_db import get_client
+                self._fs = get_client()
+            except Exception as e:
+                logger.error(f"❌ Erreur initialisation Firestore SyncOutbox: {e}")
+        self._fs_enabled = self._fs is not None and FIRESTORE_SDK
+        self._sync_manager = sync_manager
+        self._sequences = None
+
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._worker_lock = threading.Lock()
+        self._claim_token = uuid.uuid4().hex
+
+    def _get_sync_manager(self):
+        if self._sync_manager is None:
+            from modules.sync_manager import SyncManager
+            self._sync_manager = SyncManager()
+        return self._sync_manager
+
+    def _get_sequences(self):
+        if self._sequences is None:
+            from modules.sequence_service import SequenceService
+            self._sequences = SequenceService(self._fs)
+        return self._sequences
+
+    # ===== ÉMISSION (chemin de requête) =====
+
+    def enqueue(self, operation: str, source: Dict[str, Any], args: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Enregistrer une intention de synchronisation
+
+        Args:
+            operation: add_supplier, remove_supplier, full_suppliers ou price
+            source: restaurant source (document restaurants, avec son id)
+            args: arguments de l'opération (supplier, product_data...)
+
+        Les réglages du restaurant sont vérifiés ici: rien n'est mis en file si la
+        synchronisation est désactivée ou sans groupe.
+        """
+        if not self._fs_enabled:
+            return {'success': False, 'error': 'Firestore non disponible'}
+        if operation not in OPERATION_SETTINGS:
+            return {'success': False, 'error': f'Opération de synchronisation inconnue: {operation}'}
+        if not source:
+            return {'success': False, 'error': 'Restaurant source non trouvé'}
+
+        sync_settings = source.get('sync_settings', {})
+        if not sync_settings.get('sync_enabled') or not sync_settings.get(OPERATION_SETTINGS[operation]):
+            label = 'prix' if operation == 'price' else 'fournisseurs'
+            return {'success': True, 'message': f'Synchronisation {label} désactivée', 'synced_count': 0}
+        sync_group = sync_settings.get('sync_group')
+        if not sync_group:
+            return {'success': True, 'message': 'Aucun groupe de synchronisation', 'synced_count': 0}
+
+        restaurant_id = source['id']
+        now = datetime.now().isoformat()
+        intent: Dict[str, Any] = {}
+
+        def _write(transaction, sequence: int):
+            # Intention créée dans la transaction qui alloue son rang: le worker ne peut
+            # pas voir le rang N+1 tant que le rang N n'est pas écrit
+            intent.update({
+                'id': f"{restaurant_id}_{sequence:016d}",
+                'operation': operation,
+                'args': args,
+                'restaurant_id': restaurant_id,
+                'restaurant_name': source.get('name'),
+                'sync_group': sync_group,
+                'sequence': sequence,
+                'status': 'pending',
+                'attempts': 0,
+                'next_attempt_at': now,
+                'created_at': now
+            })
+            transaction.set(self._fs.collection(COLLECTION).document(intent['id']), intent)
+
+        sequence = self._get_sequences().next_value('sync_outbox', scope=restaurant_id, write=_write)
+        if sequence is None:
+            # Pas de rang de repli: un horodatage ne garantit pas l'ordre entre workers
+            return {'success': False, 'error': 'Erreur enregistrement intention de synchronisation'}
+        intent_id = intent['id']
+
+        self._ensure_worker()
+        self._wake.set()
+        return {
+            'success': True,
+            'queued': True,
+            'intent_id': intent_id,
+            'sync_group': sync_group,
+            'message': f'Synchronisation {sync_group} en file',
+            'synced_count': 0
+        }
+
+    def enqueue_supplier_added(self, restaurant_id: str, supplier: str) -> Dict[str, Any]:
+        return self.enqueue('add_supplier', self._get_sync_manager().get_restaurant_by_id(restaurant_id),
+                            {'supplier': supplier})
+
+    def enqueue_supplier_removed(self, restaurant_id: str, supplier: str) -> Dict[str, Any]:
+        return self.enqueue('remove_supplier', self._get_sync_manager().get_restaurant_by_id(restaurant_id),
+                            {'supplier': supplier})
+
+    def enqueue_full_suppliers(self, restaurant_id: str) -> Dict[str, Any]:
+        return self.enqueue('full_suppliers', self._get_sync_manager().get_restaurant_by_id(restaurant_id), {})
+
+    def enqueue_price(self, restaurant_name: str, product_data: Dict[str, Any]) -> Dict[str, Any]:
+        return self.enqueue('price', self._get_sync_manager().get_restaurant_by_name(restaurant_name),
+                            {'product_data': product_data})
+
+    # ===== WORKER =====
+
+    def start(self):
+        """Démarrer le worker (reprise des intentions en attente après un redémarrage)"""
+        if self._fs_enabled:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        """Un thread par processus, relancé après un fork"""
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='sync-outbox', daemon=True)
+            self._worker_pid = os.getpid()
+            self._claim_token = uuid.uuid4().hex
+            self._worker.start()
+            logger.info("🔄 Worker de synchronisation (outbox) démarré")
+
+    def _run(self):
+        while True:
+            try:
+                self.process_pending()
+            except Exception as e:
+                logger.error(f"❌ Erreur cycle outbox de synchronisation: {e}")
+            self._wake.wait(OUTBOX_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _apply(self, intent: Dict[str, Any]) -> Dict[str, Any]:
+        """Appliquer une intention (clé d'idempotence = identifiant de l'intention)"""
+        sync_manager = self._get_sync_manager()
+        operation, args, key = intent['operation'], intent.get('args', {}), intent['id']
+        if operation == 'add_supplier':
+            return sync_manager.sync_suppliers_to_group(intent['restaurant_id'], args['supplier'], idempotency_key=key)
+        if operation == 'remove_supplier':
+            return sync_manager.sync_supplier_removal_to_group(intent['restaurant_id'], args['supplier'],
+                                                               idempotency_key=key)
+        if operation == 'full_suppliers':
+            return sync_manager.sync_full_suppliers_list_to_group(intent['restaurant_id'], idempotency_key=key)
+        if operation == 'price':
+            return sync_manager.sync_prices_to_group(intent['restaurant_name'], args['product_data'],
+                                                     idempotency_key=key)
+        return {'success': False, 'error': f'Opération de synchronisation inconnue: {operation}'}
+
+    def process_pending(self) -> int:
+        """
+        Appliquer les intentions en attente, dans l'ordre de chaque restaurant source
+
+        Une intention en échec (ou en attente de sa prochaine tentative) retient les
+        suivantes du même restaurant; les autres restaurants avancent. Après
+        OUTBOX_MAX_ATTEMPTS essais elle est marquée failed et la file repart.
+        Retourne le nombre d'intentions appliquées.
+        """
+        if not self._fs_enabled:
+            return 0
+
+        applied = 0
+        for restaurant_id in self._open_restaurants():
+            query = (self._fs.collection(COLLECTION)
+                     .where('restaurant_id', '==', restaurant_id)
+                     .where('status', 'in', OPEN_STATUSES)
+                     .order_by('sequence')
+                     .limit(OUTBOX_SCAN_LIMIT))
+            for doc in query.stream():
+                intent = doc.to_dict()
+                intent['id'] = doc.id
+                claimed = self._claim(intent)
+                if not claimed:
+                    break
+                intent.update(claimed)
+                if not self._run_intent(intent):
+                    break
+                applied += 1
+        return applied
+
+    def _open_restaurants(self):
+        """Restaurants ayant des intentions ouvertes, un à un (aucun n'est masqué par un autre)"""
+        last = None
+        while True:
+            query = (self._fs.collection(COLLECTION)
+                     .where('status', 'in', OPEN_STATUSES)
+                     .order_by('restaurant_id'))
+            if last is not None:
+                query = query.start_after({'restaurant_id': last})
+            docs = list(query.limit(1).stream())
+            if not docs:
+                return
+            last = docs[0].to_dict().get('restaurant_id')
+            yield last
+
+    def _claim(self, intent: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Réserver l'intention si elle est due, libre et en tête de la file de son restaurant
+        (un seul worker par intention). Retourne l'état relu en transaction, None sinon.
+        """
+        now = datetime.now()
+        ref = self._fs.collection(COLLECTION).document(intent['id'])
+        stale = (now - timedelta(seconds=CLAIM_TIMEOUT)).isoformat()
+        earlier = (self._fs.collection(COLLECTION)
+                   .where('restaurant_id', '==', intent.get('restaurant_id'))
+                   .where('status', 'in', OPEN_STATUSES)
+                   .where('sequence', '<', intent.get('sequence', 0))
+                   .limit(1))
+
+        @_firestore.transactional
+        def _reserve(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            current = snapshot.to_dict()
+            if current.get('status') not in OPEN_STATUSES:
+                return None
+            if (current.get('next_attempt_at') or '') > now.isoformat():
+                return None
+            if (current.get('status') == 'processing' and (current.get('claimed_at') or '') > stale
+                    and current.get('claim_token') != self._claim_token):
+                return None
+            # Un rang inférieur encore ouvert passe d'abord
+            if any(True for _ in earlier.get(transaction=transaction)):
+                return None
+            transaction.update(ref, {
+                'status': 'processing',
+                'claimed_at': now.isoformat(),
+                'claim_token': self._claim_token
+            })
+            return current
+
+        try:
+            return _reserve(self._fs.transaction())
+        except Exception as e:
+            logger.error(f"❌ Erreur réservation intention {intent['id']}: {e}")
+            return None
+
+    def _run_intent(self, intent: Dict[str, Any]) -> bool:
+        """Appliquer une intention réservée; True si la file du restaurant peut continuer"""
+        try:
+            result = self._apply(intent)
+            error = None if result.get('success') else result.get('error', 'Échec de synchronisation')
+        except Exception as e:
+            result, error = None, str(e)
+
+        now = datetime.now()
+        ref = self._fs.collection(COLLECTION).document(intent['id'])
+        attempts = intent.get('attempts', 0) + 1
+        try:
+            if error is None:
+                batch = self._fs.batch()
+                batch.update(ref, {
+                    'status': 'done',
+                    'attempts': attempts,
+                    'result': result,
+                    'applied_at': now.isoformat(),
+                    'lag_seconds': round((now - datetime.fromisoformat(intent['created_at'])).total_seconds(), 3)
+                })
+                batch.set(self._fs.collection(GROUPS_COLLECTION).document(intent['sync_group']), {
+                    'sync_group': intent['sync_group'],
+                    'last_applied_at': now.isoformat(),
+                    'last_intent_id': intent['id'],
+                    'applied': _firestore.Increment(1)
+                }, merge=True)
+                batch.commit()
+                return True
+
+            failed = attempts >= OUTBOX_MAX_ATTEMPTS
+            ref.update({
+                'status': 'failed' if failed else 'pending',
+                'attempts': attempts,
+                'last_error': error,
+                'last_attempt_at': now.isoformat(),
+                'next_attempt_at': (now + timedelta(seconds=retry_delay(attempts))).isoformat()
+            })
+            if failed:
+                logger.error(f"❌ Intention {intent['id']} abandonnée après {attempts} essais: {error}")
+                self._fs.collection(GROUPS_COLLECTION).document(intent['sync_group']).set({
+                    'sync_group': intent['sync_group'],
+                    'last_failure_at': now.isoformat(),
+                    'failed': _firestore.Increment(1)
+                }, merge=True)
+                # Abandon: les intentions suivantes du restaurant ne restent pas bloquées
+                return True
+            logger.warning(f"⚠️ Intention {intent['id']} en échec (essai {attempts}): {error}")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Erreur mise à jour intention {intent['id']}: {e}")
+            return False
+
+    # ===== STATUT =====
+
+    @staticmethod
+    def _failure_entry(intent_id: str, intent: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'intent_id': intent_id,
+            'operation': intent.get('operation'),
+            'restaurant': intent.get('restaurant_name'),
+            'status': intent.get('status'),
+            'attempts': intent.get('attempts', 0),
+            'error': intent.get('last_error'),
+            'at': intent.get('last_attempt_at')
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        """Retard et échecs par groupe de synchronisation"""
+        if not self._fs_enabled:
+            return {'success': False, 'error': 'Firestore non disponible'}
+
+        self._ensure_worker()
+        now = datetime.now()
+        groups: Dict[str, Dict[str, Any]] = {}
+
+        def _group(name: str) -> Dict[str, Any]:
+            return groups.setdefault(name, {
+                'sync_group': name, 'pending': 0, 'processing': 0, 'failed_open': 0,
+                'oldest_pending_at': None, 'lag_seconds': 0, 'recent_failures': []
+            })
+
+        try:
+            for doc in self._fs.collection(GROUPS_COLLECTION).stream():
+                data = doc.to_dict()
+                _group(doc.id).update({
+                    'applied': data.get('applied', 0),
+                    'failed': data.get('failed', 0),
+                    'last_applied_at': data.get('last_applied_at'),
+                    'last_failure_at': data.get('last_failure_at')
+                })
+
+            # File ouverte lue en entier: les compteurs ne sont pas tronqués
+            query = self._fs.collection(COLLECTION).where('status', 'in', OPEN_STATUSES)
+            for doc in query.stream():
+                intent = doc.to_dict()
+                group = _group(intent.get('sync_group') or '')
+                group[intent.get('status')] += 1
+                created_at = intent.get('created_at')
+                if created_at and (group['oldest_pending_at'] is None or created_at < group['oldest_pending_at']):
+                    group['oldest_pending_at'] = created_at
+                    group['lag_seconds'] = round((now - datetime.fromisoformat(created_at)).total_seconds(), 1)
+                if intent.get('last_error'):
+                    group['recent_failures'].append(self._failure_entry(doc.id, intent))
+
+            # Échecs définitifs: comptage par agrégation, seuls les 10 derniers sont lus
+            for name, group in groups.items():
+                failed = (self._fs.collection(COLLECTION)
+                          .where('sync_group', '==', name)
+                          .where('status', '==', 'failed'))
+                group['failed_open'] = failed.count().get()[0][0].value
+                if group['failed_open']:
+                    recent = failed.order_by('last_attempt_at', direction=_firestore.Query.DESCENDING).limit(10)
+                    for doc in recent.stream():
+                        group['recent_failures'].append(self._failure_entry(doc.id, doc.to_dict()))
+
+            for group in groups.values():
+                group['recent_failures'].sort(key=lambda f: f.get('at') or '', reverse=True)
+                group['recent_failures'] = group['recent_failures'][:10]
+
+            return {'success': True, 'data': groups, 'count': len(groups)}
+        except Exception as e:
+            logger.error(f"❌ Erreur statut outbox de synchronisation: {e}")
+            return {'success': False, 'error': str(e)}
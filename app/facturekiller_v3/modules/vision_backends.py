@@ -0,0 +1,234 @@
+"""
+Backends Vision interchangeables pour ClaudeVision
+Backend Anthropic réel, enregistrement de réponses, et backend factice rejouant
+des réponses enregistrées (latence, erreurs et 429 configurables) pour les tests de charge
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, List, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sélection du backend: anthropic (défaut), record (anthropic + enregistrement), fake
+BACKEND_ENV = 'VISION_BACKEND'
+DEFAULT_FIXTURES_DIR = 'data/vision_fixtures'
+
+# Facture rejouée quand aucune fixture n'est disponible
+DEFAULT_FIXTURE = {
+    'supplier': 'METRO',
+    'response': {
+        'supplier': 'METRO',
+        'invoice_number': 'FAKE-0001',
+        'date': '2025-01-15',
+        'total_amount': 95.0,
+        'products': [
+            {'name': 'Bavettes de bœuf', 'quantity': 2, 'unit': 'kg', 'unit_price': 18.5, 'total_price': 37.0},
+            {'name': 'Tomates cerises', 'quantity': 4, 'unit': 'kg', 'unit_price': 6.5, 'total_price': 26.0},
+            {'name': 'Crème fraîche', 'quantity': 4, 'unit': 'L', 'unit_price': 8.0, 'total_price': 32.0}
+        ]
+    },
+    'usage': {'input_tokens': 1600, 'output_tokens': 350}
+}
+
+
+class FakeAPIError(Exception):
+    """Erreur simulée de l'API (équivalent d'une 5xx Anthropic)"""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeRateLimitError(FakeAPIError):
+    """Limite de débit simulée (HTTP 429)"""
+
+    def __init__(self, message: str = 'rate_limit_error: Number of requests has exceeded your rate limit'):
+        super().__init__(message, status_code=429)
+
+
+def backend_mode() -> str:
+    """Mode de backend configuré par variable d'environnement"""
+    return os.getenv(BACKEND_ENV, 'anthropic').strip().lower()
+
+
+def _image_digest(messages: List[Dict]) -> Optional[str]:
+    """Empreinte SHA-1 de la première image base64 d'une requête"""
+    for message in messages or []:
+        content = message.get('content')
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if block.get('type') == 'image':
+                data = block.get('source', {}).get('data', '')
+                return hashlib.sha1(data.encode('utf-8')).hexdigest()
+    return None
+
+
+def _request_kind(messages: List[Dict], max_tokens: int) -> str:
+    """Type d'appel fait par ClaudeVision: ping, détection fournisseur ou analyse"""
+    digest = _image_digest(messages)
+    if digest is None:
+        return 'ping'
+    return 'supplier' if max_tokens <= 50 else 'analysis'
+
+
+def _make_response(text: str, model: str, usage: Dict[str, int]) -> SimpleNamespace:
+    """Objet réponse au format du SDK Anthropic (content[0].text, usage)"""
+    return SimpleNamespace(
+        content=[SimpleNamespace(type='text', text=text)],
+        model=model,
+        stop_reason='end_turn',
+        usage=SimpleNamespace(
+            input_tokens=usage.get('input_tokens', 0),
+            output_tokens=usage.get('output_tokens', 0),
+            cache_read_input_tokens=usage.get('cache_read_input_tokens', 0),
+            cache_creation_input_tokens=usage.get('cache_creation_input_tokens', 0)
+        )
+    )
+
+
+class FakeVisionBackend:
+    """
+    Backend factice en mémoire compatible avec `client.messages.create`
+
+    Rejoue les fixtures JSON d'un répertoire (une par facture, indexées par empreinte
+    d'image; sinon choix déterministe par empreinte) avec latence gaussienne,
+    taux d'erreurs 5xx et de 429 configurables et graine fixe pour des runs reproductibles.
+    """
+
+    def __init__(self, fixtures_dir: str = DEFAULT_FIXTURES_DIR, latency_ms: float = 1500,
+                 jitter_ms: float = 300, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.fixtures = self._load_fixtures(fixtures_dir)
+        self.by_digest = {f['image_sha1']: f for f in self.fixtures if f.get('image_sha1')}
+        self.calls = {'ping': 0, 'supplier': 0, 'analysis': 0, 'errors': 0, 'rate_limited': 0}
+        # Même interface que anthropic.Anthropic: client.messages.create(...)
+        self.messages = self
+        logger.info(f"🧪 Backend Vision factice: {len(self.fixtures)} fixtures, "
+                    f"latence {latency_ms}±{jitter_ms}ms, erreurs {error_rate:.0%}, 429 {rate_limit_rate:.0%}")
+
+    @classmethod
+    def from_env(cls) -> 'FakeVisionBackend':
+        """Construire depuis les variables VISION_FAKE_*"""
+        return cls(
+            fixtures_dir=os.getenv('VISION_FIXTURES_DIR', DEFAULT_FIXTURES_DIR),
+            latency_ms=float(os.getenv('VISION_FAKE_LATENCY_MS', '1500')),
+            jitter_ms=float(os.getenv('VISION_FAKE_JITTER_MS', '300')),
+            error_rate=float(os.getenv('VISION_FAKE_ERROR_RATE', '0')),
+            rate_limit_rate=float(os.getenv('VISION_FAKE_429_RATE', '0')),
+            seed=int(os.getenv('VISION_FAKE_SEED', '42'))
+        )
+
+    @staticmethod
+    def _load_fixtures(fixtures_dir: str) -> List[Dict[str, Any]]:
+        """Charger les fixtures *.json triées par nom (ordre stable)"""
+        fixtures = []
+        if fixtures_dir and os.path.isdir(fixtures_dir):
+            for name in sorted(os.listdir(fixtures_dir)):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(fixtures_dir, name), 'r', encoding='utf-8') as f:
+                        fixtures.append(json.load(f))
+                except Exception as e:
+                    logger.warning(f"⚠️ Fixture Vision ignorée {name}: {e}")
+        return fixtures or [DEFAULT_FIXTURE]
+
+    def _pick_fixture(self, digest: str) -> Dict[str, Any]:
+        """Fixture enregistrée pour cette image, sinon choix déterministe"""
+        if digest in self.by_digest:
+            return self.by_digest[digest]
+        return self.fixtures[int(digest, 16) % len(self.fixtures)]
+
+    def create(self, model: str = None, max_tokens: int = 1024, messages: List[Dict] = None,
+               system: str = None, **kwargs) -> SimpleNamespace:
+        """Simuler messages.create: latence, erreurs éventuelles puis réponse rejouée"""
+        kind = _request_kind(messages, max_tokens)
+
+        with self._lock:
+            self.calls[kind] += 1
+            delay = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) if kind != 'ping' else 0.0
+            draw = self._rng.random()
+
+        time.sleep(delay / 1000)
+
+        if draw < self.rate_limit_rate:
+            with self._lock:
+                self.calls['rate_limited'] += 1
+            raise FakeRateLimitError()
+        if draw < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.calls['errors'] += 1
+            raise FakeAPIError('api_error: Internal server error (simulé)')
+
+        if kind == 'ping':
+            return _make_response('Bonjour', model, {'input_tokens': 8, 'output_tokens': 3})
+
+        fixture = self._pick_fixture(_image_digest(messages))
+        if kind == 'supplier':
+            return _make_response(fixture.get('supplier', 'GENERIC'), model, {'input_tokens': 1500, 'output_tokens': 4})
+
+        text = fixture.get('response_text') or json.dumps(fixture.get('response', {}), ensure_ascii=False)
+        return _make_response(text, model, fixture.get('usage', {}))
+
+
+class RecordingVisionBackend:
+    """Backend Anthropic réel qui enregistre chaque analyse comme fixture rejouable"""
+
+    def __init__(self, client: Any, fixtures_dir: str = DEFAULT_FIXTURES_DIR):
+        self._client = client
+        self.fixtures_dir = fixtures_dir
+        self._suppliers: Dict[str, str] = {}
+        os.makedirs(fixtures_dir, exist_ok=True)
+        self.messages = self
+
+    def create(self, **kwargs) -> Any:
+        """Appeler l'API réelle puis enregistrer la réponse"""
+        response = self._client.messages.create(**kwargs)
+        try:
+            messages = kwargs.get('messages')
+            kind = _request_kind(messages, kwargs.get('max_tokens', 1024))
+            digest = _image_digest(messages)
+            text = response.content[0].text
+
+            if kind == 'supplier':
+                self._suppliers[digest] = text.strip()
+            elif kind == 'analysis':
+                usage = getattr(response, 'usage', None)
+                fixture = {
+                    'image_sha1': digest,
+                    'supplier': self._suppliers.pop(digest, 'GENERIC'),
+                    'response_text': text,
+                    'usage': {
+                        'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+                        'output_tokens': getattr(usage, 'output_tokens', 0) or 0
+                    },
+                    'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+                }
+                path = os.path.join(self.fixtures_dir, f"{digest}.json")
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(fixture, f, ensure_ascii=False, indent=2)
+                logger.info(f"📼 Réponse Vision enregistrée: {path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Enregistrement fixture Vision échoué: {e}")
+        return response
+
+
+@lru_cache()
+def get_fake_backend() -> FakeVisionBackend:
+    """Backend factice partagé du processus (ClaudeVision est instancié à chaque requête)"""
+    return FakeVisionBackend.from_env()
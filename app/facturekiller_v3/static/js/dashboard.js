@@ -17,7 +17,8 @@ async function loadDashboardStats() {
     try {
         console.log('📊 Chargement statistiques dashboard...');
         
-        const response = await fetch('/api/stats/dashboard');
+        // no-cache: revalidation via ETag (304 si rien n'a changé)
+        const response = await fetch('/api/stats/dashboard', { cache: 'no-cache' });
         const result = await response.json();
         
         if (result.success) {